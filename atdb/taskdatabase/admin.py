@@ -1,7 +1,41 @@
 from django.contrib import admin
-from .models import Location, Status, DataProduct, Observation
+from django.db import transaction
+from .models import Location, Status, DataProduct, Observation, Job
+from .services import transitions, changes
 
-admin.site.register(Location)
-admin.site.register(Status)
-admin.site.register(DataProduct)
-admin.site.register(Observation)
\ No newline at end of file
+
+class TaskObjectAdmin(admin.ModelAdmin):
+    # let the transitions service do the bookkeeping of locations and statuses
+    def save_model(self, request, obj, form, change):
+        if change:
+            transitions.save_taskobject(obj)
+        else:
+            transitions.create_taskobject(obj)
+
+    def delete_model(self, request, obj):
+        transitions.delete_taskobjects(type(obj).objects.filter(id=obj.id))
+
+    def delete_queryset(self, request, queryset):
+        transitions.delete_taskobjects(queryset)
+
+
+class ChangesAdmin(admin.ModelAdmin):
+    # the ETags of the REST API depend on the change counter
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        transaction.on_commit(changes.bump)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        transaction.on_commit(changes.bump)
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        transaction.on_commit(changes.bump)
+
+
+admin.site.register(Location, ChangesAdmin)
+admin.site.register(Status, ChangesAdmin)
+admin.site.register(DataProduct, TaskObjectAdmin)
+admin.site.register(Observation, TaskObjectAdmin)
+admin.site.register(Job)
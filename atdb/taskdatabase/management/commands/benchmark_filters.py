@@ -0,0 +1,107 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from taskdatabase.models import DataProduct, Observation
+from taskdatabase.views import DataProductFilter, ObservationFilter
+from taskdatabase.services import transitions
+
+"""
+Show the query plan and the latency of the filters that the services use.
+Example: python manage.py benchmark_filters --settings=atdb.settings.dev --populate 1000000
+"""
+
+BATCH_SIZE = 10000
+BEAMS_PER_OBSERVATION = 40
+
+# the queries that the services and the index page do, per filter.
+DATAPRODUCT_QUERIES = [
+    {'taskID': '180000010'},
+    {'my_status': 'valid'},
+    {'my_status': 'valid', 'taskID': '180000010'},
+    {'filename': 'WSRTA180000010_B003.MS'},
+    {'name': 'WSRTA180000010_B003.MS'},
+    {'creationTime__gt': '2099-01-01T00:00:00'},
+    {'generatedByObservation__taskID': '180000010'},
+    {'my_location': 'datawriter'},
+    {'taskID__icontains': '0000010'},
+]
+
+OBSERVATION_QUERIES = [
+    {'taskID': '180000010'},
+    {'my_status': 'valid'},
+    {'name': 'WSRTA180000010'},
+    {'creationTime__gt': '2099-01-01T00:00:00'},
+]
+
+
+class Command(BaseCommand):
+    help = 'Show the query plan and latency of the DataProduct and Observation filters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--populate', type=int, default=0,
+                            help='First add this number of fake dataproducts (and their observations).')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of times every query is timed.')
+
+    def handle(self, *args, **options):
+        if options['populate']:
+            self.populate(options['populate'])
+
+        self.stdout.write('dataproducts: ' + str(DataProduct.objects.count()) +
+                          ', observations: ' + str(Observation.objects.count()))
+
+        for params in DATAPRODUCT_QUERIES:
+            self.benchmark(DataProductFilter, DataProduct, params, options['repeat'])
+
+        for params in OBSERVATION_QUERIES:
+            self.benchmark(ObservationFilter, Observation, params, options['repeat'])
+
+    def populate(self, count):
+        """
+        Add 'count' dataproducts, in observations of BEAMS_PER_OBSERVATION beams
+        """
+        self.stdout.write('adding ' + str(count) + ' dataproducts...')
+        statuses = ['created', 'valid', 'ingesting', 'archived']
+        first_taskID = 180000000 + Observation.objects.count()
+
+        for start in range(0, count, BATCH_SIZE):
+            rows = []
+            observations = []
+            for i in range(start, min(start + BATCH_SIZE, count)):
+                taskID = str(first_taskID + i // BEAMS_PER_OBSERVATION)
+                beam = i % BEAMS_PER_OBSERVATION
+                status = statuses[(i // BEAMS_PER_OBSERVATION) % len(statuses)]
+                if beam == 0:
+                    observations.append({'name': 'WSRTA' + taskID, 'taskID': taskID, 'task_type': 'observation',
+                                         'new_status': status, 'new_location': 'datawriter'})
+
+                filename = 'WSRTA' + taskID + '_B' + str(beam).zfill(3) + '.MS'
+                rows.append({'name': filename, 'filename': filename, 'taskID': taskID,
+                             'new_status': status, 'new_location': 'datawriter'})
+
+            transitions.bulk_create_taskobjects(Observation, observations)
+            transitions.bulk_create_taskobjects(DataProduct, rows)
+            self.stdout.write('- ' + str(min(start + BATCH_SIZE, count)))
+
+    def benchmark(self, filter_class, model, params, repeat):
+        queryset = filter_class(params, queryset=model.objects.all()).qs
+
+        timings = []
+        for i in range(repeat):
+            start = time.time()
+            results = list(queryset.values_list('id', flat=True))
+            timings.append(time.time() - start)
+
+        self.stdout.write('')
+        self.stdout.write('--- ' + model.__name__ + ' ' + str(params) + ' ---')
+        self.stdout.write(queryset.values_list('id', flat=True).explain(**self.explain_options()))
+        self.stdout.write('results: ' + str(len(results)) +
+                          ', best: %.2f ms' % (min(timings) * 1000) +
+                          ', average: %.2f ms' % (sum(timings) / len(timings) * 1000))
+
+    def explain_options(self):
+        # only postgres shows the real execution times
+        if connection.vendor == 'postgresql':
+            return {'analyze': True}
+        return {}
@@ -0,0 +1,55 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from taskdatabase.models import DataProduct, Observation
+from taskdatabase.views import DataProductFilter, ObservationFilter
+from taskdatabase.services import export
+
+"""
+Export all (filtered) observations or dataproducts as NDJSON, one json object per line.
+Example: python manage.py export_ndjson dataproducts --filter my_status=valid --output dataproducts.ndjson
+"""
+
+RESOURCES = {
+    'dataproducts': (DataProduct, DataProductFilter),
+    'observations': (Observation, ObservationFilter),
+}
+
+
+class Command(BaseCommand):
+    help = 'Export observations or dataproducts as NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('resource', choices=sorted(RESOURCES))
+        parser.add_argument('--filter', action='append', default=[], metavar='FIELD=VALUE',
+                            help='Filter like the REST API does, ex: --filter taskID=180000010. Can be repeated.')
+        parser.add_argument('--output', default=None, help='Output file, default is stdout.')
+        parser.add_argument('--chunk-size', type=int, default=export.DEFAULT_CHUNK_SIZE,
+                            help='Number of rows that is fetched from the database at once.')
+
+    def handle(self, *args, **options):
+        model, filter_class = RESOURCES[options['resource']]
+
+        params = {}
+        for filter in options['filter']:
+            if '=' not in filter:
+                raise CommandError("invalid filter '" + filter + "', expected FIELD=VALUE")
+            key, value = filter.split('=', 1)
+            params[key] = value
+
+        filterset = filter_class(params, queryset=model.objects.all())
+        if not filterset.is_valid():
+            raise CommandError(str(filterset.errors))
+
+        output = open(options['output'], 'w') if options['output'] else sys.stdout
+        try:
+            count = 0
+            for line in export.export_ndjson(filterset.qs, max(options['chunk_size'], 1)):
+                output.write(line)
+                count += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        self.stderr.write('exported ' + str(count) + ' ' + options['resource'])
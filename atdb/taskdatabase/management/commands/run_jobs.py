@@ -0,0 +1,145 @@
+import multiprocessing
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from taskdatabase.services import jobs
+
+"""
+Execute the jobs that the status transitions have added to the Job table.
+Example: python manage.py run_jobs --settings=atdb.settings.dev --processes 4
+"""
+
+
+class Command(BaseCommand):
+    help = 'Claim and execute the queued jobs in a pool of processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4, help='Number of jobs that run at the same time.')
+        parser.add_argument('--interval', type=float, default=2,
+                            help='Seconds between looking for new jobs when the queue is empty.')
+        parser.add_argument('--timeout', type=int, default=jobs.JOB_TIMEOUT,
+                            help='Seconds after which a running job has failed and is queued again.')
+        parser.add_argument('--once', default=False, action='store_true',
+                            help='Stop when there are no more queued jobs.')
+
+    def handle(self, *args, **options):
+        processes = max(options['processes'], 1)
+        worker = socket.gethostname() + ':' + str(multiprocessing.current_process().pid)
+
+        # the jobs that were running together when a process of the pool died. It is not known which one
+        # killed it, so they run again one at a time, and only the job that kills a process is charged.
+        suspects = []
+
+        # the jobs run in fresh processes that set up django themselves, and have their own database connections
+        context = multiprocessing.get_context('spawn')
+        while True:
+            pool = ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=django.setup)
+            finished = False
+            try:
+                finished = self.run_pool(pool, processes, worker, suspects, options)
+            finally:
+                if finished:
+                    pool.shutdown()
+                else:
+                    self.stop_pool(pool)
+            if finished:
+                break
+            self.stderr.write('starting a new process pool')
+
+    def stop_pool(self, pool):
+        """
+        Stop a pool that is broken or has a job that hangs. A running job can not be cancelled,
+        so the processes of the pool (the only child processes) are killed.
+        """
+        for process in multiprocessing.active_children():
+            process.kill()
+        pool.shutdown(wait=False)
+
+    def finish(self, job_id, duration, error, worker):
+        job = jobs.finish_job(job_id, duration, error, worker)
+        self.stdout.write(str(job) + ', attempt ' + str(job.attempts) + ', %.3f s' % duration)
+
+    def submit(self, pool, running, job_ids):
+        """
+        Submit jobs to the pool.
+        :return: the job ids that could not be submitted because the pool is broken
+        """
+        for index, job_id in enumerate(job_ids):
+            try:
+                running[pool.submit(jobs.run_job, job_id)] = (job_id, time.time())
+            except BrokenProcessPool:
+                return job_ids[index:]
+        return []
+
+    def run_pool(self, pool, processes, worker, suspects, options):
+        """
+        Claim and execute jobs in the pool, until the queue is empty (with --once) or the pool has to be replaced,
+        because one of its processes has died or a job has run longer than the timeout.
+        :param suspects: the jobs that were running when a previous pool broke, they run one at a time
+        :return: True when the queue is empty, False when the pool has to be replaced
+        """
+        # future => (job id, start time)
+        running = {}
+        while True:
+            if suspects:
+                if not running:
+                    job_id = suspects.pop(0)
+                    if jobs.restart_job(job_id, worker) and self.submit(pool, running, [job_id]):
+                        suspects.insert(0, job_id)
+            elif len(running) < processes:
+                # the jobs that could not be started go back to the queue
+                for job_id in self.submit(pool, running, jobs.claim_jobs(processes - len(running), worker,
+                                                                          options['timeout'])):
+                    jobs.release_job(job_id)
+
+            if not running:
+                if suspects:
+                    # the pool broke before the job started
+                    return False
+                if options['once']:
+                    return True
+                # the queue is empty, do not keep a database connection open while waiting
+                connections.close_all()
+                time.sleep(options['interval'])
+                continue
+
+            done, not_done = wait(running, timeout=options['interval'], return_when=FIRST_COMPLETED)
+            broken = []
+            for future in done:
+                job_id, started = running.pop(future)
+                try:
+                    job_id, duration, error = future.result()
+                except BrokenProcessPool:
+                    broken.append(job_id)
+                    continue
+                except Exception as exp:
+                    duration, error = time.time() - started, repr(exp)
+                self.finish(job_id, duration, error, worker)
+
+            if broken:
+                # a process of the pool has died, which breaks the whole pool and all the jobs in it
+                broken += [job_id for job_id, started in running.values()]
+                if len(broken) == 1:
+                    self.finish(broken[0], 0, 'the process of the job has died', worker)
+                else:
+                    suspects.extend(broken)
+                return False
+
+            now = time.time()
+            overdue = [future for future, (job_id, started) in running.items() if now - started > options['timeout']]
+            if overdue:
+                for future in overdue:
+                    job_id, started = running.pop(future)
+                    self.finish(job_id, now - started, 'timed out after ' + str(options['timeout']) + ' seconds',
+                                worker)
+
+                # the other jobs are stopped with the pool, they go back to the queue
+                for job_id, started in running.values():
+                    jobs.release_job(job_id)
+                return False
@@ -0,0 +1,99 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def forwards_status_history(apps, schema_editor):
+    """
+    Move the statusHistory many-to-many links to the foreign key of the Status table.
+    """
+    # postgres refuses to alter a table with pending (deferred) foreign key checks, and this migration
+    # alters the status table after this step. Check the foreign keys at once instead.
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+    Status = apps.get_model('taskdatabase', 'Status')
+    TaskObject = apps.get_model('taskdatabase', 'TaskObject')
+    StatusLink = TaskObject.statusHistory.through
+
+    links = StatusLink.objects.filter(status_id=OuterRef('id')).order_by('id')
+    Status.objects.update(taskObject_id=Subquery(links.values('taskobject_id')[:1]))
+
+    # a status that was shared by more than one object is copied for the other objects
+    first_links = {}
+    copies = []
+    for link in StatusLink.objects.order_by('id').select_related('status'):
+        if link.status_id in first_links:
+            copies.append(Status(name=link.status.name, timestamp=link.status.timestamp,
+                                 taskObject_id=link.taskobject_id))
+        first_links[link.status_id] = link.taskobject_id
+    Status.objects.bulk_create(copies)
+
+    # statuses that do not belong to any object have no meaning
+    Status.objects.filter(taskObject__isnull=True).delete()
+
+
+def backwards_status_history(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+    Status = apps.get_model('taskdatabase', 'Status')
+    TaskObject = apps.get_model('taskdatabase', 'TaskObject')
+    StatusLink = TaskObject.statusHistory.through
+
+    StatusLink.objects.bulk_create(
+        [StatusLink(taskobject_id=taskobject_id, status_id=status_id)
+         for status_id, taskobject_id in Status.objects.values_list('id', 'taskObject_id')])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskdatabase', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='status',
+            name='name',
+            field=models.CharField(default='unknown', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='taskobject',
+            name='locations',
+            field=models.ManyToManyField(blank=True, to='taskdatabase.Location'),
+        ),
+        migrations.AlterField(
+            model_name='taskobject',
+            name='my_status',
+            field=models.CharField(default='defined', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='taskobject',
+            name='new_status',
+            field=models.CharField(default='defined', max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='status',
+            name='taskObject',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='taskdatabase.TaskObject'),
+        ),
+        migrations.RunPython(forwards_status_history, backwards_status_history),
+        migrations.RemoveField(
+            model_name='taskobject',
+            name='statusHistory',
+        ),
+        migrations.AlterField(
+            model_name='status',
+            name='taskObject',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statusHistory', to='taskdatabase.TaskObject'),
+        ),
+        migrations.AddIndex(
+            model_name='status',
+            index=models.Index(fields=['taskObject', 'timestamp'], name='taskdatabas_taskObj_acc156_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='status',
+            index=models.Index(fields=['timestamp'], name='taskdatabas_timesta_e80d66_idx'),
+        ),
+    ]
@@ -0,0 +1,97 @@
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def forwards_location_history(apps, schema_editor):
+    """
+    Keep one Location per location name, and turn the 'locations' many-to-many links into location events.
+    """
+    # postgres refuses to alter a table with pending (deferred) foreign key checks, and this migration
+    # alters the taskobject and location tables after this step. Check the foreign keys at once instead.
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+    Location = apps.get_model('taskdatabase', 'Location')
+    LocationEvent = apps.get_model('taskdatabase', 'LocationEvent')
+    TaskObject = apps.get_model('taskdatabase', 'TaskObject')
+    LocationLink = TaskObject.locations.through
+
+    # the first Location with a name becomes the location for that name
+    location_ids = {}
+    names = {}
+    for id, name in Location.objects.order_by('id').values_list('id', 'location'):
+        name = name or 'unknown'
+        location_ids.setdefault(name, id)
+        names[id] = name
+
+    events = []
+    links = LocationLink.objects.order_by('location__timestamp', 'id').values_list(
+        'taskobject_id', 'location_id', 'location__timestamp')
+    for taskobject_id, location_id, timestamp in links.iterator():
+        events.append(LocationEvent(taskObject_id=taskobject_id,
+                                    location_id=location_ids[names[location_id]],
+                                    timestamp=timestamp))
+    LocationEvent.objects.bulk_create(events, batch_size=1000)
+
+    # the current location is the last one in the history
+    my_location_ids = {}
+    for event in events:
+        my_location_ids[event.taskObject_id] = event.location_id
+    taskobject_ids_per_location = {}
+    for taskobject_id, location_id in my_location_ids.items():
+        taskobject_ids_per_location.setdefault(location_id, []).append(taskobject_id)
+    for location_id, taskobject_ids in taskobject_ids_per_location.items():
+        TaskObject.objects.filter(id__in=taskobject_ids).update(my_location_id=location_id)
+
+    LocationLink.objects.all().delete()
+    Location.objects.exclude(id__in=location_ids.values()).delete()
+    for name, id in location_ids.items():
+        Location.objects.filter(id=id).update(location=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskdatabase', '0002_status_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(blank=True, default=datetime.datetime.now, verbose_name='Timestamp of creation in the database.')),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='taskdatabase.Location')),
+                ('taskObject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='locationHistory', to='taskdatabase.TaskObject')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='taskobject',
+            name='my_location',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='current_taskobjects', to='taskdatabase.Location'),
+        ),
+        migrations.RunPython(forwards_location_history, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='taskobject',
+            name='locations',
+        ),
+        migrations.RemoveField(
+            model_name='taskobject',
+            name='my_locations',
+        ),
+        migrations.AlterField(
+            model_name='location',
+            name='location',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+        migrations.AddField(
+            model_name='taskobject',
+            name='locations',
+            field=models.ManyToManyField(blank=True, through='taskdatabase.LocationEvent', to='taskdatabase.Location'),
+        ),
+        migrations.AddIndex(
+            model_name='locationevent',
+            index=models.Index(fields=['taskObject', 'timestamp'], name='taskdatabas_taskObj_12db56_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.28 on 2026-10-18 05:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskdatabase', '0003_location_history'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dataproduct',
+            name='filename',
+            field=models.CharField(db_index=True, default='unknown', max_length=200),
+        ),
+        migrations.AddIndex(
+            model_name='taskobject',
+            index=models.Index(fields=['my_status', 'taskID'], name='taskdatabas_my_stat_37cfec_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskobject',
+            index=models.Index(fields=['taskID', 'creationTime'], name='taskdatabas_taskID_1ae112_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskobject',
+            index=models.Index(fields=['creationTime'], name='taskdatabas_creatio_5d5c67_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskobject',
+            index=models.Index(fields=['name'], name='taskdatabas_name_66cc65_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 2.2.28 on 2026-10-18 05:32
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def forwards_observation_summary(apps, schema_editor):
+    """
+    Count the existing dataproducts per taskID and status.
+    """
+    DataProduct = apps.get_model('taskdatabase', 'DataProduct')
+    ObservationSummary = apps.get_model('taskdatabase', 'ObservationSummary')
+
+    counts = DataProduct.objects.order_by().values_list('taskID', 'my_status').annotate(Count('id'), Sum('size'))
+    ObservationSummary.objects.bulk_create(
+        [ObservationSummary(taskID=taskID, status=status, dps_count=dps_count, size=size or 0)
+         for taskID, status, dps_count, size in counts],
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskdatabase', '0004_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ObservationSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taskID', models.CharField(blank=True, max_length=30, null=True, verbose_name='runId')),
+                ('status', models.CharField(max_length=20)),
+                ('dps_count', models.IntegerField(default=0)),
+                ('size', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('taskID', 'status')},
+            },
+        ),
+        migrations.RunPython(forwards_observation_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 2.2.28 on 2026-10-18 05:34
+
+import datetime
+from django.db import migrations, models
+from django.db.models import F
+
+
+def forwards_modified_time(apps, schema_editor):
+    # the existing objects have not been changed since their creation, as far as we know
+    TaskObject = apps.get_model('taskdatabase', 'TaskObject')
+    TaskObject.objects.update(modifiedTime=F('creationTime'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskdatabase', '0005_observation_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskobject',
+            name='modifiedTime',
+            field=models.DateTimeField(blank=True, default=datetime.datetime.now),
+        ),
+        migrations.RunPython(forwards_modified_time, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='taskobject',
+            index=models.Index(fields=['modifiedTime'], name='taskdatabas_modifie_c697df_idx'),
+        ),
+    ]
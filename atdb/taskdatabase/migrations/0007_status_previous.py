@@ -0,0 +1,40 @@
+# Generated by Django 2.2.28 on 2026-10-18 05:37
+
+from django.db import migrations, models
+
+
+def forwards_status_previous(apps, schema_editor):
+    """
+    The previous status of every existing status is the status before it in the history of the same object.
+    """
+    Status = apps.get_model('taskdatabase', 'Status')
+
+    ids_per_previous = {}
+    last_taskObject_id = None
+    last_name = None
+    for id, taskObject_id, name in Status.objects.order_by('taskObject_id', 'timestamp', 'id').values_list(
+            'id', 'taskObject_id', 'name').iterator():
+        if taskObject_id == last_taskObject_id:
+            ids_per_previous.setdefault(last_name, []).append(id)
+        last_taskObject_id = taskObject_id
+        last_name = name
+
+    for previous, ids in ids_per_previous.items():
+        for start in range(0, len(ids), 1000):
+            Status.objects.filter(id__in=ids[start:start + 1000]).update(previous=previous)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskdatabase', '0006_modified_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='status',
+            name='previous',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.RunPython(forwards_status_previous, migrations.RunPython.noop),
+    ]
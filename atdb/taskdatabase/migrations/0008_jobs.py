@@ -0,0 +1,36 @@
+# Generated by Django 2.2.28 on 2026-10-18 05:38
+
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskdatabase', '0007_status_previous'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_type', models.CharField(max_length=50)),
+                ('status', models.CharField(choices=[('queued', 'queued'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')], default='queued', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('run_after', models.DateTimeField(blank=True, default=datetime.datetime.now)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('creationTime', models.DateTimeField(blank=True, default=datetime.datetime.now)),
+                ('startTime', models.DateTimeField(blank=True, null=True)),
+                ('endTime', models.DateTimeField(blank=True, null=True)),
+                ('duration', models.FloatField(blank=True, null=True)),
+                ('worker', models.CharField(blank=True, max_length=100, null=True)),
+                ('taskObject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='taskdatabase.TaskObject')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', 'run_after'], name='taskdatabas_status_bbc321_idx'),
+        ),
+    ]
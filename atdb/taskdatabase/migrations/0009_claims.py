@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-18 05:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskdatabase', '0008_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskobject',
+            name='claim_expires',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='taskobject',
+            name='claimed_by',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+    ]
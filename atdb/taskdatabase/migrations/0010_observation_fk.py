@@ -0,0 +1,37 @@
+# Generated by Django 2.2.28 on 2026-10-18 05:45
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def forwards_parent_observation(apps, schema_editor):
+    """
+    Copy the links between observations and dataproducts from the many-to-many table to the foreign key.
+    """
+    DataProduct = apps.get_model('taskdatabase', 'DataProduct')
+    Observation = apps.get_model('taskdatabase', 'Observation')
+
+    ObservationLink = Observation.generatedDataProducts.through
+    links = ObservationLink.objects.filter(dataproduct_id=OuterRef('pk')).order_by('observation_id')
+    DataProduct.objects.update(parent_observation_id=Subquery(links.values('observation_id')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskdatabase', '0009_claims'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataproduct',
+            name='parent_observation',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='dataproducts', to='taskdatabase.Observation'),
+        ),
+        migrations.RunPython(forwards_parent_observation, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='observation',
+            name='generatedDataProducts',
+        ),
+    ]
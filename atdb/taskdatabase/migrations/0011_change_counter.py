@@ -0,0 +1,30 @@
+# Generated by Django 2.2.28 on 2026-10-18 06:07
+
+import time
+from django.db import migrations, models
+
+
+def forwards_change_counter(apps, schema_editor):
+    """
+    Add the row of the change counter, starting at a value that no old ETag has.
+    """
+    ChangeCounter = apps.get_model('taskdatabase', 'ChangeCounter')
+    ChangeCounter.objects.create(id=1, value=int(time.time() * 1000000))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskdatabase', '0010_observation_fk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(forwards_change_counter, migrations.RunPython.noop),
+    ]
@@ -40,18 +40,47 @@ TASK_TYPE__CHOICES = (
     (TASK_TYPE_DATAPRODUCT, TASK_TYPE_DATAPRODUCT)
 )
 
+# every location name is stored only once, the moves of Observations and Dataproducts refer to it.
 class Location(models.Model):
-    location = models.CharField(max_length=255, default="unknown",blank=True, null=True)
+    location = models.CharField(max_length=255, unique=True)
     timestamp = models.DateTimeField('Timestamp of creation in the database.', default=datetime.now, blank=True)
 
     def __str__(self):
          return str(self.location)
 
 
+# the location history of Observations and Dataproducts. Rows are only added, never changed.
+class LocationEvent(models.Model):
+    taskObject = models.ForeignKey('TaskObject', related_name='locationHistory', on_delete=models.CASCADE)
+    location = models.ForeignKey(Location, on_delete=models.CASCADE)
+    timestamp = models.DateTimeField('Timestamp of creation in the database.', default=datetime.now, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['taskObject', 'timestamp']),
+        ]
+
+    def __str__(self):
+        return str(self.location_id)
+
+
+# the status history of Observations and Dataproducts. Rows are only added, never changed.
 class Status(models.Model):
 #    name = models.CharField(max_length=20, choices=STATUS_TYPE_NAME_CHOICES, default="unknown")
     name = models.CharField(max_length=20, default="unknown")
     timestamp = models.DateTimeField('Timestamp of creation in the database.', default=datetime.now, blank=True)
+    taskObject = models.ForeignKey('TaskObject', related_name='statusHistory', on_delete=models.CASCADE)
+
+    # the status before this transition, so that the history can be read as a change feed
+    previous = models.CharField(max_length=20, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # the history of one object
+            models.Index(fields=['taskObject', 'timestamp']),
+            # all transitions in a time window
+            models.Index(fields=['timestamp']),
+        ]
 
     def __str__(self):
         return str(self.name)
@@ -64,18 +93,37 @@ class TaskObject(models.Model):
     taskID = models.CharField('runId', max_length=30, blank=True, null=True)
     creationTime = models.DateTimeField(default=datetime.now, blank=True)
 
+    # set by the transitions service on every change, so that the dashboard can ask for the changes only
+    modifiedTime = models.DateTimeField(default=datetime.now, blank=True)
+
 #    new_status = models.CharField(max_length=20,choices=STATUS_TYPE_NAME_CHOICES, default="defined")
     new_status = models.CharField(max_length=20, default="defined", null=True)
 
     new_location = models.CharField(max_length=255, default="unknown",null=True)
-    # locations = models.ForeignKey(Location, null=True, blank=True, on_delete=models.CASCADE)
-    locations = models.ManyToManyField(Location, blank=True)
-    my_locations = models.CharField(max_length=1024, default="")
+    locations = models.ManyToManyField(Location, through=LocationEvent, blank=True)
+
+    # my_location is the current location, which is also in the location history.
+    my_location = models.ForeignKey(Location, related_name='current_taskobjects', null=True, blank=True, on_delete=models.SET_NULL)
 
     # my_status is 'platgeslagen', because django-filters can not filter on a related property,
     # and I need services to be able to filter on a status to execute their tasks.
     my_status = models.CharField(max_length=20,default="defined")
-    statusHistory = models.ManyToManyField(Status, related_name='status_history', blank=True)
+
+    # a worker that has claimed this object (see transitions.claim_taskobjects). When the claim expires before
+    # the status has changed again, the object is returned to its previous status for another worker.
+    claimed_by = models.CharField(max_length=100, null=True, blank=True)
+    claim_expires = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # indexes for the filters of the services. The composite indexes also serve the queries
+        # on only their first field (my_status, taskID).
+        indexes = [
+            models.Index(fields=['my_status', 'taskID']),
+            models.Index(fields=['taskID', 'creationTime']),
+            models.Index(fields=['creationTime']),
+            models.Index(fields=['name']),
+            models.Index(fields=['modifiedTime']),
+        ]
 
     def __str__(self):
         return str(self.id)
@@ -96,13 +144,18 @@ class DataProduct(TaskObject):
         (TYPE_INSPECTIONPLOT, 'inspectionPlot'),
     )
 
-    filename = models.CharField(max_length=200, default="unknown")
+    filename = models.CharField(max_length=200, default="unknown", db_index=True)
     description = models.CharField(max_length=255, default="unknown")
     dataproduct_type = models.CharField('type', choices=DATAPRODUCT_TYPE_CHOICES, default=TYPE_VISIBILITY, max_length=50)
 
     size = models.BigIntegerField(default=0)
     quality = models.CharField(max_length=30, default="unknown")
 
+    # the observation that generated this dataproduct (the one with the same taskID).
+    # It is filled in by the transitions service, also when the observation arrives after its dataproducts.
+    parent_observation = models.ForeignKey('Observation', related_name='dataproducts', null=True, blank=True,
+                                           on_delete=models.SET_NULL)
+
     def __str__(self):
         return self.filename
 
@@ -124,12 +177,81 @@ class Observation(TaskObject):
     )
 
     process_type = models.CharField(max_length=50, default="observation")
-    generatedDataProducts = models.ManyToManyField(DataProduct, related_name='generatedByObservation', blank=True)
 
     @property
     def dps_count(self):
-        len(self.generatedDataProducts)
+        # the list views annotate the count, so that it is not queried per observation
+        if hasattr(self, 'summary_dps_count'):
+            return self.summary_dps_count or 0
+
+        summary = ObservationSummary.objects.filter(taskID=self.taskID).aggregate(models.Sum('dps_count'))
+        return summary['dps_count__sum'] or 0
 
     def __str__(self):
         return str(self.taskID + ' - ' +self.name)
 
+
+# the number of dataproducts and their total size per taskID and status.
+# This is kept up to date by the transitions service, in the same transaction as the dataproducts.
+class ObservationSummary(models.Model):
+    taskID = models.CharField('runId', max_length=30, blank=True, null=True)
+    status = models.CharField(max_length=20)
+    dps_count = models.IntegerField(default=0)
+    size = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = (('taskID', 'status'),)
+
+    def __str__(self):
+        return str(self.taskID) + ' - ' + str(self.status) + ': ' + str(self.dps_count)
+
+
+# the change counter of the REST API, one row that is shared by all workers. It is increased after every
+# committed change of the Observations, DataProducts, Locations and Statuses (see services/changes.py).
+class ChangeCounter(models.Model):
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return str(self.value)
+
+
+
+# the jobs that have to be executed for a status change. They are added by the transitions service
+# in the same transaction as the status change, and executed by the 'run_jobs' worker.
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+JOB_STATUS_CHOICES = (
+    (JOB_QUEUED, JOB_QUEUED),
+    (JOB_RUNNING, JOB_RUNNING),
+    (JOB_DONE, JOB_DONE),
+    (JOB_FAILED, JOB_FAILED),
+)
+
+class Job(models.Model):
+    taskObject = models.ForeignKey(TaskObject, related_name='jobs', on_delete=models.CASCADE)
+    job_type = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=JOB_STATUS_CHOICES, default=JOB_QUEUED)
+
+    # a failed job is tried again after 'run_after', until it has failed max_attempts times
+    attempts = models.IntegerField(default=0)
+    run_after = models.DateTimeField(default=datetime.now, blank=True)
+    error = models.TextField(null=True, blank=True)
+
+    # timing
+    creationTime = models.DateTimeField(default=datetime.now, blank=True)
+    startTime = models.DateTimeField(null=True, blank=True)
+    endTime = models.DateTimeField(null=True, blank=True)
+    duration = models.FloatField(null=True, blank=True)
+    worker = models.CharField(max_length=100, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # the queue of the worker
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+    def __str__(self):
+        return str(self.job_type) + '(' + str(self.taskObject_id) + ') - ' + str(self.status)
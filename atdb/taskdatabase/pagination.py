@@ -0,0 +1,96 @@
+import base64
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+"""
+Pagination for the list views. Pagination is only done when the client asks for it (with ?page_size= or ?cursor=),
+so that clients that expect the whole list in one response keep working.
+"""
+
+DEFAULT_KEYSET_FIELD = 'creationTime'
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination, ordered by (<keyset_field>, id). The cursor holds the values of the last object
+    of a page, so the next page is an index lookup instead of an OFFSET that gets slower with every page.
+    The view can set 'keyset_field', the default is 'creationTime'.
+    """
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    default_page_size = 1000
+    max_page_size = 10000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.page_size_query_param not in params and self.cursor_query_param not in params:
+            return None
+
+        self.request = request
+        self.field = getattr(view, 'keyset_field', DEFAULT_KEYSET_FIELD)
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(self.field, 'id')
+
+        cursor = params.get(self.cursor_query_param)
+        if cursor:
+            value, id = self.decode_cursor(cursor)
+            queryset = queryset.filter(Q(**{self.field + '__gt': value}) | Q(**{self.field: value, 'id__gt': id}))
+
+        # fetch one object extra to see if there is a next page
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        self.next_cursor = None
+        if self.has_next:
+            self.next_cursor = self.encode_cursor(results[-1])
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.default_page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param, self.page_size)
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
+
+    def encode_cursor(self, object):
+        value = getattr(object, self.field)
+        cursor = value.isoformat() + '|' + str(object.id)
+        return base64.urlsafe_b64encode(cursor.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, cursor):
+        try:
+            value, id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii').split('|')
+            timestamp = parse_datetime(value)
+            if timestamp is None:
+                raise ValueError(value)
+            if timezone.is_aware(timestamp) and not settings.USE_TZ:
+                # the times in the database are in the local time zone
+                timestamp = timezone.make_naive(timestamp)
+            return timestamp, int(id)
+        except (TypeError, ValueError):
+            # a cursor that was not made by encode_cursor, or that was changed by the client
+            raise ValidationError({'error': self.invalid_cursor_message})
@@ -1,5 +1,6 @@
-from rest_framework import serializers
+from rest_framework import relations, serializers
 from .models import DataProduct, Observation, Location, Status
+from .services import transitions
 
 
 #class LocationSerializer(serializers.ModelSerializer):
@@ -8,40 +9,88 @@ from .models import DataProduct, Observation, Location, Status
 #        model = Location
 #        fields = '__all__'
 
-class LocationSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Only serialize the fields that are given in the 'fields' argument, the view passes them from ?fields=id,taskID
+    """
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+
+        if fields:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
+class LocationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Location
         fields = ('id','location','timestamp')
 
 
-class StatusSerializer(serializers.ModelSerializer):
+class StatusSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Status
-        fields = ('id','name','timestamp')
-
-
-
-class DataProductSerializer(serializers.ModelSerializer):
-    # this adds a 'parent_observation' list with hyperlinks to the DataProduct API.
-    # note that 'generatedByObservation' is not defined in the DataProduct model, but in the Observation model.
-    generatedByObservation = serializers.HyperlinkedRelatedField(
-        many=True,
-        # read_only=True,
-        queryset=Observation.objects.all(),
-        view_name='observation-detail-view',
+        fields = ('id','name','previous','timestamp')
+
+
+class TaskObjectSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Base serializer for Observations and DataProducts.
+    Creating and updating is handed over to the transitions service, which does the bookkeeping
+    of the locations and the status history.
+    """
+
+    def create(self, validated_data):
+        return transitions.create_taskobject(self.Meta.model(**validated_data))
+
+    def update(self, instance, validated_data):
+        for field_name, value in validated_data.items():
+            setattr(instance, field_name, value)
+        return transitions.save_taskobject(instance)
+
+
+class ParentObservationField(serializers.ManyRelatedField):
+    """
+    The observation of a dataproduct, as a list of (at most) one hyperlink. The dataproducts used to have
+    a many-to-many relation with their observations, the list keeps the api the same for the clients.
+    """
+    def get_attribute(self, instance):
+        # only the id is needed for the hyperlink, the observation itself is not read
+        id = instance.serializable_value(self.source)
+        return [] if id is None else [relations.PKOnlyObject(pk=id)]
+
+    def to_internal_value(self, data):
+        observations = super().to_internal_value(data)
+        if len(observations) > 1:
+            raise serializers.ValidationError('A dataproduct is generated by only one observation.')
+        return observations[0] if observations else None
+
+
+class DataProductSerializer(TaskObjectSerializer):
+    # this adds a list with the hyperlink to the observation that generated this dataproduct.
+    # note that the 'parent_observation' is filled in by the transitions service, based on the taskID.
+    generatedByObservation = ParentObservationField(
+        source='parent_observation',
         required=False,
-        lookup_field='pk'
+        child_relation=serializers.HyperlinkedRelatedField(
+            queryset=Observation.objects.all(),
+            view_name='observation-detail-view',
+            lookup_field='pk')
     )
 
     locations = serializers.HyperlinkedRelatedField(
         label='Locations',
         many=True,
-        queryset = Location.objects.all(),
+        read_only=True,
         view_name='location-detail-view',
-        lookup_field='pk',
-        required=False)
+        lookup_field='pk')
+
+    my_location = serializers.SlugRelatedField(
+        slug_field='location',
+        read_only=True)
 
 #    locations = LocationSerializer(
 #         many=True,
@@ -64,34 +113,40 @@ class DataProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = DataProduct
         fields = ('id','task_type','name','filename','description','dataproduct_type',
-                  'taskID','creationTime','size','quality',
-                  'locations','my_locations','my_status','new_status','statusHistory','generatedByObservation',
+                  'taskID','creationTime','modifiedTime','size','quality',
+                  'locations','my_location','my_status','new_status','statusHistory','generatedByObservation',
                   'new_location')
+        read_only_fields = ('modifiedTime',)
 
 
-class ObservationSerializer(serializers.ModelSerializer):
+class ObservationSerializer(TaskObjectSerializer):
     generatedDataProducts = serializers.HyperlinkedRelatedField(
+        source='dataproducts',
         label='DataProducts',
         many=True,
-        queryset = DataProduct.objects.all(),
+        read_only=True,
         view_name='dataproduct-detail-view',
-        lookup_field='pk',
-        required=False)
+        lookup_field='pk')
 
     locations = serializers.HyperlinkedRelatedField(
         label='Locations',
         many=True,
-        queryset = Location.objects.all(),
+        read_only=True,
         view_name='location-detail-view',
-        lookup_field='pk',
-        required=False)
+        lookup_field='pk')
+
+    my_location = serializers.SlugRelatedField(
+        slug_field='location',
+        read_only=True)
 
     statusHistory = StatusSerializer(
          many=True,
-         required=False)
+         required=False,
+         read_only=True)
 
     class Meta:
         model = Observation
-        fields = ('id','task_type', 'name', 'process_type','taskID','creationTime',
-                  'new_location','locations','my_locations','my_status','new_status','statusHistory',
-                  'generatedDataProducts','dps_count')
\ No newline at end of file
+        fields = ('id','task_type', 'name', 'process_type','taskID','creationTime','modifiedTime',
+                  'new_location','locations','my_location','my_status','new_status','statusHistory',
+                  'generatedDataProducts','dps_count')
+        read_only_fields = ('modifiedTime',)
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""
+changes keeps a change counter for the Observations, DataProducts and their statuses and locations.
+The transitions service bumps the counter after every committed change. The list and detail views use it
+as ETag, so that a client that polls an unchanged list gets a '304 Not Modified' after reading only the counter.
+The counter is a row in the database (ChangeCounter), so that all workers see the same counter.
+Note that a GET in between the commit of a change and its bump can still get a '304' for the previous result,
+the next GET after the bump gets the new result.
+
+changes also reads the change feed: the status history after a cursor (the id of the last status that was read).
+"""
+
+import time
+from datetime import datetime, timedelta
+
+from django.db.models import F
+from taskdatabase.models import ChangeCounter, Status
+
+COUNTER_ID = 1
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+
+# a long poll holds a (sync) gunicorn worker, it has to return well within the worker timeout (30 seconds by default)
+MAX_TIMEOUT = 20
+POLL_INTERVAL = 0.2
+
+# look in the database at least this often, also when a change was made without bumping the change counter
+LOOK_INTERVAL = 2
+
+# a gap in the status ids can be a transaction that is not committed yet, or one that was rolled back.
+# Events after a gap are only returned when the gap is older than this.
+# Known gap: the events of a transaction that commits more than GAP_TIMEOUT after it took its status ids
+# are behind the cursor by then, and are never returned. The feed is not exactly-once, a follower that must
+# not miss a transition should also check the status of the objects now and then (like the services do).
+GAP_TIMEOUT = timedelta(seconds=10)
+
+FEED_FIELDS = ('id', 'taskObject_id', 'taskObject__taskID', 'taskObject__task_type', 'previous', 'name',
+               'taskObject__my_location__location', 'timestamp')
+
+
+def start_value():
+    # when the counter row is lost it starts at a new value, so that old ETags never match
+    return int(time.time() * 1000000)
+
+
+def get_counter():
+    """
+    Get the current value of the change counter.
+    """
+    counter = ChangeCounter.objects.filter(id=COUNTER_ID).values_list('value', flat=True).first()
+    if counter is None:
+        counter = ChangeCounter.objects.get_or_create(id=COUNTER_ID, defaults={'value': start_value()})[0].value
+    return counter
+
+
+def bump():
+    """
+    Increase the change counter. Called after a transaction that changed the database.
+    """
+    if not ChangeCounter.objects.filter(id=COUNTER_ID).update(value=F('value') + 1):
+        ChangeCounter.objects.get_or_create(id=COUNTER_ID, defaults={'value': start_value()})
+
+
+def get_last_cursor():
+    """
+    The cursor of the last status change, to follow only the changes from now on.
+    """
+    last = Status.objects.order_by('-id').values_list('id', flat=True).first()
+    return last or 0
+
+
+def get_settled_cursor(cursor, limit):
+    """
+    Find the last status id after the cursor, up to which no transaction can still be committing.
+    :param (in) cursor: the id of the last status that was read
+    :param (in) limit: the maximum number of statuses
+    """
+    young = datetime.now() - GAP_TIMEOUT
+    settled = cursor
+    for id, timestamp in Status.objects.filter(id__gt=cursor).order_by('id').values_list('id', 'timestamp')[:limit]:
+        if id != settled + 1 and timestamp > young:
+            break
+        settled = id
+    return settled
+
+
+def get_changes(cursor, limit=DEFAULT_LIMIT, timeout=0, status=None, task_type=None, taskID=None):
+    """
+    Get the status changes after a cursor, waiting for new changes for at most 'timeout' seconds.
+    :param (in) cursor: the id of the last status that was read
+    :param (in) limit: the maximum number of changes
+    :param (in) timeout: the number of seconds to wait when there are no changes (long polling)
+    :param (in) status: (optional) only the changes to this status
+    :param (in) task_type: (optional) only the changes of 'observation' or 'dataproduct'
+    :param (in) taskID: (optional) only the changes of the objects with this taskID
+    :return: the new cursor, and the list of changes
+    """
+    # also a negative or nan timeout does not wait
+    timeout = min(timeout, MAX_TIMEOUT) if timeout > 0 else 0
+    deadline = time.time() + timeout
+    counter = None
+    last_look = 0
+
+    while True:
+        # only look in the database when something has changed since the previous look
+        new_counter = get_counter()
+        if new_counter != counter or time.time() - last_look > LOOK_INTERVAL:
+            counter = new_counter
+            last_look = time.time()
+
+            settled = get_settled_cursor(cursor, limit)
+            if settled > cursor:
+                events = Status.objects.filter(id__gt=cursor, id__lte=settled)
+                if status:
+                    events = events.filter(name=status)
+                if task_type:
+                    events = events.filter(taskObject__task_type=task_type)
+                if taskID:
+                    events = events.filter(taskObject__taskID=taskID)
+
+                results = [dict(zip(('id', 'taskObject', 'taskID', 'task_type', 'previous', 'status',
+                                     'location', 'timestamp'), event))
+                           for event in events.order_by('id').values_list(*FEED_FIELDS)]
+
+                # events that are filtered out are skipped by the new cursor
+                if results or time.time() >= deadline:
+                    return settled, results
+                cursor = settled
+
+        if time.time() >= deadline:
+            return cursor, []
+        time.sleep(POLL_INTERVAL)
@@ -0,0 +1,60 @@
+"""
+dashboard reads the rows for the index page. The rows are cached, and the cache is cleared by the
+transitions service when an Observation or DataProduct has changed, so that the operators that keep the
+page open do not query the database on every refresh.
+Note that the cache should be shared by all workers (memcached or redis in the CACHES setting),
+otherwise a worker only sees the changes that it has made itself until DASHBOARD_TIMEOUT.
+"""
+
+from datetime import datetime, timedelta
+
+from django.core.cache import cache
+from taskdatabase.models import Observation, DataProduct
+
+DASHBOARD_CACHE_KEY = 'taskdatabase.dashboard'
+DASHBOARD_TIMEOUT = 60
+DASHBOARD_ROWS = 50
+
+# the changes are asked with some overlap, to not miss a change that was committed during the previous poll
+DELTA_OVERLAP = timedelta(seconds=2)
+
+OBSERVATION_FIELDS = ('id', 'taskID', 'process_type', 'name', 'creationTime', 'my_status')
+DATAPRODUCT_FIELDS = ('id', 'taskID', 'name', 'creationTime', 'my_status')
+
+
+def get_dashboard():
+    """
+    Get the latest Observations and DataProducts for the index page, from the cache when possible.
+    """
+    dashboard = cache.get(DASHBOARD_CACHE_KEY)
+    if dashboard is None:
+        dashboard = {
+            'since': datetime.now() - DELTA_OVERLAP,
+            'latest_observations_list': list(
+                Observation.objects.order_by('-creationTime').values(*OBSERVATION_FIELDS)[:DASHBOARD_ROWS]),
+            'latest_dataproducts_list': list(
+                DataProduct.objects.order_by('-creationTime').values(*DATAPRODUCT_FIELDS)[:DASHBOARD_ROWS]),
+        }
+        cache.set(DASHBOARD_CACHE_KEY, dashboard, DASHBOARD_TIMEOUT)
+    return dashboard
+
+
+def invalidate():
+    """
+    Clear the cached dashboard. Called after a transaction that changed Observations or DataProducts.
+    """
+    cache.delete(DASHBOARD_CACHE_KEY)
+
+
+def get_delta(since):
+    """
+    Get the Observations and DataProducts that have changed since a given time.
+    :param (in) since: datetime of the previous poll
+    """
+    return {
+        'since': datetime.now() - DELTA_OVERLAP,
+        'observations': list(Observation.objects.filter(modifiedTime__gt=since)
+                             .order_by('-modifiedTime').values(*OBSERVATION_FIELDS)[:DASHBOARD_ROWS]),
+        'dataproducts': list(DataProduct.objects.filter(modifiedTime__gt=since)
+                             .order_by('-modifiedTime').values(*DATAPRODUCT_FIELDS)[:DASHBOARD_ROWS]),
+    }
@@ -0,0 +1,43 @@
+"""
+export writes Observations and DataProducts as NDJSON (one json object per line).
+The rows are read from the database in chunks and encoded one by one, so that the memory use
+stays the same for any size of the table. Used by the export views and the 'export_ndjson' command.
+"""
+
+from django.core.serializers.json import DjangoJSONEncoder
+from taskdatabase.models import Observation, DataProduct
+
+DEFAULT_CHUNK_SIZE = 2000
+
+# the exported columns per model. 'my_location' is exported as the name of the location.
+EXPORT_FIELDS = {
+    DataProduct: ('id', 'task_type', 'name', 'filename', 'description', 'dataproduct_type',
+                  'taskID', 'creationTime', 'size', 'quality', 'my_status', 'new_status', 'new_location'),
+    Observation: ('id', 'task_type', 'name', 'process_type', 'taskID', 'creationTime',
+                  'my_status', 'new_status', 'new_location'),
+}
+
+encoder = DjangoJSONEncoder(separators=(',', ':'))
+
+
+def export_rows(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Read the rows of a queryset of Observations or DataProducts as dicts, without instantiating models.
+    :param (in) queryset: (filtered) queryset of Observations or DataProducts
+    :param (in) chunk_size: number of rows that is fetched from the database at once
+    """
+    fields = EXPORT_FIELDS[queryset.model]
+    rows = queryset.order_by('id').values(*fields, 'my_location__location')
+    for row in rows.iterator(chunk_size=chunk_size):
+        row['my_location'] = row.pop('my_location__location')
+        yield row
+
+
+def export_ndjson(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Generator of NDJSON lines for a queryset of Observations or DataProducts.
+    :param (in) queryset: (filtered) queryset of Observations or DataProducts
+    :param (in) chunk_size: number of rows that is fetched from the database at once
+    """
+    for row in export_rows(queryset, chunk_size):
+        yield encoder.encode(row) + '\n'
@@ -1,23 +1,174 @@
 """
 Jobs contains the business logic for the different system jobs that have to be executed based on status changes
 for Observations or DataProducts in ATDB.
+The transitions service adds the jobs to the Job table, in the same transaction as the status change.
+The jobs are executed outside of the http requests, by the 'run_jobs' worker (see management/commands).
 """
 
 import logging;
+import socket
+import time
+from datetime import datetime, timedelta
+
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from taskdatabase.models import TaskObject, Observation, DataProduct, Job, JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED
 
 logger = logging.getLogger(__name__)
 
+MAX_ATTEMPTS = 5
+
+# the first retry is after BACKOFF seconds, every next retry waits twice as long
+BACKOFF = 60
+
+# a job that is still running after this many seconds has failed, its worker has probably died
+JOB_TIMEOUT = 3600
+
+# the job that has to be executed when an object gets a status
+JOBS_PER_STATUS = {
+    'valid': 'auto_ingest',
+}
+
+
 def dispatchJob(myTaskObject, new_status):
     """
-    Adds a job to the jobs table (or executes it directly)
+    Adds a job to the jobs table, when there is a job for the new status
     :param (in) myObject: Observation or Dataproduct that triggers the action
     :param (in) status: The status that triggers the action
     """
     logger.info("*** dispatchJob(" + str(myTaskObject) + "," + str(new_status) + ") ***")
+    add_jobs([myTaskObject.id], new_status)
 
-    if new_status == 'valid':
-        # execute the AutoIngest
-        doAutoIngest(myTaskObject)
+
+def add_jobs(ids, new_status):
+    """
+    Add the jobs for a status change of a list of objects, in the transaction of the status change.
+    :param (in) ids: list of id's of Observations or DataProducts that have changed status
+    :param (in) new_status: The new status
+    """
+    job_type = JOBS_PER_STATUS.get(new_status)
+    if job_type is None:
+        return
+
+    Job.objects.bulk_create([Job(taskObject_id=id, job_type=job_type) for id in ids])
+
+
+def release_stale_jobs(timeout=JOB_TIMEOUT):
+    """
+    Fail the jobs that were started more than 'timeout' seconds ago and are still running.
+    They are queued again with a backoff like any other failed job, until they have failed MAX_ATTEMPTS times.
+    :param (in) timeout: the number of seconds that a job may run
+    """
+    started_before = datetime.now() - timedelta(seconds=timeout)
+    stale = Job.objects.filter(status=JOB_RUNNING, startTime__lt=started_before).values_list('id', flat=True)
+    for job_id in stale:
+        finish_job(job_id, timeout, "timed out after " + str(timeout) + " seconds")
+
+
+def release_job(job_id):
+    """
+    Put a claimed job back in the queue without counting the attempt, when it could not be started.
+    :param (in) job_id: the id of the job
+    """
+    Job.objects.filter(id=job_id, status=JOB_RUNNING).update(status=JOB_QUEUED, startTime=None, worker=None,
+                                                            attempts=F('attempts') - 1)
+
+
+def restart_job(job_id, worker):
+    """
+    Start a claimed job again without counting an attempt, after its run was interrupted by another job.
+    :param (in) job_id: the id of the job
+    :param (in) worker: the worker that has claimed the job
+    :return: True when the job is still claimed by the worker, False when it has timed out in the meantime
+    """
+    return Job.objects.filter(id=job_id, status=JOB_RUNNING, worker=worker).update(startTime=datetime.now()) > 0
+
+
+def claim_jobs(count, worker=None, timeout=JOB_TIMEOUT):
+    """
+    Claim the next queued jobs. The rows are locked with SELECT ... FOR UPDATE SKIP LOCKED,
+    so that workers that claim at the same time get different jobs.
+    The jobs that have been running for more than 'timeout' seconds are queued again first.
+    :param (in) count: the maximum number of jobs to claim
+    :param (in) worker: the name of the worker, default is the hostname
+    :param (in) timeout: the number of seconds that a job may run
+    :return: list of the id's of the claimed jobs
+    """
+    worker = worker or socket.gethostname()
+    release_stale_jobs(timeout)
+    now = datetime.now()
+
+    with transaction.atomic():
+        queued = Job.objects.filter(status=JOB_QUEUED, run_after__lte=now).order_by('run_after', 'id')
+        ids = list(queued.select_for_update(skip_locked=True).values_list('id', flat=True)[:count])
+        if ids:
+            Job.objects.filter(id__in=ids).update(status=JOB_RUNNING, startTime=now, endTime=None,
+                                                  attempts=F('attempts') + 1, worker=worker)
+    return ids
+
+
+def run_job(job_id):
+    """
+    Execute a claimed job. This runs in a process of the worker pool, the result is recorded by finish_job.
+    :param (in) job_id: the id of the job
+    :return: (job_id, duration in seconds, error message or None)
+    """
+    # the worker processes live long, like the workers of a webserver
+    close_old_connections()
+
+    start = time.time()
+    try:
+        job = Job.objects.get(id=job_id)
+        JOB_FUNCTIONS[job.job_type](get_taskobject(job.taskObject_id))
+        error = None
+    except Exception as exp:
+        logger.exception("job " + str(job_id) + " failed")
+        error = repr(exp)
+    return job_id, time.time() - start, error
+
+
+def finish_job(job_id, duration, error=None, worker=None):
+    """
+    Record the result and the timing of a job. A failed job is queued again with an exponential backoff,
+    until it has failed MAX_ATTEMPTS times.
+    :param (in) job_id: the id of the job
+    :param (in) duration: the time that the job took, in seconds
+    :param (in) error: the error message if the job failed
+    :param (in) worker: (optional) the worker that ran the job. Its result is ignored when the job
+                        has timed out in the meantime.
+    """
+    now = datetime.now()
+    with transaction.atomic():
+        job = Job.objects.select_for_update().get(id=job_id)
+        if job.status != JOB_RUNNING or (worker is not None and job.worker != worker):
+            logger.info("job " + str(job) + " has timed out, ignoring the result of " + str(worker))
+            return job
+
+        job.endTime = now
+        job.duration = duration
+        job.error = error
+
+        if error is None:
+            job.status = JOB_DONE
+        elif job.attempts < MAX_ATTEMPTS:
+            job.status = JOB_QUEUED
+            job.run_after = now + timedelta(seconds=BACKOFF * 2 ** (job.attempts - 1))
+        else:
+            job.status = JOB_FAILED
+        job.save()
+
+    logger.info("job " + str(job) + " in %.3f s" % duration)
+    return job
+
+
+def get_taskobject(id):
+    """
+    Get the Observation or DataProduct of a job.
+    """
+    task_type = TaskObject.objects.values_list('task_type', flat=True).get(id=id)
+    if task_type == 'observation':
+        return Observation.objects.get(id=id)
+    return DataProduct.objects.get(id=id)
 
 
 def doAutoIngest(myTaskObject):
@@ -26,4 +177,10 @@ def doAutoIngest(myTaskObject):
 
 
 def doCopy(myTaskObject):
-    logger.info("STUB - doCopy(" + str(myTaskObject) + ")")
\ No newline at end of file
+    logger.info("STUB - doCopy(" + str(myTaskObject) + ")")
+
+
+JOB_FUNCTIONS = {
+    'auto_ingest': doAutoIngest,
+    'copy': doCopy,
+}
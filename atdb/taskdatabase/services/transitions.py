@@ -0,0 +1,511 @@
+"""
+transitions contains the bookkeeping of locations and statuses for Observations and DataProducts.
+It is called explicitly by the views, serializers and admin whenever an Observation or DataProduct is
+created or changed. Every object is written once per request, inside a single transaction.
+"""
+
+import logging;
+import time
+from datetime import datetime, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from taskdatabase.models import TaskObject, Observation, DataProduct, Location, LocationEvent, Status, ObservationSummary
+from . import jobs, dashboard, changes
+
+logger = logging.getLogger(__name__)
+
+# the default number of seconds that a worker has to finish a claimed object
+DEFAULT_LEASE = 3600
+
+# the maximum number of objects per claim
+MAX_CLAIM_COUNT = 1000
+
+# the number of objects that are deleted at a time
+DELETE_CHUNK_SIZE = 500
+
+# the location ids per name, cached per process. A change of a location in this process clears the cache
+# (see signals.py), a change in another process is seen after at most LOCATION_CACHE_TTL seconds.
+LOCATION_CACHE_TTL = 60
+location_ids = {}
+location_ids_expire = 0
+
+def can_return_ids_from_bulk_insert():
+    """
+    Check if the database backend fills in the primary keys of bulk inserted objects (postgres does, sqlite doesn't)
+    """
+    features = connection.features
+    return getattr(features, 'can_return_ids_from_bulk_insert',
+                   getattr(features, 'can_return_rows_from_bulk_insert', False))
+
+
+def bulk_insert(model, objects):
+    """
+    Insert a list of objects with the least possible number of queries and fill in their id's.
+    :param (in) model: The model class of the objects (should not be a multi-table inherited model)
+    :param (in) objects: list of unsaved objects
+    """
+    if can_return_ids_from_bulk_insert():
+        model.objects.bulk_create(objects)
+    else:
+        # fallback for databases that do not return the id's of a bulk insert
+        for instance in objects:
+            instance.save()
+    return objects
+
+
+def bulk_insert_taskobjects(model, taskObjects):
+    """
+    Insert a list of new Observations or DataProducts.
+    Django refuses to bulk_create multi-table inherited models, so the TaskObject (parent) rows
+    are inserted with bulk_insert, and the Observation/DataProduct (child) rows with plain INSERT statements.
+    :param (in) model: Observation or DataProduct
+    :param (in) taskObjects: list of unsaved Observation or DataProduct objects
+    """
+    parent_fields = TaskObject._meta.concrete_fields
+    parents = [TaskObject(**{field.attname: getattr(taskObject, field.attname) for field in parent_fields})
+               for taskObject in taskObjects]
+    bulk_insert(TaskObject, parents)
+
+    for taskObject, parent in zip(taskObjects, parents):
+        taskObject.id = parent.id
+        taskObject.taskobject_ptr_id = parent.id
+
+    # the child rows with multi-row INSERT statements, in batches that fit in the query parameters of the database
+    fields = model._meta.local_concrete_fields
+    quote_name = connection.ops.quote_name
+    columns = ', '.join([quote_name(field.column) for field in fields])
+    placeholders = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    batch_size = max(connection.ops.bulk_batch_size(fields, taskObjects), 1)
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(taskObjects), batch_size):
+            batch = taskObjects[start:start + batch_size]
+            params = [field.get_db_prep_save(field.pre_save(taskObject, True), connection)
+                      for taskObject in batch for field in fields]
+            cursor.execute('INSERT INTO ' + quote_name(model._meta.db_table) + ' (' + columns + ') VALUES ' +
+                           ', '.join([placeholders] * len(batch)), params)
+    return taskObjects
+
+
+def clear_location_ids():
+    """
+    Forget the cached location ids, after a location has been renamed or deleted.
+    """
+    location_ids.clear()
+
+
+def get_location_ids(names):
+    """
+    Get the ids of a set of location names, and add the locations that are not known yet.
+    The names that are not in the cache are looked up in one query.
+    :param (in) names: names of the locations
+    :return: dict of name => location id
+    """
+    global location_ids_expire
+    if time.time() >= location_ids_expire:
+        clear_location_ids()
+        location_ids_expire = time.time() + LOCATION_CACHE_TTL
+
+    ids = {}
+    for name in names:
+        # get() because another thread can clear the cache in between
+        id = location_ids.get(name)
+        if id is not None:
+            ids[name] = id
+    missing = [name for name in names if name not in ids]
+    if missing:
+        found = dict(Location.objects.filter(location__in=missing).values_list('location', 'id'))
+        for name in missing:
+            if name not in found:
+                location, created = Location.objects.get_or_create(location=name)
+                found[name] = location.id
+        ids.update(found)
+
+        # a location that is added in a transaction that is rolled back does not exist
+        transaction.on_commit(lambda: location_ids.update(found))
+    return ids
+
+
+def move_to_new_location(taskObjects):
+    """
+    Set the current location of every object to its 'new_location' (before the objects are saved).
+    :param (in) taskObjects: list of Observations or DataProducts
+    :return: the objects that have moved to a new location
+    """
+    names = set([taskObject.new_location for taskObject in taskObjects if taskObject.new_location is not None])
+    if not names:
+        return []
+    ids = get_location_ids(names)
+
+    moved = []
+    for taskObject in taskObjects:
+        if taskObject.new_location is None:
+            continue
+
+        location_id = ids[taskObject.new_location]
+        if location_id != taskObject.my_location_id:
+            taskObject.my_location_id = location_id
+            moved.append(taskObject)
+    return moved
+
+
+def add_location_history(taskObjects):
+    """
+    Add the current location of every object to its location history.
+    :param (in) taskObjects: list of saved Observations or DataProducts
+    """
+    LocationEvent.objects.bulk_create(
+        [LocationEvent(taskObject_id=taskObject.id, location_id=taskObject.my_location_id)
+         for taskObject in taskObjects])
+
+
+def add_status_history(ids, new_status, previous_statuses=None):
+    """
+    Add a new status to the status history of a list of objects.
+    :param (in) ids: list of id's of saved Observations or DataProducts
+    :param (in) new_status: The status to add to the history
+    :param (in) previous_statuses: dict of id => the status before the transition (none for new objects)
+    """
+    previous_statuses = previous_statuses or {}
+    Status.objects.bulk_create([Status(taskObject_id=id, name=new_status, previous=previous_statuses.get(id))
+                                for id in ids])
+
+
+def link_observations(model, taskObjects):
+    """
+    Link new dataproducts to the observation with the same taskID, before they are saved.
+    New observations are linked to the dataproducts of their taskID that arrived before them.
+    :param (in) model: Observation or DataProduct
+    :param (in) taskObjects: list of new Observations or DataProducts
+    """
+    taskIDs = set(taskObject.taskID for taskObject in taskObjects)
+    if model == Observation:
+        # this has to be done after the observations are saved
+        for observation in taskObjects:
+            DataProduct.objects.filter(taskID=observation.taskID, parent_observation__isnull=True)\
+                .update(parent_observation_id=observation.id)
+        return
+
+    observation_ids = dict(Observation.objects.filter(taskID__in=taskIDs).values_list('taskID', 'id'))
+    for dataproduct in taskObjects:
+        if dataproduct.parent_observation_id is None:
+            dataproduct.parent_observation_id = observation_ids.get(dataproduct.taskID)
+
+
+def summarize(queryset):
+    """
+    Count the dataproducts of a queryset per taskID and status.
+    :param (in) queryset: DataProducts
+    :return: list of (taskID, status, count, size)
+    """
+    return list(queryset.order_by().values_list('taskID', 'my_status').annotate(Count('id'), Sum('size')))
+
+
+def count_dataproducts(changes, rows, sign=1):
+    """
+    Add (sign=1) or subtract (sign=-1) dataproducts to the changes of the observation summary.
+    :param (in) changes: dict of (taskID, status) => [count, size]
+    :param (in) rows: list of (taskID, status, count, size)
+    :param (in) sign: 1 for added dataproducts, -1 for removed dataproducts
+    """
+    for taskID, status, count, size in rows:
+        change = changes.setdefault((taskID, status), [0, 0])
+        change[0] += sign * count
+        change[1] += sign * (size or 0)
+    return changes
+
+
+def update_summary(changes):
+    """
+    Apply the changes to the ObservationSummary table, with one UPDATE per taskID and status.
+    :param (in) changes: dict of (taskID, status) => [count, size]
+    """
+    for (taskID, status), (count, size) in changes.items():
+        if count == 0 and size == 0:
+            continue
+
+        summaries = ObservationSummary.objects.filter(taskID=taskID, status=status)
+        delta = {'dps_count': F('dps_count') + count, 'size': F('size') + size}
+        if not summaries.update(**delta):
+            ObservationSummary.objects.get_or_create(taskID=taskID, status=status)
+            summaries.update(**delta)
+
+
+def invalidate_caches():
+    """
+    Clear the cached dashboard and bump the change counter after the transaction is committed.
+    """
+    transaction.on_commit(dashboard.invalidate)
+    transaction.on_commit(changes.bump)
+
+
+def create_taskobject(taskObject):
+    """
+    Create a new Observation or DataProduct and write its initial status and location.
+    :param (in) taskObject: unsaved Observation or DataProduct
+    :return: the saved object
+    """
+    logger.info("create_taskobject(" + str(taskObject.task_type) + ")")
+
+    with transaction.atomic(savepoint=False):
+        taskObject.my_status = taskObject.new_status
+        moved = move_to_new_location([taskObject])
+        if isinstance(taskObject, DataProduct):
+            link_observations(DataProduct, [taskObject])
+        taskObject.save()
+
+        add_location_history(moved)
+        add_status_history([taskObject.id], taskObject.new_status)
+        if isinstance(taskObject, Observation):
+            link_observations(Observation, [taskObject])
+
+        if isinstance(taskObject, DataProduct):
+            update_summary(count_dataproducts({}, [(taskObject.taskID, taskObject.my_status, 1, taskObject.size)]))
+
+        invalidate_caches()
+
+    return taskObject
+
+
+def save_taskobject(taskObject):
+    """
+    Save a changed Observation or DataProduct. Handles the 'new_location' and 'new_status' fields
+    and adds a job if the status has changed.
+    :param (in) taskObject: Observation or DataProduct with changed fields
+    :return: the saved object
+    """
+    logger.info("save_taskobject(" + str(taskObject) + ")")
+
+    with transaction.atomic(savepoint=False):
+        # lock the row and read the status as it is now, a concurrent save of the same object can have changed it
+        # since this object was read. The summary also needs the old taskID and size of a dataproduct.
+        changes = {}
+        if isinstance(taskObject, DataProduct):
+            old = DataProduct.objects.select_for_update().filter(id=taskObject.id)
+            old_rows = [(taskID, status, 1, size) for taskID, status, size in
+                        old.values_list('taskID', 'my_status', 'size')]
+            count_dataproducts(changes, old_rows, -1)
+            old_statuses = [status for taskID, status, count, size in old_rows]
+        else:
+            old = type(taskObject).objects.select_for_update().filter(id=taskObject.id)
+            old_statuses = list(old.values_list('my_status', flat=True))
+        if old_statuses:
+            taskObject.my_status = old_statuses[0]
+
+        # handle location change
+        moved = move_to_new_location([taskObject])
+        if moved:
+            logger.info("adding New Location = " + str(taskObject.new_location))
+            add_location_history(moved)
+
+        # handle status change
+        new_status = taskObject.new_status
+        status_changed = (new_status != None) and (taskObject.my_status != new_status)
+        if status_changed:
+            add_status_history([taskObject.id], new_status, {taskObject.id: taskObject.my_status})
+            taskObject.my_status = new_status
+
+            # a claim only holds for the status that was claimed
+            taskObject.claimed_by = None
+            taskObject.claim_expires = None
+
+        taskObject.modifiedTime = datetime.now()
+        taskObject.save()
+
+        if isinstance(taskObject, DataProduct):
+            count_dataproducts(changes, [(taskObject.taskID, taskObject.my_status, 1, taskObject.size)])
+            update_summary(changes)
+
+        if status_changed:
+            jobs.add_jobs([taskObject.id], new_status)
+
+        invalidate_caches()
+
+    return taskObject
+
+
+def bulk_create_taskobjects(model, rows):
+    """
+    Create a list of new Observations or DataProducts in one transaction.
+    This does the same bookkeeping as create_taskobject, but set-wise instead of per object.
+    :param (in) model: Observation or DataProduct
+    :param (in) rows: list of dicts with the (validated) fields of the new objects
+    :return: list of the id's of the created objects
+    """
+    logger.info("bulk_create_taskobjects(" + model.__name__ + ", " + str(len(rows)) + " rows)")
+
+    with transaction.atomic(savepoint=False):
+        taskObjects = []
+        for row in rows:
+            taskObject = model(**row)
+            taskObject.my_status = taskObject.new_status
+            taskObjects.append(taskObject)
+
+        moved = move_to_new_location(taskObjects)
+        if model == DataProduct:
+            link_observations(model, taskObjects)
+        bulk_insert_taskobjects(model, taskObjects)
+
+        add_location_history(moved)
+
+        # the initial status history, grouped by status
+        ids_per_status = {}
+        for taskObject in taskObjects:
+            ids_per_status.setdefault(taskObject.new_status, []).append(taskObject.id)
+        for new_status, ids in ids_per_status.items():
+            add_status_history(ids, new_status)
+
+        if model == Observation:
+            link_observations(model, taskObjects)
+
+        if model == DataProduct:
+            update_summary(count_dataproducts({}, [(taskObject.taskID, taskObject.my_status, 1, taskObject.size)
+                                                   for taskObject in taskObjects]))
+
+        invalidate_caches()
+
+    return [taskObject.id for taskObject in taskObjects]
+
+
+def bulk_set_status(queryset, new_status):
+    """
+    Move all objects of a queryset to a new status, with one UPDATE and one insert of the status history.
+    Objects that already have the new status are left alone.
+    The jobs for the status change are added in the same transaction.
+    :param (in) queryset: Observations or DataProducts that have to change status
+    :param (in) new_status: The new status
+    :return: list of the id's of the objects that have changed status
+    """
+    logger.info("bulk_set_status(" + queryset.model.__name__ + ", " + str(new_status) + ")")
+
+    with transaction.atomic(savepoint=False):
+        previous_statuses = dict(queryset.exclude(my_status=new_status).select_for_update().values_list('id', 'my_status'))
+        ids = list(previous_statuses)
+
+        if len(ids) > 0:
+            changes = {}
+            if queryset.model == DataProduct:
+                rows = summarize(DataProduct.objects.filter(id__in=ids))
+                count_dataproducts(changes, rows, -1)
+                count_dataproducts(changes, [(taskID, new_status, count, size) for taskID, status, count, size in rows])
+
+            TaskObject.objects.filter(id__in=ids).update(my_status=new_status, new_status=new_status,
+                                                         modifiedTime=datetime.now(),
+                                                         claimed_by=None, claim_expires=None)
+            add_status_history(ids, new_status, previous_statuses)
+            update_summary(changes)
+            jobs.add_jobs(ids, new_status)
+            invalidate_caches()
+
+    return ids
+
+
+def release_expired_claims(model, from_status, to_status):
+    """
+    Return the objects of which the claim has expired (probably because the worker has crashed)
+    from the claimed status to the status that they were claimed from.
+    :param (in) model: Observation or DataProduct
+    :param (in) from_status: The status that the objects were claimed from
+    :param (in) to_status: The status that the objects were moved to by the claim
+    :return: list of the id's of the released objects
+    """
+    expired = model.objects.filter(my_status=to_status, claimed_by__isnull=False, claim_expires__lt=datetime.now())
+    ids = bulk_set_status(expired, from_status)
+    if ids:
+        logger.info("released expired claims of " + str(len(ids)) + " " + model.__name__ + "s")
+    return ids
+
+
+def claim_taskobjects(queryset, from_status, to_status, count, worker, lease=DEFAULT_LEASE):
+    """
+    Claim up to 'count' objects for a worker, by moving them from one status to another.
+    The rows are locked with SELECT ... FOR UPDATE SKIP LOCKED, so that workers that claim
+    at the same time get different objects.
+    :param (in) queryset: the Observations or DataProducts to claim from
+    :param (in) from_status: The status of the objects to claim, like 'valid'
+    :param (in) to_status: The status of the claimed objects, like 'ingesting'
+    :param (in) count: the maximum number of objects to claim
+    :param (in) worker: the name of the worker
+    :param (in) lease: the number of seconds after which the claim expires, when the status has not changed
+    :return: list of the id's of the claimed objects
+    """
+    logger.info("claim_taskobjects(" + queryset.model.__name__ + ", " + str(from_status) + " => " +
+                str(to_status) + ", " + str(count) + ", " + str(worker) + ")")
+
+    with transaction.atomic(savepoint=False):
+        release_expired_claims(queryset.model, from_status, to_status)
+
+        available = queryset.filter(my_status=from_status).order_by('id')
+        ids = list(available.select_for_update(skip_locked=True).values_list('id', flat=True)[:count])
+        if ids:
+            bulk_set_status(queryset.model.objects.filter(id__in=ids), to_status)
+            TaskObject.objects.filter(id__in=ids).update(claimed_by=worker,
+                                                         claim_expires=datetime.now() + timedelta(seconds=lease))
+    return ids
+
+
+def renew_claims(queryset, lease=DEFAULT_LEASE, worker=None):
+    """
+    Extend the claims of objects that are still claimed, for a worker that needs more time than its lease.
+    :param (in) queryset: the claimed Observations or DataProducts
+    :param (in) lease: the number of seconds from now after which the claims expire
+    :param (in) worker: (optional) only renew the claims of this worker
+    :return: list of the id's of the renewed claims
+    """
+    claimed = queryset.filter(claimed_by__isnull=False)
+    if worker is not None:
+        claimed = claimed.filter(claimed_by=worker)
+
+    with transaction.atomic(savepoint=False):
+        ids = list(claimed.select_for_update().values_list('id', flat=True))
+        TaskObject.objects.filter(id__in=ids).update(claim_expires=datetime.now() + timedelta(seconds=lease))
+    return ids
+
+
+def delete_taskobjects(queryset):
+    """
+    Delete Observations or DataProducts, and remove the deleted dataproducts from the summary.
+    The status history, location history and jobs are deleted with the objects, with one DELETE per table
+    for every chunk of objects. The dataproducts of deleted observations are unlinked.
+    :param (in) queryset: Observations or DataProducts that have to be deleted
+    :return: the number of deleted objects
+    """
+    logger.info("delete_taskobjects(" + queryset.model.__name__ + ")")
+
+    with transaction.atomic(savepoint=False):
+        ids = list(queryset.select_for_update().values_list('id', flat=True))
+        if len(ids) == 0:
+            return 0
+
+        if queryset.model == DataProduct:
+            update_summary(count_dataproducts({}, summarize(DataProduct.objects.filter(id__in=ids)), -1))
+
+        if queryset.model == Observation:
+            # in one UPDATE, instead of loading the dataproducts to set them to null one by one
+            DataProduct.objects.filter(parent_observation_id__in=ids).update(parent_observation=None)
+
+        # the cascade of Django deletes the rows that refer to the objects, it loads only the objects themselves
+        for start in range(0, len(ids), DELETE_CHUNK_SIZE):
+            queryset.model.objects.filter(id__in=ids[start:start + DELETE_CHUNK_SIZE]).delete()
+        invalidate_caches()
+
+    return len(ids)
+
+
+def delete_taskid(taskID):
+    """
+    Delete the observation(s) of a taskID and all its dataproducts, in one transaction.
+    :param (in) taskID: the taskID of the observation
+    :return: (number of deleted observations, number of deleted dataproducts)
+    """
+    logger.info("delete_taskid(" + str(taskID) + ")")
+
+    with transaction.atomic(savepoint=False):
+        observations = delete_taskobjects(Observation.objects.filter(taskID=taskID))
+        dataproducts = delete_taskobjects(DataProduct.objects.filter(taskID=taskID))
+
+        # nothing is left to summarize
+        ObservationSummary.objects.filter(taskID=taskID).delete()
+
+    return observations, dataproducts
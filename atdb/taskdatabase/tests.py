@@ -1,3 +1,1025 @@
-from django.test import TestCase
+import base64
+import json
+import time
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.test import APIClient
+
+from .models import DataProduct, Job, Location, LocationEvent, Observation, ObservationSummary, Status, TaskObject, JOB_DONE, JOB_FAILED, JOB_QUEUED, JOB_RUNNING
+from .services import changes, dashboard, export, jobs, transitions
+
+
+class ListQueryCountTest(TestCase):
+    """
+    The number of queries for a page of the list views should not depend on the size of the page.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('atdb_test'))
+
+        for taskID in ('1', '2'):
+            transitions.bulk_create_taskobjects(Observation, [
+                {'name': 'observation ' + taskID, 'task_type': 'observation', 'taskID': taskID,
+                 'new_status': 'defined', 'new_location': 'datawriter'}])
+            transitions.bulk_create_taskobjects(DataProduct, [
+                {'name': 'dataproduct ' + str(i), 'filename': taskID + '_' + str(i) + '.MS', 'task_type': 'dataproduct',
+                 'taskID': taskID, 'new_status': 'defined', 'new_location': 'datawriter'} for i in range(10)])
+
+        # give every dataproduct some history
+        transitions.bulk_set_status(DataProduct.objects.all(), 'created')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_dataproducts(self):
+        small = self.count_queries('/atdb/dataproducts/?page_size=2')
+        large = self.count_queries('/atdb/dataproducts/?page_size=20')
+        self.assertEqual(small, large)
+
+    def test_dataproducts_fields(self):
+        small = self.count_queries('/atdb/dataproducts/?page_size=2&fields=id,my_location,statusHistory')
+        large = self.count_queries('/atdb/dataproducts/?page_size=20&fields=id,my_location,statusHistory')
+        self.assertEqual(small, large)
+
+    def test_observations(self):
+        small = self.count_queries('/atdb/observations/?page_size=1')
+        large = self.count_queries('/atdb/observations/?page_size=2')
+        self.assertEqual(small, large)
+
+    def count_claim_queries(self, from_status, to_status, count):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/atdb/observations/claim', {
+                'from_status': from_status, 'to_status': to_status, 'count': count, 'worker': 'test'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), count)
+        return len(queries)
+
+    def test_observations_claim(self):
+        large = self.count_claim_queries('defined', 'claimed', 2)
+        small = self.count_claim_queries('claimed', 'ingesting', 1)
+        self.assertEqual(small, large)
+
+
+class SparseFieldsTest(TestCase):
+    """
+    With ?fields= only the requested fields are serialized, and only their columns and relations are read.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('atdb_test'))
+        transitions.bulk_create_taskobjects(DataProduct, [
+            {'name': 'dataproduct ' + str(i), 'filename': str(i) + '.MS', 'task_type': 'dataproduct', 'taskID': '1',
+             'new_status': 'defined', 'new_location': 'datawriter'} for i in range(3)])
+
+    def get(self, url, queries):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # the change counter, the page and the prefetched relations
+        self.assertEqual(len(captured), queries, [query['sql'] for query in captured])
+        return response.data['results'] if 'results' in response.data else response.data, captured[1]['sql']
+
+    def test_fields(self):
+        results, sql = self.get('/atdb/dataproducts/?fields=id,taskID', 2)
+        self.assertEqual([set(result) for result in results], [{'id', 'taskID'}] * 3)
+        self.assertNotIn('description', sql)
+        self.assertNotIn('JOIN "taskdatabase_location"', sql)
+
+        results, sql = self.get('/atdb/dataproducts/?fields=id,my_location', 2)
+        self.assertEqual([result['my_location'] for result in results], ['datawriter'] * 3)
+        self.assertIn('JOIN "taskdatabase_location"', sql)
+
+        results, sql = self.get('/atdb/dataproducts/?fields=id,statusHistory', 3)
+        self.assertEqual([len(result['statusHistory']) for result in results], [1] * 3)
+
+        results, sql = self.get('/atdb/dataproducts/?fields=id, locations, statusHistory', 4)
+        self.assertEqual([set(result) for result in results], [{'id', 'locations', 'statusHistory'}] * 3)
+
+        result, sql = self.get('/atdb/dataproducts/' + str(results[0]['id']) + '/?fields=name', 2)
+        self.assertEqual(result, {'name': 'dataproduct 0'})
+
+        # without fields everything is read
+        results, sql = self.get('/atdb/dataproducts/', 4)
+        self.assertIn('description', results[0])
+
+    def test_unknown_fields(self):
+        for url in ('/atdb/dataproducts/?fields=bogus', '/atdb/dataproducts/?fields=id,bogus,dps_count',
+                    '/atdb/observations/?fields=filename'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('unknown fields: ', response.data['error'])
+        self.assertEqual(self.client.get('/atdb/dataproducts/?fields=id,bogus,dps_count').data['error'],
+                         'unknown fields: bogus, dps_count')
+
+
+class LocationTest(TransactionTestCase):
+    """
+    A move to a location uses the location as it is in the database, also after it is renamed or deleted.
+    The location ids are cached, so that a move does not have to look up its location.
+    """
+
+    def move(self, new_location):
+        dataproduct = DataProduct.objects.get(filename='1.MS')
+        dataproduct.new_location = new_location
+        transitions.save_taskobject(dataproduct)
+        return DataProduct.objects.get(filename='1.MS').my_location.location
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('atdb_test'))
+        transitions.bulk_create_taskobjects(DataProduct, [
+            {'name': 'dataproduct', 'filename': '1.MS', 'task_type': 'dataproduct', 'taskID': '1',
+             'new_status': 'defined', 'new_location': 'datawriter'}])
+
+    def tearDown(self):
+        # the ids of the flushed locations
+        transitions.clear_location_ids()
+
+    def test_cached(self):
+        self.assertEqual(self.move('archive'), 'archive')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.move('datawriter'), 'datawriter')
+        self.assertFalse([query for query in queries if '"taskdatabase_location"."location" IN' in query['sql']])
+
+    def test_renamed_location(self):
+        location = Location.objects.get(location='datawriter')
+        location.location = 'archive'
+        location.save()
+        self.assertEqual(self.move('datawriter'), 'datawriter')
+        self.assertEqual(Location.objects.count(), 2)
+
+        # a rename by another process is seen after the ttl of the cache
+        Location.objects.filter(location='datawriter').update(location='ingest')
+        with mock.patch.object(transitions, 'location_ids_expire', 0):
+            self.assertEqual(self.move('datawriter'), 'datawriter')
+        self.assertEqual(Location.objects.count(), 3)
+
+    def test_deleted_location(self):
+        self.assertEqual(self.move('archive'), 'archive')
+        Location.objects.filter(location='datawriter').delete()
+        self.assertEqual(self.move('datawriter'), 'datawriter')
+
+    def test_rolled_back_location(self):
+        try:
+            with transaction.atomic():
+                self.move('archive')
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual(self.move('archive'), 'archive')
+
+    def test_write(self):
+        location = Location.objects.get(location='datawriter')
+        response = self.client.put('/atdb/locations/' + str(location.id) + '/', {'location': 'archive'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.move('datawriter'), 'datawriter')
+
+        url = '/atdb/status/' + str(Status.objects.order_by('id')[0].id) + '/'
+        self.assertEqual(self.client.put(url, {'name': 'valid'}, format='json').data['name'], 'valid')
+        self.assertEqual(self.client.delete(url).status_code, 204)
+
+
+class BulkCreateTest(TestCase):
+    """
+    A POST of a json list creates all the objects in one transaction, with their history and summary.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('atdb_test'))
+
+    def post(self, url, data):
+        return self.client.post(url, data, format='json')
+
+    def test_create(self):
+        response = self.post('/atdb/observations/', [{'name': 'observation', 'task_type': 'observation', 'taskID': '1',
+                                                      'new_status': 'defined', 'new_location': 'datawriter'}])
+        self.assertEqual(response.status_code, 201)
+        observation = response.data['ids'][0]
+
+        rows = [{'name': 'dataproduct ' + str(i), 'filename': str(i) + '.MS', 'taskID': '1', 'size': 10,
+                 'new_status': 'valid' if i % 2 else 'defined', 'new_location': 'datawriter'} for i in range(5)]
+        # smaller batches than the list, to insert the children in several statements
+        with mock.patch.object(connection.ops, 'bulk_batch_size', return_value=2):
+            response = self.post('/atdb/dataproducts/', rows)
+        self.assertEqual(response.status_code, 201)
+        ids = response.data['ids']
+
+        # the ids are returned in the order of the list
+        self.assertEqual(list(DataProduct.objects.filter(id__in=ids).order_by('id').values_list('filename', flat=True)),
+                         [row['filename'] for row in rows])
+        self.assertEqual(sorted(ids), ids)
+        for id, row in zip(ids, rows):
+            dataproduct = DataProduct.objects.get(id=id)
+            self.assertEqual((dataproduct.my_status, dataproduct.my_location.location, dataproduct.size),
+                             (row['new_status'], 'datawriter', 10))
+            self.assertEqual(dataproduct.parent_observation_id, observation)
+            self.assertEqual(list(dataproduct.statusHistory.values_list('previous', 'name')), [(None, row['new_status'])])
+            self.assertEqual(dataproduct.locationHistory.count(), 1)
+
+        summary = ObservationSummary.objects.filter(taskID='1').order_by('status').values_list('status', 'dps_count', 'size')
+        self.assertEqual(list(summary), [('defined', 3, 30), ('valid', 2, 20)])
+        self.assertEqual(Observation.objects.get(id=observation).dps_count, 5)
+
+    def test_invalid(self):
+        rows = [{'name': 'dataproduct', 'filename': '1.MS', 'taskID': '1', 'new_status': 'defined'},
+                {'name': 'dataproduct', 'filename': '2.MS', 'taskID': '1', 'size': 'big'}]
+        response = self.post('/atdb/dataproducts/', rows)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('size', response.data[1])
+
+        # nothing is created
+        self.assertEqual(TaskObject.objects.count(), 0)
+        self.assertEqual(ObservationSummary.objects.count(), 0)
+
+
+class PaginationTest(TestCase):
+    """
+    The keyset pagination returns every object once, in the order of (creationTime, id), also when objects are
+    added or have the same creationTime.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('atdb_test'))
+        self.ids = transitions.bulk_create_taskobjects(DataProduct, [
+            {'name': 'dataproduct ' + str(i), 'filename': str(i) + '.MS', 'task_type': 'dataproduct',
+             'taskID': '1', 'new_status': 'defined'} for i in range(7)])
+
+    def get_pages(self, url):
+        """
+        Follow the 'next' links from a url.
+        :return: the ids per page, and the urls of the pages
+        """
+        pages, urls = [], []
+        while url:
+            urls.append(url)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([result['id'] for result in response.data['results']])
+            url = response.data['next']
+        return pages, urls
+
+    def test_pages(self):
+        # the objects were created in the order of their ids, with increasing creationTimes
+        pages, urls = self.get_pages('/atdb/dataproducts/?page_size=3&fields=id')
+        self.assertEqual(pages, [self.ids[0:3], self.ids[3:6], self.ids[6:]])
+
+        # the cursor in the 'next' link gives the same page again, and keeps the other parameters
+        self.assertIn('fields=id', urls[1])
+        response = self.client.get(urls[1])
+        self.assertEqual([result['id'] for result in response.data['results']], self.ids[3:6])
+
+        # the objects that are added while paging are on the last pages
+        id = transitions.bulk_create_taskobjects(DataProduct, [
+            {'name': 'dataproduct', 'filename': '7.MS', 'task_type': 'dataproduct', 'taskID': '1',
+             'new_status': 'defined'}])[0]
+        self.assertEqual(self.get_pages(urls[1])[0], [self.ids[3:6], [self.ids[6], id]])
+
+        # without page_size or cursor the whole list is returned, unpaginated
+        response = self.client.get('/atdb/dataproducts/?fields=id')
+        self.assertEqual(sorted(result['id'] for result in response.data), self.ids + [id])
+
+    def test_same_time(self):
+        # the objects with the same creationTime are ordered by id, none are skipped or repeated
+        DataProduct.objects.update(creationTime=datetime(2018, 8, 23, 12, 0, 0, 123456))
+        pages = self.get_pages('/atdb/dataproducts/?page_size=2&fields=id')[0]
+        self.assertEqual(pages, [self.ids[0:2], self.ids[2:4], self.ids[4:6], self.ids[6:]])
+
+        # the same within the pages of a filtered list
+        DataProduct.objects.filter(id__in=self.ids[4:]).update(taskID='2')
+        pages = self.get_pages('/atdb/dataproducts/?taskID=1&page_size=3&fields=id')[0]
+        self.assertEqual(pages, [self.ids[0:3], self.ids[3:4]])
+
+    def test_invalid_cursor(self):
+        urls = self.get_pages('/atdb/dataproducts/?page_size=3&fields=id')[1]
+        cursor = parse_qs(urlparse(urls[1]).query)['cursor'][0]
+        value, id = base64.urlsafe_b64decode(cursor).decode('ascii').split('|')
+
+        def encode(text):
+            return base64.urlsafe_b64encode(text.encode('ascii')).decode('ascii')
+
+        for invalid in ('x', cursor[:-2], encode(value), encode(value + '|x'), encode('yesterday|' + id),
+                        encode(value + '|' + id + '|1'), 'é'):
+            response = self.client.get('/atdb/dataproducts/', {'page_size': 3, 'cursor': invalid})
+            self.assertEqual(response.status_code, 400, invalid)
+            self.assertEqual(response.data, {'error': 'Invalid cursor'})
+
+        # a cursor with a time zone is compared in the local time zone of the database times
+        aware = timezone.make_aware(parse_datetime(value)).astimezone(timezone.utc).isoformat()
+        response = self.client.get('/atdb/dataproducts/', {'page_size': 3, 'cursor': encode(aware + '|' + id)})
+        self.assertEqual([result['id'] for result in response.data['results']], self.ids[3:6])
+
+        # a cursor that was changed into another valid cursor just gives the page after that object
+        response = self.client.get('/atdb/dataproducts/', {'page_size': 3, 'cursor': encode(value + '|0')})
+        self.assertEqual([result['id'] for result in response.data['results']], self.ids[2:5])
+
+
+class ExportTest(TestCase):
+    """
+    The export streams the (filtered) objects as NDJSON in the order of their ids, whatever the chunk size.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('atdb_test'))
+        transitions.bulk_create_taskobjects(Observation, [
+            {'name': 'observation', 'task_type': 'observation', 'taskID': '1', 'new_status': 'defined',
+             'new_location': 'datawriter'}])
+        self.ids = transitions.bulk_create_taskobjects(DataProduct, [
+            {'name': 'dataproduct ' + str(i), 'filename': str(i) + '.MS', 'task_type': 'dataproduct',
+             'taskID': str(i % 2), 'size': i, 'new_status': 'valid' if i < 3 else 'defined',
+             'new_location': 'datawriter'} for i in range(5)])
+
+    def export(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertTrue(response.streaming)
+
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(content == '' or content.endswith('\n'))
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_export(self):
+        rows = self.export('/atdb/dataproducts/export')
+        self.assertEqual([row['id'] for row in rows], self.ids)
+        self.assertEqual(set(rows[0]), set(export.EXPORT_FIELDS[DataProduct]) | {'my_location'})
+        self.assertEqual((rows[1]['filename'], rows[1]['size'], rows[1]['my_status'], rows[1]['my_location']),
+                         ('1.MS', 1, 'valid', 'datawriter'))
+
+        rows = self.export('/atdb/observations/export')
+        self.assertEqual([(row['taskID'], row['my_status']) for row in rows], [('1', 'defined')])
+
+    def test_filters(self):
+        self.assertEqual([row['id'] for row in self.export('/atdb/dataproducts/export', {'taskID': '1'})],
+                         self.ids[1::2])
+        self.assertEqual([row['id'] for row in self.export('/atdb/dataproducts/export',
+                                                           {'my_status': 'valid', 'taskID': '0'})], self.ids[0:3:2])
+        self.assertEqual([row['id'] for row in self.export('/atdb/dataproducts/export',
+                                                           {'filename__icontains': '4'})], self.ids[4:])
+        self.assertEqual(self.export('/atdb/dataproducts/export', {'my_location': 'archive'}), [])
+
+        # an invalid filter value is an error, not an export of everything
+        response = self.client.get('/atdb/dataproducts/export', {'creationTime__gt': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_chunk_size(self):
+        # the rows on the boundaries of the chunks are exported once. Invalid sizes use the default,
+        # or at least 1 row per chunk.
+        for chunk_size in (1, 2, 4, 5, 6, 0, -1, 'x'):
+            rows = self.export('/atdb/dataproducts/export', {'chunk_size': chunk_size})
+            self.assertEqual([row['id'] for row in rows], self.ids, chunk_size)
+
+        with mock.patch.object(export, 'export_rows', wraps=export.export_rows) as export_rows:
+            self.export('/atdb/dataproducts/export', {'chunk_size': 0})
+            self.export('/atdb/dataproducts/export', {'chunk_size': 'x'})
+        self.assertEqual([call[0][1] for call in export_rows.call_args_list], [1, export.DEFAULT_CHUNK_SIZE])
+
+    def test_command(self):
+        output = StringIO()
+        with mock.patch('sys.stdout', output):
+            call_command('export_ndjson', 'dataproducts', '--filter', 'taskID=0', '--filter', 'my_status=defined',
+                         '--chunk-size', '1', stderr=StringIO())
+        self.assertEqual([json.loads(line)['id'] for line in output.getvalue().splitlines()], self.ids[4:])
+
+        for filter in ('taskID', 'creationTime__gt=yesterday'):
+            with self.assertRaises(CommandError):
+                call_command('export_ndjson', 'dataproducts', '--filter', filter, stderr=StringIO())
+
+
+class SaveTest(TestCase):
+    """
+    A save writes every object once, and records the status that the object had in the database as previous status.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('atdb_test'))
+        transitions.bulk_create_taskobjects(Observation, [
+            {'name': 'observation', 'task_type': 'observation', 'taskID': '1', 'new_status': 'defined'}])
+        transitions.bulk_create_taskobjects(DataProduct, [
+            {'name': 'dataproduct', 'filename': '1.MS', 'task_type': 'dataproduct', 'taskID': '1',
+             'new_status': 'defined', 'new_location': 'datawriter'}])
+
+    def writes(self, queries, table):
+        return len([query for query in queries if query['sql'].startswith('UPDATE "' + table + '"')])
+
+    def test_writes(self):
+        for url, table in (('/atdb/observations/', 'taskdatabase_observation'),
+                           ('/atdb/dataproducts/', 'taskdatabase_dataproduct')):
+            id = self.client.get(url + '?fields=id').data[0]['id']
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.put(url + str(id) + '/', {'new_status': 'valid', 'new_location': 'archive'},
+                                           format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['my_status'], 'valid')
+            self.assertEqual(self.writes(queries, 'taskdatabase_taskobject'), 1)
+            self.assertEqual(self.writes(queries, table), 1)
+
+    def test_queries(self):
+        # the summary row of 'valid' exists
+        transitions.bulk_create_taskobjects(DataProduct, [
+            {'name': 'dataproduct', 'filename': '2.MS', 'task_type': 'dataproduct', 'taskID': '1', 'new_status': 'valid'}])
+
+        # lock and read the old row, location (only cached after a commit), status history,
+        # save (2 tables), summary (old and new status), job
+        dataproduct = DataProduct.objects.get(filename='1.MS')
+        dataproduct.new_status = 'valid'
+        with self.assertNumQueries(8):
+            transitions.save_taskobject(dataproduct)
+
+        # lock and read the old row, location, status history, save (2 tables), job
+        observation = Observation.objects.get(taskID='1')
+        observation.new_status = 'valid'
+        with self.assertNumQueries(6):
+            transitions.save_taskobject(observation)
+
+    def test_stale_object(self):
+        for model in (Observation, DataProduct):
+            first = model.objects.get(taskID='1')
+            second = model.objects.get(taskID='1')
+            first.new_status = 'valid'
+            transitions.save_taskobject(first)
+
+            # the second object was read before the first save
+            second.new_status = 'invalid'
+            transitions.save_taskobject(second)
+            history = Status.objects.filter(taskObject_id=first.id).order_by('id').values_list('previous', 'name')
+            self.assertEqual(list(history), [(None, 'defined'), ('defined', 'valid'), ('valid', 'invalid')])
+
+
+class ObservationLinkTest(TestCase):
+    """
+    Dataproducts are linked to the observation with their taskID, also when the observation arrives after them.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('atdb_test'))
+
+    def post(self, url, data):
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data
+
+    def observations(self, filename):
+        id = DataProduct.objects.get(filename=filename).id
+        return self.client.get('/atdb/dataproducts/' + str(id) + '/').data['generatedByObservation']
+
+    def test_late_observation(self):
+        self.post('/atdb/dataproducts/', {'name': 'dataproduct', 'filename': '1.MS', 'taskID': '1', 'new_status': 'defined'})
+        self.post('/atdb/dataproducts/', [{'name': 'dataproduct', 'filename': str(i) + '.MS', 'taskID': '1',
+                                           'new_status': 'defined'} for i in (2, 3)])
+        self.post('/atdb/dataproducts/', {'name': 'dataproduct', 'filename': '4.MS', 'taskID': '2', 'new_status': 'defined'})
+        self.assertEqual(self.observations('1.MS'), [])
+
+        observation = self.post('/atdb/observations/', {'name': 'observation', 'task_type': 'observation', 'taskID': '1',
+                                                        'new_status': 'defined'})
+        url = 'http://testserver/atdb/observations/' + str(observation['id']) + '/'
+        for filename in ('1.MS', '2.MS', '3.MS'):
+            self.assertEqual(self.observations(filename), [url])
+        self.assertEqual(self.observations('4.MS'), [])
+        self.assertEqual(len(self.client.get(url).data['generatedDataProducts']), 3)
+
+        # a dataproduct that arrives after its observation
+        self.post('/atdb/dataproducts/', {'name': 'dataproduct', 'filename': '5.MS', 'taskID': '1', 'new_status': 'defined'})
+        self.assertEqual(self.observations('5.MS'), [url])
+
+    def test_write(self):
+        observations = [self.post('/atdb/observations/', {'name': 'observation', 'task_type': 'observation', 'taskID': taskID,
+                                                          'new_status': 'defined'})['id'] for taskID in ('1', '2')]
+        urls = ['http://testserver/atdb/observations/' + str(id) + '/' for id in observations]
+        self.post('/atdb/dataproducts/', {'name': 'dataproduct', 'filename': '1.MS', 'taskID': '1', 'new_status': 'defined'})
+        id = DataProduct.objects.get(filename='1.MS').id
+
+        response = self.client.patch('/atdb/dataproducts/' + str(id) + '/', {'generatedByObservation': [urls[1]]}, format='json')
+        self.assertEqual(response.data['generatedByObservation'], [urls[1]])
+        response = self.client.patch('/atdb/dataproducts/' + str(id) + '/', {'generatedByObservation': urls}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch('/atdb/dataproducts/' + str(id) + '/', {'generatedByObservation': []}, format='json')
+        self.assertEqual(response.data['generatedByObservation'], [])
+
+
+class ObservationSummaryTest(TestCase):
+    """
+    The summary counters should always be the same as a recount of the dataproducts.
+    """
+
+    def setUp(self):
+        for taskID in ('1', '2'):
+            transitions.bulk_create_taskobjects(Observation, [
+                {'name': 'observation ' + taskID, 'task_type': 'observation', 'taskID': taskID, 'new_status': 'defined'}])
+            transitions.bulk_create_taskobjects(DataProduct, [
+                {'name': 'dataproduct ' + str(i), 'filename': taskID + '_' + str(i) + '.MS', 'task_type': 'dataproduct',
+                 'taskID': taskID, 'new_status': 'defined', 'size': 10 * i} for i in range(10)])
+
+    def assertSummaryIsRecount(self):
+        summary = set(ObservationSummary.objects.filter(dps_count__gt=0).values_list('taskID', 'status', 'dps_count', 'size'))
+        recount = set(DataProduct.objects.order_by().values_list('taskID', 'my_status').annotate(Count('id'), Sum('size')))
+        self.assertEqual(summary, recount)
+
+    def test_transitions(self):
+        self.assertSummaryIsRecount()
+
+        transitions.bulk_set_status(DataProduct.objects.filter(taskID='1', size__gte=50), 'valid')
+        self.assertSummaryIsRecount()
+
+        dataproduct = DataProduct.objects.get(filename='2_3.MS')
+        dataproduct.new_status = 'invalid'
+        dataproduct.size = 1000
+        transitions.save_taskobject(dataproduct)
+        self.assertSummaryIsRecount()
+
+        dataproduct = DataProduct.objects.get(filename='2_4.MS')
+        dataproduct.taskID = '1'
+        transitions.save_taskobject(dataproduct)
+        self.assertSummaryIsRecount()
+
+        transitions.claim_taskobjects(DataProduct.objects.all(), 'valid', 'ingesting', 3, 'test')
+        self.assertSummaryIsRecount()
+
+    def test_deletes(self):
+        transitions.bulk_set_status(DataProduct.objects.filter(size__lt=30), 'valid')
+        transitions.delete_taskobjects(DataProduct.objects.filter(taskID='1', size__gte=70))
+        self.assertSummaryIsRecount()
+
+        transitions.delete_taskobjects(Observation.objects.filter(taskID='2'))
+        self.assertSummaryIsRecount()
+
+        transitions.delete_taskid('1')
+        self.assertSummaryIsRecount()
+        self.assertFalse(ObservationSummary.objects.filter(taskID='1').exists())
+
+
+class DeleteTest(TestCase):
+    """
+    Deleting the objects of a taskID deletes everything that refers to them, and nothing of other taskIDs.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('atdb_test'))
+        for taskID in ('1', '2'):
+            transitions.bulk_create_taskobjects(Observation, [
+                {'name': 'observation ' + taskID, 'task_type': 'observation', 'taskID': taskID,
+                 'new_status': 'defined', 'new_location': 'datawriter'}])
+            transitions.bulk_create_taskobjects(DataProduct, [
+                {'name': 'dataproduct ' + str(i), 'filename': taskID + '_' + str(i) + '.MS', 'task_type': 'dataproduct',
+                 'taskID': taskID, 'new_status': 'defined', 'new_location': 'datawriter',
+                 'parent_observation': Observation.objects.get(taskID=taskID)} for i in range(10)])
+        transitions.bulk_set_status(DataProduct.objects.all(), 'valid')
+        for taskObject in TaskObject.objects.all():
+            Job.objects.create(taskObject=taskObject, job_type='copy')
+
+    def counts(self, taskID):
+        ids = list(TaskObject.objects.filter(taskID=taskID).values_list('id', flat=True))
+        return (len(ids),
+                Status.objects.filter(taskObject_id__in=ids).count(),
+                LocationEvent.objects.filter(taskObject_id__in=ids).count(),
+                Job.objects.filter(taskObject_id__in=ids).count(),
+                ObservationSummary.objects.filter(taskID=taskID).count())
+
+    def test_delete_taskid(self):
+        deleted = self.counts('1')
+        before = self.counts('2')
+        rows = (Status.objects.count(), LocationEvent.objects.count(), Job.objects.count())
+
+        # more objects than fit in one chunk
+        with mock.patch.object(transitions, 'DELETE_CHUNK_SIZE', 3):
+            response = self.client.delete('/atdb/observations/taskid/1/')
+        self.assertEqual(response.data, {'taskID': '1', 'observations': 1, 'dataproducts': 10})
+
+        self.assertEqual(self.counts('1'), (0, 0, 0, 0, 0))
+        self.assertEqual(self.counts('2'), before)
+        self.assertEqual((Status.objects.count(), LocationEvent.objects.count(), Job.objects.count()),
+                         (rows[0] - deleted[1], rows[1] - deleted[2], rows[2] - deleted[3]))
+        self.assertEqual(self.client.delete('/atdb/observations/taskid/1/').status_code, 404)
+
+    def test_delete_observation(self):
+        observation = Observation.objects.get(taskID='1').id
+        dataproducts = self.counts('1')
+        transitions.delete_taskobjects(Observation.objects.filter(taskID='1'))
+
+        # the dataproducts and their history are kept, and unlinked
+        self.assertEqual(DataProduct.objects.filter(taskID='1', parent_observation__isnull=True).count(), 10)
+        self.assertEqual(Status.objects.filter(taskObject_id=observation).count(), 0)
+        self.assertEqual(LocationEvent.objects.filter(taskObject_id=observation).count(), 0)
+        self.assertEqual(self.counts('1')[:3], (dataproducts[0] - 1, dataproducts[1] - 1, dataproducts[2] - 1))
+
+
+class ConditionalGetTest(TransactionTestCase):
+    """
+    The ETag comes from the change counter in the database, so that it is the same for all workers.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('atdb_test'))
+        transitions.bulk_create_taskobjects(DataProduct, [
+            {'name': 'dataproduct', 'filename': '1.MS', 'task_type': 'dataproduct', 'taskID': '1', 'new_status': 'defined'}])
+
+    def tearDown(self):
+        transitions.clear_location_ids()
+
+    def test_etag(self):
+        url = '/atdb/dataproducts/?fields=id,my_status'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # another worker only shares the database
+        cache.clear()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        transitions.bulk_set_status(DataProduct.objects.all(), 'valid')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class DashboardTest(TransactionTestCase):
+    """
+    The rows of the index page are cached until an observation or dataproduct changes, and the page polls
+    for the rows that have changed since its previous poll.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('atdb_test'))
+        self.ids = transitions.bulk_create_taskobjects(DataProduct, [
+            {'name': 'dataproduct ' + str(i), 'filename': str(i) + '.MS', 'task_type': 'dataproduct',
+             'taskID': '1', 'new_status': 'defined'} for i in range(3)])
+
+    def tearDown(self):
+        cache.clear()
+        transitions.clear_location_ids()
+
+    def get_delta(self, since):
+        response = self.client.get('/atdb/dashboard/delta', {'since': since})
+        self.assertEqual(response.status_code, 200)
+        delta = response.json()
+        return delta['since'], [row['id'] for row in delta['dataproducts']]
+
+    def test_cached(self):
+        response = self.client.get('/atdb/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'dataproduct 2')
+
+        with self.assertNumQueries(0):
+            dashboard.get_dashboard()
+
+    def test_invalidate(self):
+        def statuses():
+            return {row['id']: row['my_status'] for row in dashboard.get_dashboard()['latest_dataproducts_list']}
+
+        self.assertEqual(statuses(), dict.fromkeys(self.ids, 'defined'))
+
+        # a change that is rolled back does not clear the cache
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                transitions.bulk_set_status(DataProduct.objects.all(), 'valid')
+                raise ValueError('rollback')
+        self.assertIsNotNone(cache.get(dashboard.DASHBOARD_CACHE_KEY))
+
+        # a committed change does, for a change of one object, of many objects, a new object and a delete
+        response = self.client.put('/atdb/dataproducts/' + str(self.ids[0]) + '/', {'new_status': 'valid'},
+                                   format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(statuses()[self.ids[0]], 'valid')
+
+        transitions.bulk_set_status(DataProduct.objects.filter(id__in=self.ids[1:]), 'invalid')
+        self.assertEqual(statuses(), {self.ids[0]: 'valid', self.ids[1]: 'invalid', self.ids[2]: 'invalid'})
+
+        response = self.client.post('/atdb/dataproducts/', {'name': 'dataproduct 3', 'filename': '3.MS',
+                                                            'taskID': '1', 'new_status': 'defined'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(statuses()), 4)
+
+        transitions.delete_taskobjects(DataProduct.objects.filter(id=self.ids[0]))
+        self.assertNotIn(self.ids[0], statuses())
+
+    def test_delta(self):
+        before = datetime.now() - timedelta(seconds=10)
+        DataProduct.objects.update(modifiedTime=before)
+        since, ids = self.get_delta(before.isoformat())
+        self.assertEqual(ids, [])
+
+        # the next poll uses the returned 'since', which overlaps the previous poll a little
+        transitions.bulk_set_status(DataProduct.objects.filter(id=self.ids[1]), 'valid')
+        since, ids = self.get_delta(since)
+        self.assertEqual(ids, [self.ids[1]])
+        self.assertEqual(self.get_delta(since)[1], [self.ids[1]])
+
+        DataProduct.objects.update(modifiedTime=before)
+        self.assertEqual(self.get_delta(since)[1], [])
+
+        # a 'since' with a time zone is compared in the local time zone of the database times
+        aware = timezone.make_aware(before - timedelta(seconds=1)).astimezone(timezone.utc)
+        self.assertEqual(sorted(self.get_delta(aware.isoformat())[1]), self.ids)
+        aware = timezone.make_aware(before + timedelta(seconds=1)).astimezone(timezone.utc)
+        self.assertEqual(self.get_delta(aware.isoformat())[1], [])
+
+        for since in (None, '', 'yesterday', '2018-13-45T12:00:00'):
+            response = self.client.get('/atdb/dashboard/delta', {'since': since} if since is not None else {})
+            self.assertEqual(response.status_code, 400)
+
+
+class ChangesTest(TestCase):
+    """
+    The change feed returns every transition after the cursor once, and waits at most MAX_TIMEOUT for new ones.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('atdb_test'))
+        transitions.bulk_create_taskobjects(Observation, [
+            {'name': 'observation', 'task_type': 'observation', 'taskID': '1', 'new_status': 'defined'}])
+        transitions.bulk_create_taskobjects(DataProduct, [
+            {'name': 'dataproduct ' + str(i), 'filename': str(i) + '.MS', 'task_type': 'dataproduct',
+             'taskID': str(i % 2), 'new_status': 'defined'} for i in range(4)])
+
+    def get(self, **params):
+        response = self.client.get('/atdb/changes', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['cursor'], response.data['results']
+
+    def test_cursor(self):
+        # without a cursor the feed starts at the last transition
+        cursor, results = self.get()
+        self.assertEqual((cursor, results), (Status.objects.order_by('-id')[0].id, []))
+
+        transitions.bulk_set_status(DataProduct.objects.filter(taskID='1'), 'valid')
+        cursor, results = self.get(cursor=cursor)
+        self.assertEqual([(event['status'], event['previous']) for event in results], [('valid', 'defined')] * 2)
+        self.assertEqual(cursor, results[-1]['id'])
+        self.assertEqual(self.get(cursor=cursor), (cursor, []))
+
+        # from the start, in pages. The ids of the database sequence do not restart in every test, and a young gap
+        # before the first id would hold the feed back, so the start is just before the first status of the test
+        first, results = self.get(cursor=Status.objects.order_by('id')[0].id - 1, limit=3)
+        self.assertEqual([event['id'] for event in results], list(Status.objects.order_by('id')[:3].values_list('id', flat=True)))
+        self.assertEqual(len(self.get(cursor=first)[1]), Status.objects.count() - 3)
+
+        for params in ({'cursor': 'x'}, {'limit': 'x'}, {'timeout': 'x'}):
+            self.assertEqual(self.client.get('/atdb/changes', params).status_code, 400)
+
+    def test_filters(self):
+        cursor = self.get()[0]
+        transitions.bulk_set_status(TaskObject.objects.all(), 'valid')
+        transitions.bulk_set_status(DataProduct.objects.filter(taskID='0'), 'invalid')
+
+        self.assertEqual(len(self.get(cursor=cursor)[1]), 7)
+        self.assertEqual(len(self.get(cursor=cursor, status='invalid')[1]), 2)
+        self.assertEqual(len(self.get(cursor=cursor, task_type='observation')[1]), 1)
+        results = self.get(cursor=cursor, taskID='1', task_type='dataproduct')[1]
+        self.assertEqual(set(event['taskID'] for event in results), {'1'})
+        self.assertEqual(len(results), 2)
+
+        # the events that are filtered out are skipped by the cursor
+        self.assertEqual(self.get(cursor=cursor, status='unknown')[0], Status.objects.order_by('-id')[0].id)
+
+    def test_gap(self):
+        cursor = self.get()[0]
+        transitions.bulk_set_status(DataProduct.objects.all(), 'valid')
+        ids = list(Status.objects.filter(id__gt=cursor).order_by('id').values_list('id', flat=True))
+
+        # a missing status can be a transaction that is still committing, the events after it wait
+        Status.objects.filter(id=ids[1]).delete()
+        settled, results = self.get(cursor=cursor)
+        self.assertEqual((settled, [event['id'] for event in results]), (ids[0], [ids[0]]))
+
+        # until the gap is older than GAP_TIMEOUT
+        Status.objects.filter(id__gt=cursor).update(timestamp=datetime.now() - changes.GAP_TIMEOUT - timedelta(seconds=1))
+        self.assertEqual([event['id'] for event in self.get(cursor=cursor)[1]], [ids[0]] + ids[2:])
+
+    def test_timeout(self):
+        cursor = self.get()[0]
+        with mock.patch.object(changes, 'MAX_TIMEOUT', 0.5), mock.patch.object(changes, 'POLL_INTERVAL', 0.05):
+            start = time.time()
+            self.assertEqual(self.get(cursor=cursor, timeout=100), (cursor, []))
+            self.assertTrue(0.5 <= time.time() - start < 2)
+
+            for timeout in (-1, 0):
+                start = time.time()
+                self.assertEqual(self.get(cursor=cursor, timeout=timeout), (cursor, []))
+                self.assertLess(time.time() - start, 0.5)
+
+            # an infinite timeout waits MAX_TIMEOUT, nan does not wait
+            for timeout in (float('nan'), float('inf'), float('-inf')):
+                start = time.time()
+                self.assertEqual(changes.get_changes(cursor, timeout=timeout), (cursor, []))
+                self.assertLess(time.time() - start, 2)
+
+        for timeout in ('nan', 'inf', '-inf', 'NaN'):
+            self.assertEqual(self.client.get('/atdb/changes', {'cursor': cursor, 'timeout': timeout}).status_code, 400)
+
+
+class JobTest(TestCase):
+    """
+    A failed job is tried again with an exponential backoff, until it has failed MAX_ATTEMPTS times.
+    A job whose worker has died is queued again after the timeout.
+    """
+
+    def setUp(self):
+        transitions.bulk_create_taskobjects(Observation, [
+            {'name': 'observation', 'task_type': 'observation', 'taskID': '1', 'new_status': 'defined'}])
+        self.job = Job.objects.create(taskObject=Observation.objects.get(taskID='1'), job_type='copy')
+
+    def claim(self):
+        # the backoff is not waited for
+        Job.objects.filter(status=JOB_QUEUED).update(run_after=datetime.now())
+        return jobs.claim_jobs(10, 'worker')
+
+    def test_done(self):
+        self.assertEqual(self.claim(), [self.job.id])
+        self.assertEqual(jobs.claim_jobs(10, 'other'), [])
+        job = jobs.finish_job(self.job.id, 1.5, worker='worker')
+        self.assertEqual((job.status, job.attempts, job.error), (JOB_DONE, 1, None))
+
+    def test_backoff(self):
+        for attempt in range(1, jobs.MAX_ATTEMPTS):
+            self.assertEqual(self.claim(), [self.job.id])
+            job = jobs.finish_job(self.job.id, 0, 'error', 'worker')
+            self.assertEqual((job.status, job.attempts), (JOB_QUEUED, attempt))
+
+            # the job waits for the backoff before it can be claimed again
+            backoff = (job.run_after - job.endTime).total_seconds()
+            self.assertEqual(backoff, jobs.BACKOFF * 2 ** (attempt - 1))
+            self.assertEqual(jobs.claim_jobs(10, 'worker'), [])
+
+        self.assertEqual(self.claim(), [self.job.id])
+        job = jobs.finish_job(self.job.id, 0, 'error', 'worker')
+        self.assertEqual((job.status, job.attempts), (JOB_FAILED, jobs.MAX_ATTEMPTS))
+        self.assertEqual(self.claim(), [])
+
+    def test_timeout(self):
+        self.assertEqual(self.claim(), [self.job.id])
+        Job.objects.filter(id=self.job.id).update(startTime=datetime.now() - timedelta(seconds=jobs.JOB_TIMEOUT + 1))
+
+        # the job is queued again as a failed attempt
+        jobs.release_stale_jobs()
+        job = Job.objects.get(id=self.job.id)
+        self.assertEqual((job.status, job.attempts), (JOB_QUEUED, 1))
+
+        # the late result of the dead worker does not overwrite the next run
+        Job.objects.filter(id=self.job.id).update(run_after=datetime.now())
+        self.assertEqual(jobs.claim_jobs(10, 'other'), [self.job.id])
+        job = jobs.finish_job(self.job.id, 0, worker='worker')
+        self.assertEqual((job.status, job.attempts, job.worker), (JOB_RUNNING, 2, 'other'))
+
+    def test_release(self):
+        self.assertEqual(self.claim(), [self.job.id])
+        jobs.release_job(self.job.id)
+        job = Job.objects.get(id=self.job.id)
+        self.assertEqual((job.status, job.attempts), (JOB_QUEUED, 0))
+
+    def test_restart(self):
+        self.assertEqual(self.claim(), [self.job.id])
+        Job.objects.filter(id=self.job.id).update(startTime=datetime.now() - timedelta(seconds=jobs.JOB_TIMEOUT + 1))
+
+        # a job that is started again gets a new timeout, without counting an attempt
+        self.assertTrue(jobs.restart_job(self.job.id, 'worker'))
+        jobs.release_stale_jobs()
+        job = Job.objects.get(id=self.job.id)
+        self.assertEqual((job.status, job.attempts), (JOB_RUNNING, 1))
+        self.assertFalse(jobs.restart_job(self.job.id, 'other'))
+
+
+class ClaimTest(TestCase):
+    """
+    Workers that claim at the same time get different objects, and the claims of a dead worker expire.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('atdb_test'))
+        transitions.bulk_create_taskobjects(DataProduct, [
+            {'name': 'dataproduct ' + str(i), 'filename': str(i) + '.MS', 'task_type': 'dataproduct',
+             'taskID': '1', 'new_status': 'valid'} for i in range(5)])
+
+    def claim(self, worker, count, lease=None, url='/atdb/dataproducts/claim'):
+        data = {'from_status': 'valid', 'to_status': 'ingesting', 'count': count, 'worker': worker}
+        if lease is not None:
+            data['lease'] = lease
+        return self.client.post(url, data, format='json')
+
+    def ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [dataproduct['id'] for dataproduct in response.data]
+
+    def test_claim(self):
+        first = self.ids(self.claim('worker1', 3))
+        second = self.ids(self.claim('worker2', 3))
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertFalse(set(first) & set(second))
+        self.assertEqual(DataProduct.objects.filter(my_status='ingesting', claimed_by='worker1').count(), 3)
+        self.assertEqual(self.ids(self.claim('worker3', 3)), [])
+
+    def test_count(self):
+        for count in (0, -1, 'x', None):
+            self.assertEqual(self.claim('worker', count).status_code, 400)
+        self.assertEqual(self.claim('worker', 1, lease=0).status_code, 400)
+        response = self.client.post('/atdb/dataproducts/claim', [{'worker': 'worker'}], format='json')
+        self.assertEqual(response.status_code, 400)
+
+        # a larger claim is cut to the maximum
+        with mock.patch.object(transitions, 'MAX_CLAIM_COUNT', 2):
+            self.assertEqual(len(self.ids(self.claim('worker', 100))), 2)
+
+    def test_expiry(self):
+        claimed = self.ids(self.claim('worker1', 2, lease=60))
+        DataProduct.objects.filter(id__in=claimed).update(claim_expires=datetime.now() - timedelta(seconds=1))
+
+        # the expired claims go back to 'valid', and can be claimed by another worker
+        second = self.ids(self.claim('worker2', 5))
+        self.assertEqual(set(second) & set(claimed), set(claimed))
+        self.assertEqual(DataProduct.objects.filter(claimed_by='worker1').count(), 0)
+        history = DataProduct.objects.get(id=claimed[0]).statusHistory.order_by('id').values_list('name', flat=True)
+        self.assertEqual(list(history), ['valid', 'ingesting', 'valid', 'ingesting'])
+
+    def test_renew(self):
+        claimed = self.ids(self.claim('worker1', 2, lease=60))
+        DataProduct.objects.filter(id__in=claimed).update(claim_expires=datetime.now() + timedelta(seconds=1))
+
+        # only the claims of the worker itself are renewed
+        response = self.client.post('/atdb/dataproducts/claim/renew?my_status=ingesting', {'worker': 'worker2'},
+                                    format='json')
+        self.assertEqual(response.data['ids'], [])
+        response = self.client.post('/atdb/dataproducts/claim/renew?my_status=ingesting',
+                                    {'worker': 'worker1', 'lease': 3600}, format='json')
+        self.assertEqual(sorted(response.data['ids']), sorted(claimed))
+        for claim_expires in DataProduct.objects.filter(id__in=claimed).values_list('claim_expires', flat=True):
+            self.assertGreater(claim_expires, datetime.now() + timedelta(seconds=3500))
+
+        response = self.client.post('/atdb/dataproducts/claim/renew', {'worker': 'worker1', 'lease': -1}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class NaturalKeyTest(TestCase):
+    """
+    Objects can be addressed by their taskID or filename, which are not unique.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('atdb_test'))
+        self.observations = transitions.bulk_create_taskobjects(Observation, [
+            {'name': 'observation ' + str(i), 'task_type': 'observation', 'taskID': '1', 'new_status': 'defined'}
+            for i in range(2)])
+        self.dataproducts = transitions.bulk_create_taskobjects(DataProduct, [
+            {'name': 'dataproduct ' + str(i), 'filename': '1.MS', 'task_type': 'dataproduct',
+             'taskID': '1', 'new_status': 'defined'} for i in range(2)])
+
+    def test_duplicates(self):
+        # the first match is used
+        response = self.client.get('/atdb/observations/taskid/1/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], min(self.observations))
+        response = self.client.get('/atdb/dataproducts/filename/1.MS/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], min(self.dataproducts))
+        self.assertEqual(self.client.get('/atdb/dataproducts/filename/2.MS/').status_code, 404)
+
+    def test_taskid_status(self):
+        response = self.client.put('/atdb/dataproducts/taskid/1/', {'new_status': 'valid'}, format='json')
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(DataProduct.objects.filter(my_status='valid').count(), 2)
+
+        for data in ([{'new_status': 'valid'}], {'description': 'x'}, {}):
+            response = self.client.put('/atdb/dataproducts/taskid/1/', data, format='json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_resolve(self):
+        response = self.client.post('/atdb/dataproducts/resolve', {'key': 'filename', 'values': ['1.MS', '2.MS']},
+                                    format='json')
+        self.assertEqual(response.data['ids'], {'1.MS': min(self.dataproducts)})
+        for data in ([{'key': 'filename'}], {'key': 'taskID', 'values': ['1']}, {'key': 'filename', 'values': '1.MS'},
+                     {'key': 'filename', 'values': ['1.MS', ['2.MS']]}, {'key': 'filename', 'values': [{'a': 1}]},
+                     {'key': 'filename', 'values': [None]}, {'key': 'filename', 'values': [True]}):
+            response = self.client.post('/atdb/dataproducts/resolve', data, format='json')
+            self.assertEqual(response.status_code, 400)
+
+        # a taskID can be given as a number
+        response = self.client.post('/atdb/observations/resolve', {'key': 'taskID', 'values': [1, '2']}, format='json')
+        self.assertEqual(response.data['ids'], {'1': min(self.observations)})
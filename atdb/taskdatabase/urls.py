@@ -6,21 +6,75 @@ urlpatterns = [
     # ex: /atdb/
     path('', views.index, name='index'),
 
+    # ex: /atdb/dashboard/delta?since=2018-08-18T12:00:00
+    path('dashboard/delta', views.dashboard_delta, name='dashboard-delta-view'),
+
     # ex: /atdb/dataproducts/
     path('dataproducts/', views.DataProductListView.as_view()),
 
     # ex: /atdb/dataproducts/5/
     path('dataproducts/<int:pk>/', views.DataProductDetailsView.as_view(),name='dataproduct-detail-view'),
 
+    # ex: /atdb/dataproducts/filename/WSRTA180223003_B000.MS/
+    path('dataproducts/filename/<str:filename>/', views.DataProductByFilenameView.as_view(),
+         name='dataproduct-filename-view'),
+
+    # ex: /atdb/dataproducts/taskid/180223003/ (all dataproducts of this taskID)
+    path('dataproducts/taskid/<str:taskID>/', views.DataProductsByTaskIDView.as_view(), name='dataproduct-taskid-view'),
+
+    # ex: /atdb/dataproducts/range/11/15/ (DELETE only)
+    path('dataproducts/range/<int:first>/<int:last>/', views.DataProductDeleteRangeView.as_view(),
+         name='dataproduct-range-view'),
+
+    # ex: /atdb/dataproducts/export?my_status=valid
+    path('dataproducts/export', views.DataProductExportView.as_view(), name='dataproduct-export-view'),
+
+    # ex: /atdb/dataproducts/claim
+    path('dataproducts/claim', views.DataProductClaimView.as_view(), name='dataproduct-claim-view'),
+
+    # ex: /atdb/dataproducts/claim/renew
+    path('dataproducts/claim/renew', views.DataProductRenewClaimView.as_view(), name='dataproduct-renew-claim-view'),
+
+    # ex: /atdb/dataproducts/resolve
+    path('dataproducts/resolve', views.DataProductResolveView.as_view(), name='dataproduct-resolve-view'),
+
     # ex: /atdb/observations/
     path('observations/', views.ObservationListView.as_view()),
 
     # ex: /atdb/observations/5/
     path('observations/<int:pk>/', views.ObservationDetailsView.as_view(),name='observation-detail-view'),
 
+    # ex: /atdb/observations/taskid/180223003/
+    path('observations/taskid/<str:taskID>/', views.ObservationByTaskIDView.as_view(), name='observation-taskid-view'),
+
+    # ex: /atdb/observations/range/11/15/ (DELETE only)
+    path('observations/range/<int:first>/<int:last>/', views.ObservationDeleteRangeView.as_view(),
+         name='observation-range-view'),
+
+    # ex: /atdb/observations/export?my_status=valid
+    path('observations/export', views.ObservationExportView.as_view(), name='observation-export-view'),
+
+    # ex: /atdb/observations/claim
+    path('observations/claim', views.ObservationClaimView.as_view(), name='observation-claim-view'),
+
+    # ex: /atdb/observations/claim/renew
+    path('observations/claim/renew', views.ObservationRenewClaimView.as_view(), name='observation-renew-claim-view'),
+
+    # ex: /atdb/observations/resolve
+    path('observations/resolve', views.ObservationResolveView.as_view(), name='observation-resolve-view'),
+
+    # ex: /atdb/observations/5/summary
+    path('observations/<int:pk>/summary', views.ObservationSummaryView.as_view(), name='observation-summary-view'),
+
+    # ex: /atdb/summary
+    path('summary', views.SummaryView.as_view(), name='summary-view'),
+
     path('locations/', views.LocationListView.as_view()),
     path('locations/<int:pk>/', views.LocationDetailsView.as_view(),name='location-detail-view'),
 
+    # ex: /atdb/changes?cursor=1234&timeout=10
+    path('changes', views.ChangesView.as_view(), name='changes-view'),
+
     path('status/', views.StatusListView.as_view()),
     path('status/<int:pk>/', views.StatusDetailsView.as_view(), name='status-detail-view'),
 
@@ -1,13 +1,24 @@
+import hashlib
 import logging
-from django.http import HttpResponse
+import math
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from rest_framework import generics, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from django_filters import rest_framework as filters
 from django.template import loader
 from django.shortcuts import render, redirect
+from django.db import transaction
+from django.db.models import OuterRef, Prefetch, Subquery, Sum
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
 
-from .models import DataProduct, Observation, Location, Status
+from .models import DataProduct, Observation, Location, Status, ObservationSummary
 from .serializers import DataProductSerializer, ObservationSerializer, LocationSerializer, StatusSerializer
+from .services import transitions, export, dashboard, changes
+from .pagination import KeysetPagination, DEFAULT_KEYSET_FIELD
 
 datetime_format_string = '%Y-%m-%dT%H:%M:%SZ'
 
@@ -15,44 +26,213 @@ logger = logging.getLogger(__name__)
 
 # http://localhost:8000/atdb/
 def index(request):
-
-    latest_observations_list = Observation.objects.order_by('-creationTime')[:50]
-    latest_dataproducts_list = DataProduct.objects.order_by('-creationTime')[:50]
-    context = {
-        'latest_observations_list': latest_observations_list,
-        'latest_dataproducts_list': latest_dataproducts_list
-        }
+    # the rows come from the cache, which is cleared when an observation or dataproduct changes
+    context = dashboard.get_dashboard()
     return render(request, 'taskdatabase/index.html', context)
 
 
+# the index page polls this for the rows that have changed since the previous poll.
+# ex: /atdb/dashboard/delta?since=2018-08-18T12:00:00
+def dashboard_delta(request):
+    try:
+        since = parse_datetime(request.GET.get('since', ''))
+    except ValueError:
+        # well formatted, but not a valid datetime
+        since = None
+    if since is None:
+        return JsonResponse({'error': "'since' should be a datetime, like 2018-08-18T12:00:00"}, status=400)
+
+    # the times in the database are in the local time zone, a 'since' with a time zone is converted to it
+    if timezone.is_aware(since) and not settings.USE_TZ:
+        since = timezone.make_naive(since)
+    return JsonResponse(dashboard.get_delta(since))
+
+
 def detail(request, dataproduct_id):
     return HttpResponse("You're looking at dataproduct %s." % dataproduct_id)
 
 
 # --- class based views ---
-class LocationListView(generics.ListCreateAPIView):
+class SparseFieldsQuerysetMixin:
+    """
+    Support ?fields=id,taskID on GET requests. Only the requested fields are serialized
+    (by serializers.SparseFieldsMixin), and only the requested columns are read from the database.
+    The related objects of the requested fields are read in bulk with the plans of the view:
+    select_related_plan and prefetch_related_plan map a serializer field to its lookup,
+    so that a page costs the same number of queries, whatever its size.
+    annotate_plan maps a serializer field to the annotations that it reads.
+    """
+    select_related_plan = {}
+    prefetch_related_plan = {}
+    annotate_plan = {}
+
+    def get_requested_fields(self):
+        if self.request.method != 'GET':
+            return None
+
+        fields = self.request.query_params.get('fields')
+        if not fields:
+            return None
+
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in self.get_serializer_class()().fields]
+        if unknown:
+            raise ValidationError({'error': "unknown fields: " + ", ".join(unknown)})
+        return fields
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_requested_fields()
+        if fields:
+            kwargs['fields'] = fields
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        fields = self.get_requested_fields()
+        if fields:
+            # the id and the pagination key are always needed, and the columns that the fields are read from
+            columns = set(field.name for field in queryset.model._meta.concrete_fields)
+            serializer_fields = self.get_serializer_class()().fields
+            sources = set(serializer_fields[field].source for field in fields if field in serializer_fields)
+            needed = set(fields) | sources | {'id', getattr(self, 'keyset_field', DEFAULT_KEYSET_FIELD)}
+            queryset = queryset.only(*(columns & needed))
+
+        if self.request.method == 'GET':
+            select_related = [lookup for field, lookup in self.select_related_plan.items()
+                              if not fields or field in fields]
+            if select_related:
+                queryset = queryset.select_related(*select_related)
+
+            prefetch_related = [lookup for field, lookup in self.prefetch_related_plan.items()
+                                if not fields or field in fields]
+            if prefetch_related:
+                queryset = queryset.prefetch_related(*prefetch_related)
+
+            for field, annotations in self.annotate_plan.items():
+                if not fields or field in fields:
+                    queryset = queryset.annotate(**annotations)
+        return queryset
+
+
+class ConditionalGetMixin:
+    """
+    Answer a GET with an ETag from the change counter in the database (see services/changes.py).
+    When the client sends the same ETag back in 'If-None-Match' nothing has changed since, and
+    '304 Not Modified' is returned after reading only the counter, without serializing anything.
+    """
+    def get_etag(self, request):
+        # the same url can give a different result for a different format (json or the browsable api)
+        key = str(changes.get_counter()) + request.get_full_path() + request.META.get('HTTP_ACCEPT', '')
+        return 'W/"' + hashlib.md5(key.encode('utf-8')).hexdigest() + '"'
+
+    def get(self, request, *args, **kwargs):
+        etag = self.get_etag(request)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+        return response
+
+
+class BulkCreateMixin:
+    """
+    Accept a json list of objects in a POST, and create them all in one transaction.
+    A single json object is still created the normal way.
+    """
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        # the relations are created by the bulk create itself
+        rows = []
+        for row in serializer.validated_data:
+            rows.append({key: value for key, value in row.items() if not isinstance(value, list)})
+
+        ids = transitions.bulk_create_taskobjects(self.model, rows)
+        return Response({'ids': ids}, status=status.HTTP_201_CREATED)
+
+
+class ChangedOnWriteMixin:
+    """
+    Bump the change counter after a create, update or delete of the objects that are not written
+    by the transitions service (like locations), so that the ETags of the lists change.
+    """
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        transaction.on_commit(changes.bump)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        transaction.on_commit(changes.bump)
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        transaction.on_commit(changes.bump)
+
+
+class FirstMatchMixin:
+    """
+    Look up an object by a field that is not unique (like a taskID or a filename).
+    When several objects match, the first one (lowest id) is used, like the clients always did.
+    """
+    def get_object(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        obj = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]}).order_by('id').first()
+        if obj is None:
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+
+class LocationListView(ConditionalGetMixin, SparseFieldsQuerysetMixin, ChangedOnWriteMixin, generics.ListCreateAPIView):
     model = Location
     queryset = Location.objects.all()
     serializer_class = LocationSerializer
-
-# ex: /atdb/dataproducts/5/
-class LocationDetailsView(generics.RetrieveUpdateDestroyAPIView):
+    pagination_class = KeysetPagination
+    keyset_field = 'timestamp'
+
+# ex: /atdb/locations/5/
+# locations are shared by all objects that have been there. A rename or delete also clears the cached
+# location ids of the transitions service (see signals.py).
+class LocationDetailsView(ConditionalGetMixin, SparseFieldsQuerysetMixin, ChangedOnWriteMixin,
+                          generics.RetrieveUpdateDestroyAPIView):
     model = Location
     queryset = Location.objects.all()
     serializer_class = LocationSerializer
 
-class StatusListView(generics.ListCreateAPIView):
+# the status history is written by the transitions service, a status that is written here does not change
+# the status of its object.
+class StatusListView(ConditionalGetMixin, SparseFieldsQuerysetMixin, ChangedOnWriteMixin, generics.ListCreateAPIView):
     model = Status
     queryset = Status.objects.all()
     serializer_class = StatusSerializer
+    pagination_class = KeysetPagination
+    keyset_field = 'timestamp'
 
-class StatusDetailsView(generics.RetrieveUpdateDestroyAPIView):
+class StatusDetailsView(ConditionalGetMixin, SparseFieldsQuerysetMixin, ChangedOnWriteMixin,
+                        generics.RetrieveUpdateDestroyAPIView):
     model = Status
     queryset = Status.objects.all()
     serializer_class = StatusSerializer
 
 # ex: /atdb/dataproducts?status__in=created,archived
 class DataProductFilter(filters.FilterSet):
+    # ex: /atdb/dataproducts?my_location=datawriter
+    my_location = filters.CharFilter(field_name='my_location__location')
+
+    # the observation used to be a many-to-many relation named 'generatedByObservation', the names still work.
+    # ex: /atdb/dataproducts?generatedByObservation__taskID=180223003
+    generatedByObservation__taskID = filters.CharFilter(field_name='parent_observation__taskID')
+    generatedByObservation__taskID__in = filters.BaseInFilter(field_name='parent_observation__taskID')
+    generatedByObservation__taskID__icontains = filters.CharFilter(field_name='parent_observation__taskID',
+                                                                   lookup_expr='icontains')
 
     class Meta:
         model = DataProduct
@@ -64,17 +244,31 @@ class DataProductFilter(filters.FilterSet):
             'filename': ['exact', 'icontains'],
             'taskID': ['exact', 'icontains'],
             'creationTime': ['gt', 'lt', 'gte', 'lte', 'contains', 'exact'],
-            'generatedByObservation__taskID': ['exact', 'in', 'icontains'],
+            'modifiedTime': ['gt', 'lt', 'gte', 'lte'],
+            'parent_observation': ['exact'],
             'my_status': ['exact', 'icontains'],
-            'my_locations': ['exact', 'icontains'],
         }
 
 
+# the related objects that are serialized with a dataproduct, per field.
+# The hyperlinks only need the id of the related objects.
+DATAPRODUCT_SELECT_RELATED_PLAN = {
+    'my_location': 'my_location',
+}
+DATAPRODUCT_PREFETCH_RELATED_PLAN = {
+    'locations': Prefetch('locations', queryset=Location.objects.only('id')),
+    'statusHistory': 'statusHistory',
+}
+
+
 # ex: /atdb/dataproducts/
-class DataProductListView(generics.ListCreateAPIView):
+class DataProductListView(ConditionalGetMixin, SparseFieldsQuerysetMixin, BulkCreateMixin, generics.ListCreateAPIView):
     model = DataProduct
     queryset = DataProduct.objects.all()
     serializer_class = DataProductSerializer
+    select_related_plan = DATAPRODUCT_SELECT_RELATED_PLAN
+    prefetch_related_plan = DATAPRODUCT_PREFETCH_RELATED_PLAN
+    pagination_class = KeysetPagination
 
     # using the Django Filter Backend - https://django-filter.readthedocs.io/en/latest/index.html
     filter_backends = (filters.DjangoFilterBackend,)
@@ -82,13 +276,66 @@ class DataProductListView(generics.ListCreateAPIView):
 
 
 # ex: /atdb/dataproducts/5/
-class DataProductDetailsView(generics.RetrieveUpdateDestroyAPIView):
+class DataProductDetailsView(ConditionalGetMixin, SparseFieldsQuerysetMixin, generics.RetrieveUpdateDestroyAPIView):
     model = DataProduct
     queryset = DataProduct.objects.all()
     serializer_class = DataProductSerializer
+    select_related_plan = DATAPRODUCT_SELECT_RELATED_PLAN
+    prefetch_related_plan = DATAPRODUCT_PREFETCH_RELATED_PLAN
+
+    def perform_destroy(self, instance):
+        transitions.delete_taskobjects(DataProduct.objects.filter(id=instance.id))
+
+
+# ex: /atdb/dataproducts/filename/WSRTA180223003_B000.MS/
+class DataProductByFilenameView(FirstMatchMixin, DataProductDetailsView):
+    lookup_field = 'filename'
+
+
+# ex: /atdb/dataproducts/taskid/180223003/
+class DataProductsByTaskIDView(generics.GenericAPIView):
+    """
+    Set the status of all dataproducts of a taskID in one request.
+    ex: PUT /atdb/dataproducts/taskid/180223003/ {"new_status": "valid"}
+    """
+    queryset = DataProduct.objects.all()
+
+    def put(self, request, taskID, format=None):
+        if not isinstance(request.data, dict):
+            return Response({'error': "expected only 'new_status'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        new_status = request.data.get('new_status')
+        if not new_status or set(request.data.keys()) - {'new_status'}:
+            return Response({'error': "expected only 'new_status'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        ids = transitions.bulk_set_status(self.get_queryset().filter(taskID=taskID), new_status)
+        return Response({'taskID': taskID, 'new_status': new_status, 'count': len(ids)})
+
+    def patch(self, request, taskID, format=None):
+        return self.put(request, taskID, format)
+
+    def delete(self, request, taskID, format=None):
+        count = transitions.delete_taskobjects(self.get_queryset().filter(taskID=taskID))
+        return Response({'taskID': taskID, 'deleted': count})
+
+
+class DeleteRangeView(generics.GenericAPIView):
+    """
+    Delete a range of objects (first and last id included) in one transaction.
+    ex: DELETE /atdb/dataproducts/range/11/15/
+    """
+    def delete(self, request, first, last, format=None):
+        count = transitions.delete_taskobjects(self.get_queryset().filter(id__gte=first, id__lte=last))
+        return Response({'deleted': count})
+
+
+# ex: /atdb/dataproducts/range/11/15/
+class DataProductDeleteRangeView(DeleteRangeView):
+    queryset = DataProduct.objects.all()
 
 
 class ObservationFilter(filters.FilterSet):
+    my_location = filters.CharFilter(field_name='my_location__location')
 
     class Meta:
         model = Observation
@@ -99,15 +346,35 @@ class ObservationFilter(filters.FilterSet):
             'my_status': ['exact', 'icontains'],
             'taskID': ['exact', 'icontains'],
             'creationTime': ['gt', 'lt', 'gte', 'lte', 'contains', 'exact'],
-            'my_locations': ['exact', 'icontains'],
+            'modifiedTime': ['gt', 'lt', 'gte', 'lte'],
         }
 
 
+# the related objects that are serialized with an observation, per field.
+OBSERVATION_SELECT_RELATED_PLAN = {
+    'my_location': 'my_location',
+}
+OBSERVATION_PREFETCH_RELATED_PLAN = {
+    'locations': Prefetch('locations', queryset=Location.objects.only('id')),
+    'statusHistory': 'statusHistory',
+    'generatedDataProducts': Prefetch('dataproducts', queryset=DataProduct.objects.only('id', 'parent_observation')),
+}
+OBSERVATION_ANNOTATE_PLAN = {
+    'dps_count': {'summary_dps_count': Subquery(
+        ObservationSummary.objects.filter(taskID=OuterRef('taskID')).order_by().values('taskID')
+        .annotate(dps_count=Sum('dps_count')).values('dps_count'))},
+}
+
+
 # ex: /atdb/observations/
-class ObservationListView(generics.ListCreateAPIView):
+class ObservationListView(ConditionalGetMixin, SparseFieldsQuerysetMixin, BulkCreateMixin, generics.ListCreateAPIView):
     model = Observation
     queryset = Observation.objects.all()
     serializer_class = ObservationSerializer
+    select_related_plan = OBSERVATION_SELECT_RELATED_PLAN
+    prefetch_related_plan = OBSERVATION_PREFETCH_RELATED_PLAN
+    annotate_plan = OBSERVATION_ANNOTATE_PLAN
+    pagination_class = KeysetPagination
 
     # using the Django Filter Backend - https://django-filter.readthedocs.io/en/latest/index.html
     filter_backends = (filters.DjangoFilterBackend,)
@@ -115,10 +382,282 @@ class ObservationListView(generics.ListCreateAPIView):
 
 
 # ex: /atdb/observations/5/
-class ObservationDetailsView(generics.RetrieveUpdateDestroyAPIView):
+class ObservationDetailsView(ConditionalGetMixin, SparseFieldsQuerysetMixin, generics.RetrieveUpdateDestroyAPIView):
     model = Observation
     queryset = Observation.objects.all()
     serializer_class = ObservationSerializer
+    select_related_plan = OBSERVATION_SELECT_RELATED_PLAN
+    prefetch_related_plan = OBSERVATION_PREFETCH_RELATED_PLAN
+    annotate_plan = OBSERVATION_ANNOTATE_PLAN
+
+    def perform_destroy(self, instance):
+        transitions.delete_taskobjects(Observation.objects.filter(id=instance.id))
+
+
+# ex: /atdb/observations/taskid/180223003/
+class ObservationByTaskIDView(FirstMatchMixin, ObservationDetailsView):
+    """
+    An observation by its taskID. A DELETE removes the observation together with all its dataproducts.
+    """
+    lookup_field = 'taskID'
+
+    def destroy(self, request, *args, **kwargs):
+        taskID = kwargs['taskID']
+        observations, dataproducts = transitions.delete_taskid(taskID)
+        if observations == 0 and dataproducts == 0:
+            raise Http404
+        return Response({'taskID': taskID, 'observations': observations, 'dataproducts': dataproducts})
+
+
+# ex: /atdb/observations/range/11/15/
+class ObservationDeleteRangeView(DeleteRangeView):
+    queryset = Observation.objects.all()
+
+
+class ExportView(generics.GenericAPIView):
+    """
+    Stream all (filtered) objects as NDJSON, one json object per line.
+    ex: /atdb/dataproducts/export?taskID=180000010&chunk_size=5000
+    """
+    filter_backends = (filters.DjangoFilterBackend,)
+
+    def get(self, request, format=None):
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            chunk_size = int(request.query_params.get('chunk_size', export.DEFAULT_CHUNK_SIZE))
+        except ValueError:
+            chunk_size = export.DEFAULT_CHUNK_SIZE
+
+        return StreamingHttpResponse(export.export_ndjson(queryset, max(chunk_size, 1)),
+                                     content_type='application/x-ndjson')
+
+
+# ex: /atdb/dataproducts/export
+class DataProductExportView(ExportView):
+    model = DataProduct
+    queryset = DataProduct.objects.all()
+    filter_class = DataProductFilter
+
+
+# ex: /atdb/observations/export
+class ObservationExportView(ExportView):
+    model = Observation
+    queryset = Observation.objects.all()
+    filter_class = ObservationFilter
+
+
+def summary_as_dict(summaries):
+    """
+    Sum the dataproduct counts and sizes per status.
+    :param (in) summaries: ObservationSummary queryset
+    """
+    statuses = {}
+    for my_status, dps_count, size in summaries.filter(dps_count__gt=0).order_by().values_list('status').annotate(
+            Sum('dps_count'), Sum('size')):
+        statuses[my_status] = {'dps_count': dps_count, 'size': size}
+
+    return {
+        'dps_count': sum(my_summary['dps_count'] for my_summary in statuses.values()),
+        'size': sum(my_summary['size'] for my_summary in statuses.values()),
+        'status': statuses,
+    }
+
+
+# ex: /atdb/observations/5/summary
+class ObservationSummaryView(ConditionalGetMixin, generics.RetrieveAPIView):
+    """
+    The number of dataproducts of an observation and their total size, per status.
+    """
+    model = Observation
+    queryset = Observation.objects.only('id', 'taskID')
+
+    def retrieve(self, request, *args, **kwargs):
+        observation = self.get_object()
+        summary = summary_as_dict(ObservationSummary.objects.filter(taskID=observation.taskID))
+        summary['id'] = observation.id
+        summary['taskID'] = observation.taskID
+        return Response(summary)
+
+
+# ex: /atdb/summary
+class SummaryView(ConditionalGetMixin, generics.RetrieveAPIView):
+    """
+    The number of dataproducts and their total size per status, over all observations.
+    """
+    model = ObservationSummary
+    queryset = ObservationSummary.objects.all()
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(summary_as_dict(self.get_queryset()))
+
+
+class ClaimView(generics.GenericAPIView):
+    """
+    Claim objects for a worker: move up to 'count' objects from 'from_status' to 'to_status' and return them.
+    Objects that are claimed by another worker at the same time are skipped. The claim expires after
+    'lease' seconds, unless the status has changed again before that.
+    The filters of the list view can be used to claim from a subset, like ?taskID=180223003
+    ex: POST /atdb/dataproducts/claim {"from_status": "valid", "to_status": "ingesting", "count": 10, "worker": "ingest1"}
+    """
+    filter_backends = (filters.DjangoFilterBackend,)
+    annotate_plan = {}
+
+    def post(self, request, format=None):
+        data = request.data
+        try:
+            from_status = data['from_status']
+            to_status = data['to_status']
+            worker = data['worker']
+            count = int(data.get('count', 1))
+            lease = int(data.get('lease', transitions.DEFAULT_LEASE))
+            if count < 1 or lease < 1:
+                raise ValueError
+        except (KeyError, ValueError, TypeError, AttributeError):
+            return Response({'error': "expected 'from_status', 'to_status', 'worker' and optional 'count' and 'lease' "
+                                      "(both at least 1)"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # larger claims are cut to the maximum, the worker can claim again
+        count = min(count, transitions.MAX_CLAIM_COUNT)
+
+        ids = transitions.claim_taskobjects(self.filter_queryset(self.get_queryset()),
+                                            from_status, to_status, count, worker, lease)
+
+        claimed = self.model.objects.filter(id__in=ids).order_by('id')
+        claimed = claimed.select_related(*self.select_related_plan.values())
+        claimed = claimed.prefetch_related(*self.prefetch_related_plan.values())
+        for annotations in self.annotate_plan.values():
+            claimed = claimed.annotate(**annotations)
+        return Response(self.get_serializer(claimed, many=True).data)
+
+
+class RenewClaimView(generics.GenericAPIView):
+    """
+    Renew the claims of a worker that needs more time than its lease, the claims expire 'lease' seconds from now.
+    The filters of the list view select the claims to renew, like ?my_status=ingesting&taskID=180223003
+    ex: POST /atdb/dataproducts/claim/renew {"worker": "ingest1", "lease": 3600}
+    => {"ids": [5, 6, 7]}
+    """
+    filter_backends = (filters.DjangoFilterBackend,)
+
+    def post(self, request, format=None):
+        data = request.data
+        try:
+            worker = data['worker']
+            lease = int(data.get('lease', transitions.DEFAULT_LEASE))
+            if lease < 1:
+                raise ValueError
+        except (KeyError, ValueError, TypeError, AttributeError):
+            return Response({'error': "expected 'worker' and optional 'lease' (at least 1)"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        ids = transitions.renew_claims(self.filter_queryset(self.get_queryset()), lease, worker)
+        return Response({'ids': ids})
+
+
+# ex: /atdb/dataproducts/claim
+class DataProductClaimView(ClaimView):
+    model = DataProduct
+    queryset = DataProduct.objects.all()
+    serializer_class = DataProductSerializer
+    filter_class = DataProductFilter
+    select_related_plan = DATAPRODUCT_SELECT_RELATED_PLAN
+    prefetch_related_plan = DATAPRODUCT_PREFETCH_RELATED_PLAN
+
+
+# ex: /atdb/observations/claim
+class ObservationClaimView(ClaimView):
+    model = Observation
+    queryset = Observation.objects.all()
+    serializer_class = ObservationSerializer
+    filter_class = ObservationFilter
+    select_related_plan = OBSERVATION_SELECT_RELATED_PLAN
+    prefetch_related_plan = OBSERVATION_PREFETCH_RELATED_PLAN
+    annotate_plan = OBSERVATION_ANNOTATE_PLAN
+
+
+# ex: /atdb/dataproducts/claim/renew
+class DataProductRenewClaimView(RenewClaimView):
+    model = DataProduct
+    queryset = DataProduct.objects.all()
+    filter_class = DataProductFilter
+
+
+# ex: /atdb/observations/claim/renew
+class ObservationRenewClaimView(RenewClaimView):
+    model = Observation
+    queryset = Observation.objects.all()
+    filter_class = ObservationFilter
+
+
+class ResolveView(generics.GenericAPIView):
+    """
+    Find the objects that exist for a list of natural keys (like filenames or taskIDs), in one query.
+    Returns the id per existing key, the keys that are missing are not in the result.
+    ex: POST /atdb/dataproducts/resolve {"key": "filename", "values": ["WSRTA180223003_B000.MS", ...]}
+    => {"key": "filename", "ids": {"WSRTA180223003_B000.MS": 5}}
+    """
+    resolve_fields = ()
+
+    def post(self, request, format=None):
+        data = request.data if isinstance(request.data, dict) else {}
+        key = data.get('key')
+        values = data.get('values')
+        if key not in self.resolve_fields or not isinstance(values, list):
+            return Response({'error': "expected 'key' (one of " + ", ".join(self.resolve_fields) + ") and a list of 'values'"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # the keys are strings, a number is accepted as its string (a taskID). Anything else (a bool, null, a list
+        # or an object) can not be a key, and would fail in the query or give an unhashable key in the result.
+        invalid = [value for value in values if isinstance(value, bool) or not isinstance(value, (str, int))]
+        if invalid:
+            return Response({'error': "the 'values' must be strings or integers, not: " + ", ".join(map(repr, invalid[:10]))},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # a key with several objects resolves to the first one (lowest id), like the lookups by taskID and filename
+        rows = self.get_queryset().filter(**{key + '__in': values}).order_by('-id').values_list(key, 'id')
+        return Response({'key': key, 'ids': dict(rows)})
+
+
+# ex: /atdb/dataproducts/resolve
+class DataProductResolveView(ResolveView):
+    queryset = DataProduct.objects.all()
+    resolve_fields = ('filename', 'name')
+
+
+# ex: /atdb/observations/resolve
+class ObservationResolveView(ResolveView):
+    queryset = Observation.objects.all()
+    resolve_fields = ('taskID', 'name')
+
+
+# ex: /atdb/changes?cursor=1234&timeout=10&status=valid&task_type=dataproduct&taskID=180223003
+class ChangesView(generics.GenericAPIView):
+    """
+    The change feed: the status transitions after 'cursor', in the order that they happened.
+    Use the returned 'cursor' for the next request. Without a cursor the feed starts at the last transition.
+    With 'timeout' the request waits (at most changes.MAX_TIMEOUT seconds) until there are new transitions.
+    Note that every waiting request holds a worker of the webserver, with many followers gunicorn should
+    run with threads (--threads) or async workers. Transitions of very slow transactions can be missed,
+    see changes.GAP_TIMEOUT.
+    """
+    model = Status
+    queryset = Status.objects.all()
+
+    def get(self, request, format=None):
+        params = request.query_params
+        try:
+            cursor = int(params['cursor']) if 'cursor' in params else changes.get_last_cursor()
+            limit = min(max(int(params.get('limit', changes.DEFAULT_LIMIT)), 1), changes.MAX_LIMIT)
+            timeout = float(params.get('timeout', 0))
+            if not math.isfinite(timeout):
+                raise ValueError(timeout)
+        except ValueError:
+            return Response({'error': "'cursor', 'limit' and 'timeout' should be numbers"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        cursor, results = changes.get_changes(cursor, limit, timeout, status=params.get('status'),
+                                              task_type=params.get('task_type'), taskID=params.get('taskID'))
+        return Response({'cursor': cursor, 'results': results})
 
 
 class ObservationValidateView(generics.UpdateAPIView):
@@ -128,7 +667,7 @@ class ObservationValidateView(generics.UpdateAPIView):
     def get(self, request, pk, format=None):
         observation = self.get_object()
         observation.new_status = 'valid'
-        observation.save()
+        transitions.save_taskobject(observation)
         return redirect('/atdb/')
 
 
@@ -136,7 +675,7 @@ def BasicObservationValidateView(request,pk):
     model = Observation
     observation = Observation.objects.get(pk=pk)
     observation.new_status = 'valid'
-    observation.save()
+    transitions.save_taskobject(observation)
 
     return redirect('/atdb/')
 
@@ -148,9 +687,7 @@ def ObservationSetStatusDataProducts(request,pk,new_status):
     taskID = observation.taskID
 
     dataproducts = DataProduct.objects.filter(taskID=taskID)
-    for dataproduct in dataproducts:
-        dataproduct.new_status = new_status
-        dataproduct.save()
+    transitions.bulk_set_status(dataproducts, new_status)
 
     return redirect('/atdb/')
 
@@ -162,7 +699,7 @@ class DataProductValidateView(generics.UpdateAPIView):
     def get(self, request, pk, format=None):
         dataproduct = self.get_object()
         dataproduct.new_status = 'valid'
-        dataproduct.save()
+        transitions.save_taskobject(dataproduct)
         return redirect('/atdb/')
 
 
@@ -170,6 +707,6 @@ def DataProductSetStatusView(request,pk,new_status):
     model = DataProduct
     dataproduct = DataProduct.objects.get(pk=pk)
     dataproduct.new_status = new_status
-    dataproduct.save()
+    transitions.save_taskobject(dataproduct)
 
     return redirect('/atdb/')
\ No newline at end of file
@@ -4,6 +4,7 @@ import requests
 import json
 import argparse
 from datetime import *
+from atdb_interface import create_session
 
 """
 alta_interface.py : a commandline tool to inferface with the ALTA REST API.
@@ -25,6 +26,11 @@ ALTA_SYSTEM_USER = "backend-irods"
 DEFAULT_CREDENTIALS_FILE = "/etc/irods/" + ALTA_SYSTEM_USER + ".secret"
 TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
 
+# the (TLS) connections to ALTA are kept open and reused
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 60
+DEFAULT_RETRIES = 3
+
 class ALTAException(Exception):
     """
     Exception with message.
@@ -41,13 +47,17 @@ class ALTA:
     Calibrators class, use to parse SIP and update the backend database
     through REST API calls.
     """
-    def __init__(self, host, username, password, verbose=True):
+    def __init__(self, host, username, password, verbose=True, pool_size=DEFAULT_POOL_SIZE,
+                 timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES):
         """
         Constructor.
         :param host: the host name of the backend.
         :param username: The username known in Django Admin.
         :param verbose: more information runtime.
         :param header: Request header for ALTA REST requests with token authentication.
+        :param pool_size: the number of connections to ALTA that are kept open.
+        :param timeout: the number of seconds to wait for ALTA per request.
+        :param retries: the number of retries of a failed idempotent request (GET, PUT, DELETE).
         """
         self.host = host
         if (not self.host.endswith('/')):
@@ -56,6 +66,8 @@ class ALTA:
         self.username = username
         self.password = password
         self.verbose = verbose
+        self.timeout = timeout
+        self.session = create_session(pool_size, retries)
 
         try:
             self.header = self.__get_request_header(username, password)
@@ -110,7 +122,7 @@ class ALTA:
             else:
                 payload['password'] = password
 
-        response = requests.request("POST", url, data=payload)
+        response = self.session.request("POST", url, data=payload, timeout=self.timeout)
         self.verbose_print("[POST " + response.url + "]")
         self.verbose_print("response.txt: " + response.text)
 
@@ -174,7 +186,7 @@ class ALTA:
         # create the querystring, external_ref is the mapping of this element to the alta datamodel lookup field
         querystring = {"runId": runId}
 
-        response = requests.request("GET", url, headers=self.header, params=querystring)
+        response = self.session.request("GET", url, headers=self.header, params=querystring, timeout=self.timeout)
         self.verbose_print("[GET " + response.url + "]")
 
         try:
@@ -196,7 +208,7 @@ class ALTA:
 
         url = self.host + "projects"
 
-        response = requests.request("GET", url, headers=self.header)
+        response = self.session.request("GET", url, headers=self.header, timeout=self.timeout)
         self.verbose_print("GET Response: " + str(response.status_code) + ", " + str(response.reason))
 
         try:
@@ -225,7 +237,7 @@ class ALTA:
         field = params[1]
 
         url = self.host + resource + "?" + field + "=" + value
-        response = requests.request("GET", url, headers=self.header)
+        response = self.session.request("GET", url, headers=self.header, timeout=self.timeout)
         self.verbose_print("[GET " + response.url + "]")
         self.verbose_print("Response: " + str(response.status_code) + ", " + str(response.reason))
 
@@ -262,7 +274,7 @@ class ALTA:
         url = self.host + resource + "/" + str(id) + "/"
         self.verbose_print(('url: ' + url))
 
-        response = requests.request("GET", url, headers=self.header)
+        response = self.session.request("GET", url, headers=self.header, timeout=self.timeout)
         self.verbose_print("[GET " + response.url + "]")
         self.verbose_print("Response: " + str(response.status_code) + ", " + str(response.reason))
 
@@ -306,7 +318,7 @@ class ALTA:
             payload[field]=value
             payload = self.encodePayload(payload)
         try:
-            response = requests.request("PUT", url, data=payload, headers=self.header)
+            response = self.session.request("PUT", url, data=payload, headers=self.header, timeout=self.timeout)
             self.verbose_print("[PUT " + response.url + "]")
             self.verbose_print("Response: " + str(response.status_code) + ", " + str(response.reason))
         except:
@@ -324,7 +336,7 @@ class ALTA:
         self.verbose_print(('DELETE: ' + url))
 
         try:
-            response = requests.request("DELETE", url, headers=self.header)
+            response = self.session.request("DELETE", url, headers=self.header, timeout=self.timeout)
             self.verbose_print("[DELETE " + response.url + "]")
             self.verbose_print("Response: " + str(response.status_code) + ", " + str(response.reason))
         except:
@@ -355,7 +367,7 @@ class ALTA:
 
         self.verbose_print("payload: " + str(payload))
 
-        response = requests.post(url, files=files, data=payload, headers=my_header)
+        response = self.session.post(url, files=files, data=payload, headers=my_header, timeout=self.timeout)
         self.verbose_print("[POST " + response.url + "]")
         self.verbose_print("Response: " + str(response.status_code) + ", " + str(response.reason))
 
@@ -388,7 +400,7 @@ class ALTA:
             payload[field] = file_url
             payload = self.encodePayload(payload)
 
-        response = requests.request("PUT", url, data=payload, headers=self.header)
+        response = self.session.request("PUT", url, data=payload, headers=self.header, timeout=self.timeout)
         self.verbose_print("[PUT " + response.url + "]")
         self.verbose_print("Response: " + str(response.status_code) + ", " + str(response.reason))
 
@@ -0,0 +1,252 @@
+#!/usr/bin/python3
+import asyncio
+import json
+
+import atdb_interface
+from atdb_interface import ATDBException, ATDB_HEADER, DEFAULT_BACKEND_HOST, DEFAULT_PAGE_SIZE, \
+    DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT, DEFAULT_RETRIES, DEFAULT_BACKOFF
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+"""
+atdb_async.py : an asyncio client for the ATDB REST API, with the same operations as atdb_interface.py.
+Many requests can be in flight from one event loop, for example:
+
+    async with AsyncATDB(host) as atdb:
+        ids = [id async for id in atdb.do_GET_LIST(key='dataproducts:id', query='my_status=ingesting')]
+        statuses = await asyncio.gather(*[atdb.do_GET(key='dataproducts:my_status', id=id) for id in ids])
+
+This needs aiohttp (pip install aiohttp).
+"""
+
+# the number of requests that can be in flight at the same time
+DEFAULT_CONCURRENCY = 100
+
+# the requests that can safely be done again when the connection fails
+IDEMPOTENT_METHODS = ('GET', 'PUT', 'DELETE')
+
+
+class AsyncATDB:
+    """
+    Asyncio version of the ATDB class. The connections to the backend are pooled,
+    and at most 'concurrency' requests are in flight at the same time.
+    """
+    def __init__(self, host=DEFAULT_BACKEND_HOST, verbose=False, pool_size=DEFAULT_POOL_SIZE,
+                 concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES):
+        """
+        Constructor.
+        :param host: the host name of the backend.
+        :param verbose: more information runtime.
+        :param pool_size: the number of connections to the backend that are kept open.
+        :param concurrency: the maximum number of requests that are in flight at the same time.
+        :param timeout: the number of seconds to wait for the backend per request.
+        :param retries: the number of retries of a failed idempotent request (GET, PUT, DELETE).
+        """
+        if aiohttp is None:
+            raise (ATDBException("ERROR: the asyncio client needs aiohttp, install it with 'pip install aiohttp'"))
+
+        self.host = host
+        if (not self.host.endswith('/')):
+            self.host += '/'
+
+        self.verbose = verbose
+        self.header = ATDB_HEADER
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.concurrency = concurrency
+
+        # the session is created in the event loop, at the first request
+        self.session = None
+        self.semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """
+        Close the connections to the backend.
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def verbose_print(self, info_str):
+        """
+        Print info string if verbose is enabled (default False)
+        :param info_str: String to print
+        """
+        if self.verbose:
+            print(info_str)
+
+    # the payloads and urls are the same as for the synchronous client
+    jsonifyPayload = atdb_interface.ATDB.jsonifyPayload
+    encodePayload = atdb_interface.ATDB.encodePayload
+    get_object_url = atdb_interface.ATDB.get_object_url
+
+    # === Backend requests ================================================================================
+    async def request(self, method, url, **kwargs):
+        """
+        Do a http request to the backend. Idempotent requests are retried with an exponential backoff
+        when the connection fails or the backend answers 502, 503 or 504.
+        :param method: GET, PUT, POST or DELETE
+        :param url: the url of the request
+        :return: the http status code and the text of the response
+        """
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self.session = aiohttp.ClientSession(connector=connector, headers=self.header,
+                                                 timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+
+        attempt = 0
+        async with self.semaphore:
+            while True:
+                try:
+                    async with self.session.request(method, url, **kwargs) as response:
+                        text = await response.text()
+                        self.verbose_print("[" + method + " " + str(response.url) + "] " + str(response.status))
+                        if response.status not in (502, 503, 504):
+                            return response.status, text
+                        error = ATDBException("ERROR: " + str(response.status) + ", " + str(response.reason))
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as exp:
+                    error = ATDBException("ERROR: " + method + " " + url + " failed. " + repr(exp))
+
+                if method not in IDEMPOTENT_METHODS or attempt >= self.retries:
+                    raise (error)
+                await asyncio.sleep(DEFAULT_BACKOFF * 2 ** attempt)
+                attempt += 1
+
+    async def request_json(self, method, url, **kwargs):
+        """
+        Do a http request to the backend, and return the json result.
+        """
+        status, text = await self.request(method, url, **kwargs)
+        if status >= 400:
+            raise (ATDBException("ERROR: " + method + " " + url + ": " + str(status)))
+        return json.loads(text) if text else None
+
+    # ------------------------------------------------------------------------------#
+    #                                Main User functions                            #
+    # ------------------------------------------------------------------------------#
+
+    async def do_GET_ID(self, key, value):
+        """
+        Get the id based on a field value of a resource.
+        :param key: contains the name of the resource and the field to search on separated by a colon.
+        :param value: the value of the field to search on.
+        :return id, or '-1' when it is not found
+        """
+        resource, field = key.split(":")
+        results = await self.request_json("GET", self.host + resource + "/", params={field: value, 'fields': 'id'})
+        if isinstance(results, dict):
+            results = results['results']
+        if not results:
+            return '-1'
+        return results[0]['id']
+
+    async def do_GET(self, key, id=None, taskid=None, value=None, filename=None):
+        """
+        Get the value of one field of an object.
+        :param key: contains the name of the resource and the name of the field separated by a colon.
+        :param id: the database id of the object.
+        :param taskid (optional): when the taskid (of an activity) is known it can be used instead of id.
+        :param filename (optional): when the filename of a dataproduct is known it can be used instead of id.
+        """
+        resource, field = key.split(":")
+
+        if taskid!=None and resource=='dataproducts':
+            # the taskid url of the dataproducts is for all the dataproducts of the taskID, take the first one.
+            id = await self.do_GET_ID(key='dataproducts:taskID', value=taskid)
+            taskid = None
+
+        url = self.get_object_url(resource, id, taskid, filename)
+        results = await self.request_json("GET", url, params={'fields': field})
+        return results[field]
+
+    async def do_GET_LIST(self, key, query, page_size=DEFAULT_PAGE_SIZE):
+        """
+        Get the value of one field of a list of objects.
+        This is an async generator, the next page is fetched when the previous page has been consumed.
+        :param key: contains the name of the resource and the name of the field separated by a colon.
+        :param query: the query string, for example 'my_status=valid'
+        :param page_size: the number of objects per page
+        """
+        resource, field = key.split(":")
+        url = self.host + resource + "/?" + str(query) + "&page_size=" + str(page_size) + "&fields=" + field
+
+        while url:
+            results = await self.request_json("GET", url)
+            if isinstance(results, list):
+                # a backend without pagination returns all results at once
+                url = None
+            else:
+                url = results['next']
+                results = results['results']
+
+            for result in results:
+                yield result[field]
+
+    async def do_PUT(self, key, id=None, value=None, taskid=None, filename=None, all_of_taskid=False):
+        """
+        PUT a value to an existing field of a resource (table).
+        :param key: contains the name of the resource and the name of the field separated by a colon.
+        :param id: the database id of the object.
+        :param value: the value that has to be PUT in the key.
+        :param taskid (optional): when the taskid of an observation is known it can be used instead of id.
+                                  For dataproducts the value is PUT to the first dataproduct of the taskid.
+        :param filename (optional): when the filename of a dataproduct is known it can be used instead of id.
+        :param all_of_taskid (optional): PUT a new_status to all the dataproducts of the taskid in one request.
+        :return: the http status code
+        """
+        resource, field = key.split(":")
+        if all_of_taskid and (resource!='dataproducts' or field!='new_status' or taskid==None):
+            raise (ATDBException("ERROR: only a 'dataproducts:new_status' with a 'taskid' can be PUT to all the dataproducts of the taskid"))
+
+        if taskid!=None and resource=='dataproducts' and filename==None and not all_of_taskid:
+            # the taskid url of the dataproducts addresses all of them, a single dataproduct is PUT by id.
+            id = await self.do_GET_ID(key='dataproducts:taskID', value=taskid)
+            taskid = None
+
+        url = self.get_object_url(resource, id, taskid, filename)
+        status, text = await self.request("PUT", url, data=self.encodePayload({field: value}))
+        if status >= 400:
+            raise (ATDBException("ERROR: PUT " + url + ": " + str(status)))
+        return status
+
+    async def do_POST(self, resource, payload):
+        """
+        POST a new object to a resource (table).
+        :param resource: contains the name of the resource, for example 'observations', 'dataproducts'
+        :param payload: the payload in the same format as for atdb_interface.do_POST
+        :return: the id of the new object
+        """
+        url = self.host + resource + '/'
+        result = await self.request_json("POST", url, data=self.jsonifyPayload(payload))
+        return result['id']
+
+    async def do_DELETE(self, resource, id):
+        """
+        Delete an object, or a range of objects like 11..15
+        :param resource: contains the name of the resource, for example 'observations', 'dataproducts'
+        :param id: the database id of the object, or a range of id's like 11..15
+        """
+        if id == None:
+            raise (ATDBException("ERROR: no valid 'id' provided"))
+
+        if (str(id).find('..')>0):
+            s = id.split('..')
+            url = self.host + resource + "/range/" + str(int(s[0])) + "/" + str(int(s[1])) + "/"
+        else:
+            url = self.host + resource + "/" + str(int(id)) + "/"
+
+        status, text = await self.request("DELETE", url)
+        if status >= 400:
+            raise (ATDBException("ERROR: DELETE " + url + ": " + str(status)))
+        return status
@@ -1,6 +1,12 @@
 #!/usr/bin/python3
+import os
 import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import argparse
 from datetime import *
@@ -21,8 +27,23 @@ ATDB_HEADER = {
 }
 
 DEFAULT_BACKEND_HOST = "http://localhost:8000/atdb/"
+DEFAULT_PAGE_SIZE = 1000
+MAX_VALIDATORS = 1000
 TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
 
+# the connections to the backend are kept open and reused, per ATDB object
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 60
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+
+# the cache of taskID/filename => id
+DEFAULT_CACHE_SIZE = 10000
+DEFAULT_CACHE_TTL = 3600
+
+# the number of seconds that the backend holds a request of the change feed, well under the worker timeout
+DEFAULT_FOLLOW_TIMEOUT = 10
+
 class ATDBException(Exception):
     """
     Exception with message.
@@ -34,18 +55,129 @@ class ATDBException(Exception):
         return self.message
 
 
+def save_json(filename, data):
+    """
+    Save data as json to a file. The file is replaced at once, so that it is never half written.
+    :param filename: the file to save to
+    :param data: the data to save
+    """
+    with open(filename + '.tmp', 'w') as file:
+        json.dump(data, file)
+    os.replace(filename + '.tmp', filename)
+
+
+class NaturalKeyCache:
+    """
+    Cache of the database id per natural key, like the taskID of an observation or the filename of a dataproduct.
+    The least recently used keys are evicted when the cache is full, and the ids expire after 'ttl' seconds.
+    The cache can be saved to a file, to keep it between runs of the services.
+    """
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL, filename=None):
+        """
+        Constructor.
+        :param max_size: the maximum number of keys in the cache.
+        :param ttl: the number of seconds that an id is valid.
+        :param filename: (optional) the file to load the cache from and to save it to.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.filename = filename
+        self.hits = 0
+        self.misses = 0
+
+        # (resource, field, value) => (id, expiration time), in the order of use
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        if self.filename and os.path.exists(self.filename):
+            self.load()
+
+    def get(self, resource, field, value):
+        """
+        Return the cached id of an object, or None.
+        """
+        key = (resource, field, str(value))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] < datetime.now().timestamp():
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, resource, field, value, id):
+        with self.lock:
+            key = (resource, field, str(value))
+            self.entries[key] = (id, datetime.now().timestamp() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, resource, ids=None, field=None, value=None):
+        """
+        Remove the keys of deleted (or not found) objects from the cache.
+        :param resource: 'observations' or 'dataproducts'
+        :param ids: (optional) the database ids of the objects
+        :param field, value: (optional) the natural key of the objects
+        When neither ids nor a field is given, all the keys of the resource are removed.
+        """
+        everything = ids is None and field is None
+        ids = set(int(id) for id in ids) if ids else set()
+        with self.lock:
+            for key, (id, expires) in list(self.entries.items()):
+                if key[0] == resource and (everything or int(id) in ids or key[1:] == (field, str(value))):
+                    del self.entries[key]
+
+    def load(self):
+        try:
+            with open(self.filename) as file:
+                rows = json.load(file)
+        except (IOError, ValueError):
+            # start with an empty cache, it is rebuilt while it is used
+            return
+
+        now = datetime.now().timestamp()
+        for resource, field, value, id, expires in rows:
+            if expires > now:
+                self.entries[(resource, field, value)] = (id, expires)
+
+    def save(self):
+        """
+        Save the cache to its file, if it has one.
+        """
+        if not self.filename:
+            return
+
+        with self.lock:
+            rows = [[resource, field, value, id, expires]
+                    for (resource, field, value), (id, expires) in self.entries.items()]
+        save_json(self.filename, rows)
+
+    def __str__(self):
+        return "cache: " + str(len(self.entries)) + " keys, " + str(self.hits) + " hits, " + str(self.misses) + " misses"
+
+
 class ATDB:
     """
     Calibrators class, use to parse SIP and update the backend database
     through REST API calls.
     """
-    def __init__(self, host, verbose=False):
+    def __init__(self, host, verbose=False, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT,
+                 retries=DEFAULT_RETRIES, cache=None):
         """
         Constructor.
         :param host: the host name of the backend.
         :param username: The username known in Django Admin.
         :param verbose: more information runtime.
         :param header: Request header for Atdb REST requests with token authentication.
+        :param pool_size: the number of connections to the backend that are kept open.
+        :param timeout: the number of seconds to wait for the backend per request.
+        :param retries: the number of times that an idempotent request (GET, PUT, DELETE) is retried
+                        when the connection fails or the backend is unavailable.
+        :param cache: (optional) a NaturalKeyCache, to look up the ids of taskIDs and filenames only once.
         """
         self.host = host
         if (not self.host.endswith('/')):
@@ -53,6 +185,12 @@ class ATDB:
 
         self.verbose = verbose
         self.header = ATDB_HEADER
+        self.timeout = timeout
+        self.session = create_session(pool_size, retries)
+        self.cache = cache
+
+        # the ETag and the response of the previous GET per url, to poll without transferring unchanged results
+        self.validators = {}
 
     def verbose_print(self, info_str):
         """
@@ -63,6 +201,84 @@ class ATDB:
             print(info_str)
 
     # === Backend requests ================================================================================
+    def do_conditional_GET(self, url, params=None):
+        """
+        Do a http GET request, sending the ETag of the previous response to the same url back to the backend.
+        When nothing has changed the backend answers '304 Not Modified', and the previous response is used.
+        :param url: the url of the request
+        :param params: (optional) dict with the querystring
+        :return: the response, and its text (which is the previous text in case of a 304)
+        """
+        url = requests.Request('GET', url, params=params).prepare().url
+
+        header = dict(self.header)
+        etag, text = self.validators.get(url, (None, None))
+        if etag:
+            header['If-None-Match'] = etag
+
+        response = self.session.request("GET", url, headers=header, timeout=self.timeout)
+        self.verbose_print("[GET " + response.url + "]")
+        self.verbose_print("Response: " + str(response.status_code) + ", " + str(response.reason))
+
+        if response.status_code == 304 and text is not None:
+            return response, text
+
+        etag = response.headers.get('ETag')
+        if etag and response.status_code == 200:
+            if len(self.validators) >= MAX_VALIDATORS:
+                self.validators.clear()
+            self.validators[url] = (etag, response.text)
+        return response, response.text
+
+    def check_not_found(self, response, resource, id=None, taskid=None, filename=None):
+        """
+        Remove an object that the backend does not know (anymore) from the cache.
+        """
+        if self.cache and response.status_code == 404:
+            if id is not None:
+                self.cache.invalidate(resource, ids=[id])
+            if taskid is not None:
+                self.cache.invalidate(resource, field='taskID', value=taskid)
+            if filename is not None:
+                self.cache.invalidate(resource, field='filename', value=filename)
+
+    def save_cache(self):
+        """
+        Save the cache to its file, and show its statistics in verbose mode.
+        """
+        if self.cache:
+            self.cache.save()
+            self.verbose_print(str(self.cache))
+
+    def run_many(self, function, items, max_workers=DEFAULT_POOL_SIZE, group_by=None):
+        """
+        Call function(item) for a list of items, with at most max_workers requests at the same time.
+        :param function: the function to call per item, its return value is the result of the item
+        :param items: list of items
+        :param max_workers: the maximum number of requests at the same time
+        :param group_by: (optional) function that returns a key per item. The items with the same key are
+                         done one after another, in the order of the list. For example the PUTs to one object.
+        :return: list of (item, result, error) in the order of the items, the error is None on success.
+        """
+        results = [None] * len(items)
+
+        # the indexes of the items per group, a group is done by one thread
+        groups = {}
+        for index, item in enumerate(items):
+            key = group_by(item) if group_by else index
+            groups.setdefault(key, []).append(index)
+
+        def run_group(indexes):
+            for index in indexes:
+                try:
+                    results[index] = (items[index], function(items[index]), None)
+                except Exception as exp:
+                    results[index] = (items[index], None, str(exp))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(run_group, groups.values()))
+        return results
+
     def jsonifyPayload(self, payload):
         """
         {name:WSRTA180223003_B003.MS,filename:WSRTA180223003_B003.MS} =>
@@ -114,20 +330,43 @@ class ATDB:
         :runId runId:
         """
 
+        if self.cache:
+            id = self.cache.get(resource, 'taskID', taskid)
+            if id is not None:
+                return {'id': id}
+
         url = self.host + resource
         # create the querystring, external_ref is the mapping of this element to the alta datamodel lookup field
-        querystring = {"taskID": taskid}
+        querystring = {"taskID": taskid, "fields": "id"}
 
-        response = requests.request("GET", url, headers=self.header, params=querystring)
-        self.verbose_print("[GET " + response.url + "]")
+        response, text = self.do_conditional_GET(url, params=querystring)
 
         try:
-            results = json.loads(response.text)
+            results = json.loads(text)
+            if isinstance(results, dict):
+                results = results['results']
             taskobject = results[0]
-            return taskobject
         except:
             raise (ATDBException("ERROR: " + str(response.status_code) + ", " + str(response.reason)))
 
+        if self.cache:
+            self.cache.put(resource, 'taskID', taskid, taskobject['id'])
+        return taskobject
+
+    def get_object_url(self, resource, id=None, taskid=None, filename=None):
+        """
+        The url of an object, by its id, by the taskID of an observation or by the filename of a dataproduct.
+        For 'dataproducts' the taskid url addresses all the dataproducts of that taskID at once.
+        :param resource: contains the name of the resource, for example 'observations', 'dataproducts'
+        """
+        if filename!=None:
+            return self.host + resource + "/filename/" + str(filename) + "/"
+        if taskid!=None:
+            return self.host + resource + "/taskid/" + str(taskid) + "/"
+        if id==None:
+            raise (ATDBException("ERROR: no valid 'id', 'taskid' or 'filename' provided"))
+        return self.host + resource + "/" + str(id) + "/"
+
     # ------------------------------------------------------------------------------#
     #                                Main User functions                            #
     # ------------------------------------------------------------------------------#
@@ -147,27 +386,82 @@ class ATDB:
         resource = params[0]
         field = params[1]
 
-        url = self.host + resource + "?" + field + "=" + value
-        response = requests.request("GET", url, headers=self.header)
-        self.verbose_print("[GET " + response.url + "]")
-        self.verbose_print("Response: " + str(response.status_code) + ", " + str(response.reason))
+        if self.cache:
+            id = self.cache.get(resource, field, value)
+            if id is not None:
+                return id
+
+        url = self.host + resource + "?" + field + "=" + value + "&fields=id"
+        response, text = self.do_conditional_GET(url)
 
         try:
-            my_json = json.loads(response.text)
+            my_json = json.loads(text)
             result = my_json[0]
             id = result['id']
-            return id
         except:
             return '-1'
             #raise (ATDBException("ERROR: " + response.url + " not found."))
 
+        # only the existing objects are cached, a new object can appear at any time
+        if self.cache:
+            self.cache.put(resource, field, value, id)
+        return id
+
+
+    def do_GET_IDS(self, key, values):
+        """
+        Get the ids of the objects that exist for a list of field values of a resource, in one request.
+        :param key: contains the name of the resource and the field to search on separated by a colon,
+                    for example 'dataproducts:filename' or 'observations:taskID'
+        :param values: the list of values of the field to search for.
+        :return dict of value => id, for the values that exist.
+        """
+
+        # split key in resource and field
+        params = key.split(":")
+        resource = params[0]
+        field = params[1]
+
+        # only the values that are not in the cache are asked from the backend
+        ids = {}
+        values = [str(value) for value in values]
+        if self.cache:
+            for value in values:
+                id = self.cache.get(resource, field, value)
+                if id is not None:
+                    ids[value] = id
+            values = [value for value in values if value not in ids]
+
+        if not values:
+            return ids
+
+        url = self.host + resource + "/resolve"
+        self.verbose_print(('url: ' + url))
+
+        payload = json.dumps({'key': field, 'values': values})
+        try:
+            response = self.session.request("POST", url, data=payload, headers=self.header, timeout=self.timeout)
+            self.verbose_print("[POST " + response.url + "]")
+            self.verbose_print("Response: " + str(response.status_code) + ", " + str(response.reason))
+
+            results = json.loads(response.text)['ids']
+        except:
+            raise (ATDBException("ERROR: " + str(response.status_code) + ", " + str(response.reason)))
+
+        if self.cache:
+            for value, id in results.items():
+                self.cache.put(resource, field, value, id)
+        ids.update(results)
+        return ids
+
 
-    def do_GET(self, key, id, taskid, value):
+    def do_GET(self, key, id, taskid, value, filename=None):
         """
         Do a http GET request to the ATDB backend to find the value of one field of an object
         :param key: contains the name of the resource and the name of the field separated by a colon.
         :param id: the database id of the object.
         :param taskid (optional): when the taskid (of an activity) is known it can be used instead of id.
+        :param filename (optional): when the filename of a dataproduct is known it can be used instead of id.
         """
 
         # split key in resource and field
@@ -175,23 +469,20 @@ class ATDB:
         resource = params[0]
         field = params[1]
 
-        if taskid!=None:
+        if taskid!=None and resource=='dataproducts':
+            # the taskid url of the dataproducts is for all the dataproducts of the taskID, take the first one.
             taskObject = self.GET_TaskObjectByTaskId(resource, taskid)
             id = taskObject['id']
+            taskid = None
 
-        if id==None:
-            # give up and throw an exception.
-            raise (ATDBException("ERROR: no valid 'id' or 'taskid' provided"))
-
-        url = self.host + resource + "/" + str(id) + "/"
+        url = self.get_object_url(resource, id, taskid, filename) + "?fields=" + field
         self.verbose_print(('url: ' + url))
 
-        response = requests.request("GET", url, headers=self.header)
-        self.verbose_print("[GET " + response.url + "]")
-        self.verbose_print("Response: " + str(response.status_code) + ", " + str(response.reason))
+        response, text = self.do_conditional_GET(url)
+        self.check_not_found(response, resource, id, taskid, filename)
 
         try:
-            results = json.loads(response.text)
+            results = json.loads(text)
             value = results[field]
             return value
         except:
@@ -199,12 +490,13 @@ class ATDB:
 
 
     #  python atdb_interface.py -o GET_LIST --key observations:taskID --query status=valid
-    def do_GET_LIST(self, key, query):
+    def do_GET_LIST(self, key, query, page_size=DEFAULT_PAGE_SIZE):
         """
-        Do a http GET request to the ATDB backend to find the value of one field of an object
-        :param key: contains the name of the resource and the name of the field separated by a dot.
-        :param id: the database id of the object.
-        :param taskid (optional): when the taskid (of an activity) is known it can be used instead of id.
+        Do a http GET request to the ATDB backend to find the value of one field of a list of objects.
+        This is a generator, the results are fetched page by page while they are consumed.
+        :param key: contains the name of the resource and the name of the field separated by a colon.
+        :param query: the query string, for example 'my_status=valid'
+        :param page_size: the number of objects per page
         """
 
         # split key in resource and field
@@ -212,34 +504,75 @@ class ATDB:
         resource = params[0]
         field = params[1]
 
-        url = self.host + resource + "?" + str(query)
-        self.verbose_print(('url: ' + url))
+        url = self.host + resource + "?" + str(query) + "&page_size=" + str(page_size) + "&fields=" + field
 
-        response = requests.request("GET", url, headers=self.header)
-        self.verbose_print("[GET " + response.url + "]")
-        self.verbose_print("Response: " + str(response.status_code) + ", " + str(response.reason))
+        while url:
+            self.verbose_print(('url: ' + url))
 
-        try:
-            results = json.loads(response.text)
-            # loop through the list of results and extract the requested field (probably taskID),
-            # and add it to the return list.
-            list = []
-            for result in results:
-                value = result[field]
-                list.append(value)
-
-            return list
-        except:
-            raise (ATDBException("ERROR: " + str(response.status_code) + ", " + str(response.reason)))
+            response, text = self.do_conditional_GET(url)
+
+            try:
+                results = json.loads(text)
+                if isinstance(results, list):
+                    # a backend without pagination returns all results at once
+                    url = None
+                else:
+                    url = results['next']
+                    results = results['results']
+
+                # extract the requested field (probably taskID) from the results.
+                values = [result[field] for result in results]
+            except:
+                raise (ATDBException("ERROR: " + str(response.status_code) + ", " + str(response.reason)))
+
+            for value in values:
+                yield value
+
+
+    #  python atdb_interface.py -o FOLLOW --query status=valid&task_type=dataproduct
+    def follow(self, query='', cursor=None, timeout=DEFAULT_FOLLOW_TIMEOUT):
+        """
+        Follow the change feed of the ATDB backend. This is a generator that yields the status transitions
+        (id, taskObject, taskID, task_type, previous, status, location, timestamp) soon after they are committed.
+        The transitions of a transaction that takes very long to commit can be missed (see changes.GAP_TIMEOUT
+        in the backend), so check the status of the objects now and then when a missed transition matters.
+        :param query: (optional) the query string, for example 'status=valid&task_type=dataproduct'
+        :param cursor: (optional) the cursor to start after, by default only the new transitions are followed.
+        :param timeout: the number of seconds that the backend waits for new transitions per request,
+                        the backend waits at most 20 seconds.
+        """
+        url = self.host + "changes?" + str(query)
+        while True:
+            params = {'timeout': timeout}
+            if cursor is not None:
+                params['cursor'] = cursor
+
+            # the backend holds the request for at most 'timeout' seconds
+            response = self.session.request("GET", url, headers=self.header, params=params,
+                                            timeout=timeout + self.timeout)
+            self.verbose_print("[GET " + response.url + "]")
 
+            try:
+                results = json.loads(response.text)
+                cursor = results['cursor']
+                changes = results['results']
+            except (ValueError, KeyError):
+                raise (ATDBException("ERROR: " + str(response.status_code) + ", " + str(response.reason)))
 
-    def do_PUT(self, key, id, value, taskid):
+            for change in changes:
+                yield change
+
+    def do_PUT(self, key, id, value, taskid, filename=None, all_of_taskid=False):
         """
         PUT a value to an existing field of a resource (table).
+        The object is looked up by taskid or filename in the same request.
         :param key: contains the name of the resource and the name of the field separated by a dot. observations.description
         :param id: the database id of the object.
         :param value: the value that has to be PUT in the key. If omitted, an empty put will be done to trigger the signals.
         :param taskid (optional): when the taskid of an observation is known it can be used instead of id.
+                                  For dataproducts the value is PUT to the first dataproduct of the taskid.
+        :param filename (optional): when the filename of a dataproduct is known it can be used instead of id.
+        :param all_of_taskid (optional): PUT a new_status to all the dataproducts of the taskid in one request.
         """
 
         # split key in resource and field
@@ -251,25 +584,59 @@ class ATDB:
             resource = key
             field = None
 
-        if taskid!=None:
-            taskObject = self.GET_TaskObjectByTaskId(resource, taskid)
-            id = taskObject['id']
+        if all_of_taskid and (resource!='dataproducts' or field!='new_status' or taskid==None):
+            raise (ATDBException("ERROR: only a 'dataproducts:new_status' with a 'taskid' can be PUT to all the dataproducts of the taskid"))
 
-        url = self.host + resource + "/" + str(id) + "/"
+        if resource=='dataproducts' and taskid!=None and filename==None and not all_of_taskid:
+            # the taskid url of the dataproducts addresses all of them, a single dataproduct is PUT by id.
+            taskObject = self.GET_TaskObjectByTaskId(resource, taskid)
+            url = self.get_object_url(resource, id=taskObject['id'])
+        else:
+            url = self.get_object_url(resource, id, taskid, filename)
         self.verbose_print(('url: ' + url))
-        if id==None:
-            raise (ATDBException("ERROR: no valid 'id' or 'taskid' provided"))
 
         payload = {}
         if field!=None:
             payload[field]=value
             payload = self.encodePayload(payload)
         try:
-            response = requests.request("PUT", url, data=payload, headers=self.header)
+            response = self.session.request("PUT", url, data=payload, headers=self.header, timeout=self.timeout)
             self.verbose_print("[PUT " + response.url + "]")
             self.verbose_print("Response: " + str(response.status_code) + ", " + str(response.reason))
         except:
             raise (ATDBException("ERROR: " + str(response.status_code) + ", " + str(response.reason)))
+        self.check_not_found(response, resource, id, taskid, filename)
+        if response.status_code >= 400:
+            raise (ATDBException("ERROR: " + str(response.status_code) + ", " + str(response.reason)))
+
+
+    def do_PUT_MANY(self, key, values, lookup='id', max_workers=DEFAULT_POOL_SIZE, ordered=True):
+        """
+        PUT values to a field of many objects, with at most max_workers requests at the same time.
+        :param key: contains the name of the resource and the name of the field separated by a colon. dataproducts:new_status
+        :param values: list of (id, value), where id is the database id, the taskid or the filename (see 'lookup')
+        :param lookup: how the objects are found, 'id', 'taskid' or 'filename'
+        :param max_workers: the maximum number of requests at the same time
+        :param ordered: when True, the PUTs to the same object are done in the order of the list
+        :return: list of ((id, value), http status code, error) in the order of the values
+        """
+        params = key.split(":")
+        resource = params[0]
+        field = params[1]
+
+        def put(item):
+            id, value = item
+            url = self.get_object_url(resource, **{lookup: id})
+            response = self.session.request("PUT", url, data=self.encodePayload({field: value}), headers=self.header,
+                                            timeout=self.timeout)
+            self.verbose_print("[PUT " + response.url + "] " + str(response.status_code))
+            self.check_not_found(response, resource, **{lookup: id})
+            if response.status_code >= 400:
+                raise (ATDBException("ERROR: " + str(response.status_code) + ", " + str(response.reason)))
+            return response.status_code
+
+        group_by = (lambda item: item[0]) if ordered else None
+        return self.run_many(put, list(values), max_workers, group_by)
 
 
     # do_PUT_LIST(key = observations:new_status, taskid = 180223003, value = valid)
@@ -290,24 +657,20 @@ class ATDB:
             resource = key
             field = None
 
+        if resource=='dataproducts' and field=='new_status':
+            # the backend sets the status of all the dataproducts of the taskid in one request.
+            self.do_PUT(key=key, id=None, value=value, taskid=taskid, all_of_taskid=True)
+            return
+
         get_key = resource+':id'
         get_query= 'taskID='+taskid
         ids = self.do_GET_LIST(get_key,get_query)
 
-        for id in ids:
-            url = self.host + resource + "/" + str(id) + "/"
-            self.verbose_print(('url: ' + url))
-
-            payload = {}
-            if field!=None:
-                payload[field]=value
-                payload = self.encodePayload(payload)
-            try:
-                response = requests.request("PUT", url, data=payload, headers=self.header)
-                self.verbose_print("[PUT " + response.url + "]")
-                self.verbose_print("Response: " + str(response.status_code) + ", " + str(response.reason))
-            except:
-                raise (ATDBException("ERROR: " + str(response.status_code) + ", " + str(response.reason)))
+        results = self.do_PUT_MANY(key, [(id, value) for id in ids])
+        errors = [error for item, result, error in results if error]
+        if errors:
+            raise (ATDBException("ERROR: " + str(len(errors)) + " of " + str(len(results)) + " PUTs failed. " +
+                                 errors[0]))
 
 
     def do_POST(self, resource, payload):
@@ -325,45 +688,192 @@ class ATDB:
 
         payload = self.jsonifyPayload(payload)
         try:
-            response = requests.request("POST", url, data=payload, headers=self.header)
+            response = self.session.request("POST", url, data=payload, headers=self.header, timeout=self.timeout)
             self.verbose_print("[POST " + response.url + "]")
             self.verbose_print("Response: " + str(response.status_code) + ", " + str(response.reason))
         except:
             raise (ATDBException("ERROR: " + str(response.status_code) + ", " + str(response.reason)))
 
 
+    def do_POST_MANY(self, resource, payloads, max_workers=DEFAULT_POOL_SIZE):
+        """
+        POST new objects to a resource (table) one by one, with at most max_workers requests at the same time.
+        Use do_POST_LIST to create them all in one request instead.
+        :param resource: contains the name of the resource, for example 'observations', 'dataproducts'
+        :param payloads: list of payloads in the same format as for do_POST
+        :param max_workers: the maximum number of requests at the same time
+        :return: list of (payload, id of the created object, error) in the order of the payloads
+        """
+        url = self.host + resource + '/'
+
+        def post(payload):
+            response = self.session.request("POST", url, data=self.jsonifyPayload(payload), headers=self.header,
+                                            timeout=self.timeout)
+            self.verbose_print("[POST " + response.url + "] " + str(response.status_code))
+            if response.status_code >= 400:
+                raise (ATDBException("ERROR: " + str(response.status_code) + ", " + str(response.reason)))
+            return json.loads(response.text)['id']
+
+        return self.run_many(post, list(payloads), max_workers)
+
+
+    def do_POST_LIST(self, resource, payloads):
+        """
+        POST a list of new objects to a resource (table) in one request.
+        :param resource: contains the name of the resource, for example 'observations', 'dataproducts'
+        :param payloads: list of payloads in the same format as for do_POST
+        :return: list of the id's of the created objects
+        """
+
+        url = self.host + resource + '/'
+        self.verbose_print(('url: ' + url))
+
+        payload = "[" + ",".join([self.jsonifyPayload(payload) for payload in payloads]) + "]"
+        try:
+            response = self.session.request("POST", url, data=payload, headers=self.header, timeout=self.timeout)
+            self.verbose_print("[POST " + response.url + "]")
+            self.verbose_print("Response: " + str(response.status_code) + ", " + str(response.reason))
+
+            results = json.loads(response.text)
+            return results['ids']
+        except:
+            raise (ATDBException("ERROR: " + str(response.status_code) + ", " + str(response.reason)))
+
+
+    def do_CLAIM(self, resource, from_status, to_status, count, worker, query='', lease=None):
+        """
+        Claim objects of a resource for this worker, by moving them from one status to another in one request.
+        Objects that are claimed by another worker at the same time are not returned.
+        :param resource: contains the name of the resource, for example 'observations', 'dataproducts'
+        :param from_status: the status of the objects to claim, for example 'valid'
+        :param to_status: the new status of the claimed objects, for example 'ingesting'
+        :param count: the maximum number of objects to claim
+        :param worker: the name of the worker
+        :param query: optional filters, for example 'taskID=180223003'
+        :param lease: optional number of seconds after which the claim expires, when the status has not changed
+        :return: list of the claimed objects
+        """
+        url = self.host + resource + '/claim'
+        if query:
+            url = url + '?' + query
+        self.verbose_print(('url: ' + url))
+
+        payload = {'from_status': from_status, 'to_status': to_status, 'count': count, 'worker': worker}
+        if lease is not None:
+            payload['lease'] = lease
+        try:
+            response = self.session.request("POST", url, data=json.dumps(payload), headers=self.header,
+                                            timeout=self.timeout)
+            self.verbose_print("[POST " + response.url + "]")
+            self.verbose_print("Response: " + str(response.status_code) + ", " + str(response.reason))
+            if response.status_code >= 400:
+                raise ValueError(response.text)
+            return json.loads(response.text)
+        except:
+            raise (ATDBException("ERROR: " + str(response.status_code) + ", " + str(response.reason)))
+
+
+    def do_RENEW(self, resource, worker, lease, query=''):
+        """
+        Renew the claims of a worker that needs more time than its lease.
+        :param resource: contains the name of the resource, for example 'observations', 'dataproducts'
+        :param worker: the name of the worker that has claimed the objects
+        :param lease: the number of seconds from now after which the claims expire
+        :param query: optional filters, for example 'my_status=ingesting&taskID=180223003'
+        :return: list of the id's of the renewed claims
+        """
+        url = self.host + resource + '/claim/renew'
+        if query:
+            url = url + '?' + query
+        self.verbose_print(('url: ' + url))
+
+        payload = {'worker': worker, 'lease': lease}
+        try:
+            response = self.session.request("POST", url, data=json.dumps(payload), headers=self.header,
+                                            timeout=self.timeout)
+            self.verbose_print("[POST " + response.url + "]")
+            self.verbose_print("Response: " + str(response.status_code) + ", " + str(response.reason))
+            if response.status_code >= 400:
+                raise ValueError(response.text)
+            return json.loads(response.text)['ids']
+        except:
+            raise (ATDBException("ERROR: " + str(response.status_code) + ", " + str(response.reason)))
+
+
     def do_DELETE(self, resource, id):
         """
         Do a http DELETE request to the ATDB backend
+        :param resource: contains the name of the resource, for example 'observations', 'dataproducts'
+        :param id: the database id of the object, or a range of id's like 11..15 which is deleted in one request.
         """
         if id == None:
             raise (ATDBException("ERROR: no valid 'id' provided"))
 
-        # if a range of ID's is given then do multiple deletes
         if (str(id).find('..')>0):
             self.verbose_print("Deleting " + str(id) + "...")
             s = id.split('..')
-            start = int(s[0])
-            end = int(s[1]) + 1
+            url = self.host + resource + "/range/" + str(int(s[0])) + "/" + str(int(s[1])) + "/"
+            ids = range(int(s[0]), int(s[1]) + 1)
         else:
             # just a single delete
-            start = int(id)
-            end = int(id) + 1
+            url = self.host + resource + "/" + str(int(id)) + "/"
+            ids = [int(id)]
 
-        for i in range(start,end):
-            url = self.host + resource + "/" + str(i) + "/"
+        if self.cache:
+            self.cache.invalidate(resource, ids=ids)
 
-            try:
-                response = requests.request("DELETE", url, headers=self.header)
-                self.verbose_print("[DELETE " + response.url + "]")
-                self.verbose_print("Response: " + str(response.status_code) + ", " + str(response.reason))
-            except:
-                raise (ATDBException("ERROR: deleting " + url + "failed." + response.url))
+        try:
+            response = self.session.request("DELETE", url, headers=self.header, timeout=self.timeout)
+            self.verbose_print("[DELETE " + response.url + "]")
+            self.verbose_print("Response: " + str(response.status_code) + ", " + str(response.reason))
+        except:
+            raise (ATDBException("ERROR: deleting " + url + "failed." + response.url))
+
+
+    def do_DELETE_TASKID(self, taskid):
+        """
+        Delete the observation of a taskid and all its dataproducts, in one request.
+        :param taskid: the taskid of the observation
+        """
+        url = self.host + "observations/taskid/" + str(taskid) + "/"
+
+        if self.cache:
+            # the filenames of the deleted dataproducts are not known here
+            self.cache.invalidate('observations', field='taskID', value=taskid)
+            self.cache.invalidate('dataproducts')
+        try:
+            response = self.session.request("DELETE", url, headers=self.header, timeout=self.timeout)
+            self.verbose_print("[DELETE " + response.url + "]")
+            self.verbose_print("Response: " + str(response.status_code) + ", " + str(response.reason))
+        except:
+            raise (ATDBException("ERROR: deleting " + url + "failed." + response.url))
 
 
 # ------------------------------------------------------------------------------#
 #                                Module level functions                         #
 # ------------------------------------------------------------------------------#
+def create_session(pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+    """
+    Create a http session that keeps 'pool_size' connections to the backend open for reuse.
+    The idempotent requests are retried with an exponential backoff when the connection fails,
+    or when the backend answers 502, 503 or 504. Also used for the (TLS) connections to ALTA.
+    """
+    retry_args = {'total': retries, 'backoff_factor': backoff, 'status_forcelist': (502, 503, 504),
+                  'raise_on_status': False}
+    methods = frozenset(['HEAD', 'GET', 'PUT', 'DELETE', 'OPTIONS'])
+    try:
+        retry = Retry(allowed_methods=methods, **retry_args)
+    except TypeError:
+        # urllib3 before 1.26
+        retry = Retry(method_whitelist=methods, **retry_args)
+
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
 def exit_with_error(message):
     """
     Exit the code for an error.
@@ -387,9 +897,12 @@ def main():
     parser.add_argument("-v","--verbose", default=False, help="More information at run time.",action="store_true")
     parser.add_argument("--host", nargs="?", default=DEFAULT_BACKEND_HOST, help= "Host url. Production = https://alta.astron.nl/altapi/, Acceptance = https://alta-acc.astron.nl/altapi/, Development (default) = http://localhost:8000/altapi/")
     parser.add_argument("--version", default=False, help="Show current version of this program, and the version of the ALTA backend.", action="store_true")
-    parser.add_argument("--operation","-o", default="GET", help="GET, GET_ID, GET_LIST, POST, PUT, DELETE. Note that these operations will only work if you have the proper rights in the ALTA user database.")
+    parser.add_argument("--operation","-o", default="GET", help="GET, GET_ID, GET_LIST, POST, PUT, DELETE, FOLLOW. Note that these operations will only work if you have the proper rights in the ALTA user database.")
     parser.add_argument("--id", default=None, help="id of the object to PUT to.")
     parser.add_argument("-t", "--taskid", nargs="?", default=None, help="Optional taskID which can be used instead of '--id' to lookup Observations or Dataproducts.")
+    parser.add_argument("--filename", nargs="?", default=None, help="Optional filename which can be used instead of '--id' to lookup Dataproducts.")
+    parser.add_argument("--all_of_taskid", default=False, help="PUT a 'dataproducts:new_status' to all the dataproducts of '--taskid' instead of only the first one.", action="store_true")
+    parser.add_argument("--cache", nargs="?", default=None, const="", help="Cache the ids of taskIDs and filenames. Optionally give a file to keep the cache between runs.")
     parser.add_argument("--key", default="observations.title", help="resource.field to PUT a value to. Example: observations.title")
     parser.add_argument("--query", "-q", default="taskID=180223003", help="Query to the REST API")
     parser.add_argument("--value", default="", help="value to PUT in the resource.field. If omitted it will PUT the object without changing values, but the built-in 'signals' will be triggered.")
@@ -398,7 +911,10 @@ def main():
 
     args = parser.parse_args()
     try:
-        atdb = ATDB(args.host, args.verbose)
+        cache = None
+        if args.cache is not None:
+            cache = NaturalKeyCache(filename=args.cache or None)
+        atdb = ATDB(args.host, args.verbose, cache=cache)
 
         if (args.show_examples):
 
@@ -422,6 +938,9 @@ def main():
             print("PUT the 'status' of dataproduct with ID = 45 on 'copied'")
             print("> python atdb_interface.py -o PUT --key dataproducts:new_status --id 45 --value copied")
             print()
+            print("PUT the 'status' of dataproduct with filename WSRTA180223003_B003.MS on 'copied'")
+            print("> python atdb_interface.py -o PUT --key dataproducts:new_status --filename WSRTA180223003_B003.MS --value copied")
+            print()
             print("PUT the 'status' of observation with taskID 180720003 on 'valid'")
             print("> python atdb_interface.py -o PUT --key observations:new_status --value valid --taskid 180223003")
             print()
@@ -444,12 +963,16 @@ def main():
             print()
             print("PUT the field 'new_status' on 'valid' for all dataproducts with taskId = '180816001'")
             print("> python  atdb_interface.py -o PUT_LIST --key dataproducts:new_status --taskid 180816001 --value valid")
+            print("> python  atdb_interface.py -o PUT --key dataproducts:new_status --taskid 180816001 --value valid --all_of_taskid")
+            print()
+            print("FOLLOW the status transitions of dataproducts to 'valid', as they happen")
+            print("> python atdb_interface.py -o FOLLOW --query \"status=valid&task_type=dataproduct\"")
             print('---------------------------------------------------------------------------------------------')
             return
 
 
         if (args.operation=='GET'):
-            result = atdb.do_GET(key=args.key, id=args.id, taskid=args.taskid, value=args.value)
+            result = atdb.do_GET(key=args.key, id=args.id, taskid=args.taskid, value=args.value, filename=args.filename)
             print(result)
 
         if (args.operation == 'GET_ID'):
@@ -458,13 +981,18 @@ def main():
 
         if (args.operation == 'GET_LIST'):
             result = atdb.do_GET_LIST(key=args.key, query=args.query)
-            print(result)
+            print(list(result))
+
+        if (args.operation == 'FOLLOW'):
+            for change in atdb.follow(query=args.query):
+                print(change)
 
         if (args.operation=='PUT_LIST'):
             atdb.do_PUT_LIST(key=args.key, taskid=args.taskid, value=args.value)
 
         if (args.operation=='PUT'):
-            atdb.do_PUT(key=args.key, id=args.id, value=args.value, taskid=args.taskid)
+            atdb.do_PUT(key=args.key, id=args.id, value=args.value, taskid=args.taskid, filename=args.filename,
+                        all_of_taskid=args.all_of_taskid)
 
         if (args.operation=='POST'):
             atdb.do_POST(resource=args.key, payload=args.payload)
@@ -472,6 +1000,8 @@ def main():
         if (args.operation=='DELETE'):
             atdb.do_DELETE(resource=args.key, id=args.id)
 
+        atdb.save_cache()
+
     except ATDBException as exp:
         exit_with_error(exp.message)
 
@@ -1,6 +1,8 @@
 #!/usr/bin/python3
 import os, sys
+import json
 import time
+import socket
 import atdb_interface
 import alta_interface
 from os import scandir
@@ -38,6 +40,15 @@ DEFAULT_ALTA_HOST = ALTA_HOST_DEV
 
 TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
 
+# the mtime of a directory or file that changed less than this number of seconds before a scan is not trusted,
+# because files can still be added to it within the same mtime tick. A file that is still being written does
+# not change the mtime of its directory at all. Such a directory is scanned again, until all its files are stable.
+MTIME_RESOLUTION = 2
+
+# the number of seconds that the start_ingest service claims the objects for. The claims are renewed in every
+# cycle of the service, when the service stops the objects go back to 'valid' after this time.
+INGEST_LEASE = 24 * 3600
+
 class ATDBException(Exception):
     """
     Exception with message.
@@ -49,17 +60,66 @@ class ATDBException(Exception):
         return self.message
 
 
+class ScanIndex:
+    """
+    Index of the observation directories and dataproduct files that the data monitor has seen,
+    with their inode, size, mtime and the id that they are registered with in ATDB.
+    The index can be saved to a file, to keep it between runs of the data monitor.
+    """
+    def __init__(self, filename=None):
+        """
+        Constructor.
+        :param filename: (optional) the file to load the index from and to save it to.
+        """
+        self.filename = filename
+
+        # obs_dir_name => {'inode', 'mtime', 'id', 'files': {file name => {'inode', 'size', 'mtime', 'id'}}}
+        self.dirs = {}
+        if self.filename:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.filename) as file:
+                self.dirs = json.load(file)
+        except (IOError, ValueError):
+            # start with an empty index, the next scan is a full scan
+            self.dirs = {}
+
+    def save(self):
+        """
+        Save the index to its file, if it has one.
+        """
+        if not self.filename:
+            return
+
+        atdb_interface.save_json(self.filename, self.dirs)
+
+    def is_unchanged(self, obs_dir_name, stat):
+        """
+        Check if a directory has the same inode and mtime as in the index, then its files have not changed.
+        """
+        known = self.dirs.get(obs_dir_name)
+        return known is not None and known['inode'] == stat.st_ino and known['mtime'] == stat.st_mtime_ns
+
+    def __str__(self):
+        files = sum([len(known['files']) for known in self.dirs.values()])
+        return "scan index: " + str(len(self.dirs)) + " directories, " + str(files) + " files"
+
+
 class ATDBService:
     """
     ATDBService class. This class contains all the atdb services.
     """
-    def __init__(self, atdb_host, alta_host, user, password,verbose=False):
+    def __init__(self, atdb_host, alta_host, user, password,verbose=False, cache=None, scan_state=None):
         """
         Constructor.
         :param host: the host name of the backend.
         :param username: The username known in Django Admin.
         :param verbose: more information runtime.
         :param header: Request header for Atdb REST requests with token authentication.
+        :param cache: (optional) an atdb_interface.NaturalKeyCache for the ids of taskIDs and filenames.
+        :param scan_state: (optional) the file in which the data monitor keeps its index of the scanned directories.
         """
 
         # accept some presets to set host to dev, test, acc or prod
@@ -90,7 +150,8 @@ class ATDBService:
         self.header = ATDB_HEADER
         self.user = user
         self.password = password
-        self.atdb_interface = atdb_interface.ATDB(self.host, self.verbose)
+        self.atdb_interface = atdb_interface.ATDB(self.host, self.verbose, cache=cache)
+        self.scan_index = ScanIndex(scan_state)
 
         try:
             self.alta_interface = alta_interface.ALTA(self.alta_host,self.user,self.password, self.verbose)
@@ -126,17 +187,26 @@ class ATDBService:
         payload += "}"
         return payload
 
-    def create_dataproduct_payload(self, taskID, db_file_name, status):
+    def create_dataproduct_payload(self, taskID, db_file_name, status, size=11111):
         payload = "{name:" + str(db_file_name) + ','
         payload += "taskID:" + str(taskID) + ','
         payload += "filename:" + db_file_name + ','
         payload += "description:" + db_file_name + ','
-        payload += "size:11111" + ','
+        payload += "size:" + str(size) + ','
         payload += "quality:?" + ','
         payload += "new_status:"+status
         payload += "}"
         return payload
 
+    def report_errors(self, results):
+        """
+        Print the failed requests of a do_PUT_MANY or do_POST_MANY.
+        :param results: list of (item, result, error)
+        """
+        for item, result, error in results:
+            if error:
+                print('ERROR: ' + str(item) + ': ' + error)
+
     # ------------------------------------------------------------------------------#
     #                                Main Services                                  #
     # ------------------------------------------------------------------------------#
@@ -154,7 +224,8 @@ class ATDBService:
 
         self.atdb_interface.do_POST(resource='observations', payload=payload)
 
-        # add 5 dataproducts
+        # add 'count' dataproducts, with parallel requests
+        payloads = []
         for i in range(int(count)):
             filename = 'WSRTA' + str(taskid) + '_B' + str(i).zfill((3)) + '.MS'
             print(filename)
@@ -169,45 +240,141 @@ class ATDBService:
             payload += "}"
 
             print('- adding dataproduct : ' + str(filename))
-            self.atdb_interface.do_POST(resource='dataproducts', payload=payload)
+            payloads.append(payload)
+
+        if len(payloads) > 0:
+            self.report_errors(self.atdb_interface.do_POST_MANY(resource='dataproducts', payloads=payloads))
 
     # --------------------------------------------------------------------------------------------------------
     # TODO: extend to search for MS (dirs), the prototype now only searches for FITS (files)
     def service_data_monitor(self, dir_to_monitor):
         """
         Monitor a data directory. Check for new Observations (directories) and Dataproducts (directories or filenames)
+        Only the directories with a new mtime are scanned, and only their new or changed files are reported to ATDB.
         :param dir_to_monitor: Directory to monitor for new data
         """
+        index = self.scan_index
+        scan_start = time.time()
 
-        # check for directories per observation
-        observation_dirs = os.listdir(dir_to_monitor)
-
+        # check for directories per observation, and the FITS files (dataproducts) in the changed ones
+        observations = {}
+        obs_dir_names = set()
         for obs_dir in scandir(dir_to_monitor):
             if obs_dir.is_dir(follow_symlinks=False):
                 obs_dir_name = obs_dir.name
-                taskID = obs_dir_name.replace("WSRTA", "")
-
-                # create and POST an observation per directory if the observation is not already in the database
-
-                id = self.atdb_interface.do_GET_ID(key='observations:taskID', value=taskID)
-                if int(id) < 0:
-                    # only POST a new observations
-                    self.verbose_print('add observation ' + obs_dir_name + ' to ATDB...')
-                    payload = self.create_obs_payload(taskID, obs_dir_name,"created")
-                    self.atdb_interface.do_POST(resource='observations', payload=payload)
-
-                # scan for dataproducts in the observation directory
-                new_dir_to_monitor = os.path.join(dir_to_monitor, obs_dir_name)
-
-                for dp in scandir(new_dir_to_monitor):
-                    if dp.is_file() and dp.name.endswith("FITS"):
-                        dp_file_name = dp.name
-                        id = self.atdb_interface.do_GET_ID(key='dataproducts:filename', value=dp_file_name)
-                        if int(id) < 0:
-                            # only POST a new dataproducts
-                            self.verbose_print('- add dataproduct ' + dp_file_name + ' to ATDB...')
-                            payload = self.create_dataproduct_payload(taskID, dp_file_name, "created")
-                            self.atdb_interface.do_POST(resource='dataproducts', payload=payload)
+                try:
+                    obs_stat = obs_dir.stat(follow_symlinks=False)
+                    if index.is_unchanged(obs_dir_name, obs_stat):
+                        obs_dir_names.add(obs_dir_name)
+                        continue
+
+                    dp_stats = {}
+                    for dp in scandir(obs_dir.path):
+                        if dp.is_file() and dp.name.endswith("FITS"):
+                            try:
+                                dp_stats[dp.name] = dp.stat()
+                            except FileNotFoundError:
+                                # the file was removed during the scan
+                                continue
+                except FileNotFoundError:
+                    # the directory was removed during the scan, it is forgotten like the other removed directories
+                    continue
+                obs_dir_names.add(obs_dir_name)
+                observations[obs_dir_name] = (obs_stat, dp_stats)
+
+        # forget the directories that are gone
+        for obs_dir_name in list(index.dirs.keys()):
+            if obs_dir_name not in obs_dir_names:
+                del index.dirs[obs_dir_name]
+
+        # ask ATDB which of the new observations and dataproducts are already in the database, in one request each.
+        new_taskIDs = {}
+        new_file_names = []
+        for obs_dir_name, (obs_stat, dp_stats) in observations.items():
+            known = index.dirs.get(obs_dir_name, {'id': None, 'files': {}})
+            if known['id'] is None:
+                new_taskIDs[obs_dir_name.replace("WSRTA", "")] = obs_dir_name
+            new_file_names += [name for name in dp_stats.keys() if name not in known['files']]
+
+        known_taskIDs = self.atdb_interface.do_GET_IDS(key='observations:taskID', values=list(new_taskIDs.keys()))
+        known_file_names = self.atdb_interface.do_GET_IDS(key='dataproducts:filename', values=new_file_names)
+
+        # create and POST an observation per directory if the observation is not already in the database
+        payloads = []
+        new_observations = []
+        for taskID, obs_dir_name in new_taskIDs.items():
+            if taskID not in known_taskIDs:
+                # only POST a new observations
+                self.verbose_print('add observation ' + obs_dir_name + ' to ATDB...')
+                payloads.append(self.create_obs_payload(taskID, obs_dir_name, "created"))
+                new_observations.append(taskID)
+
+        # POST all new observations in one request
+        if len(payloads) > 0:
+            ids = self.atdb_interface.do_POST_LIST(resource='observations', payloads=payloads)
+            known_taskIDs.update(zip(new_observations, ids))
+
+        for obs_dir_name, (obs_stat, dp_stats) in observations.items():
+            taskID = obs_dir_name.replace("WSRTA", "")
+            known = index.dirs.get(obs_dir_name, {'id': None, 'files': {}})
+
+            files = {}
+            payloads = []
+            new_dataproducts = []
+            changed = []
+            for dp_file_name, dp_stat in dp_stats.items():
+                files[dp_file_name] = {'inode': dp_stat.st_ino, 'size': dp_stat.st_size,
+                                       'mtime': dp_stat.st_mtime_ns, 'id': None}
+                known_file = known['files'].get(dp_file_name)
+
+                if known_file is not None:
+                    files[dp_file_name]['id'] = known_file['id']
+                    if (known_file['inode'], known_file['size'], known_file['mtime']) != \
+                            (dp_stat.st_ino, dp_stat.st_size, dp_stat.st_mtime_ns):
+                        # a changed dataproduct, update its size
+                        self.verbose_print('- update dataproduct ' + dp_file_name + ' in ATDB...')
+                        changed.append((known_file['id'], dp_stat.st_size))
+
+                elif dp_file_name in known_file_names:
+                    files[dp_file_name]['id'] = known_file_names[dp_file_name]
+
+                else:
+                    # only POST a new dataproducts
+                    self.verbose_print('- add dataproduct ' + dp_file_name + ' to ATDB...')
+                    payloads.append(self.create_dataproduct_payload(taskID, dp_file_name, "created", dp_stat.st_size))
+                    new_dataproducts.append(dp_file_name)
+
+            errors = []
+
+            # POST all new dataproducts of this observation with parallel requests
+            if len(payloads) > 0:
+                results = self.atdb_interface.do_POST_MANY(resource='dataproducts', payloads=payloads)
+                self.report_errors(results)
+                for dp_file_name, (payload, id, error) in zip(new_dataproducts, results):
+                    if error:
+                        # not in the index, so that it is POSTed again in the next scan
+                        del files[dp_file_name]
+                        errors.append(error)
+                    else:
+                        files[dp_file_name]['id'] = id
+
+            if len(changed) > 0:
+                results = self.atdb_interface.do_PUT_MANY(key='dataproducts:size', values=changed)
+                self.report_errors(results)
+                errors += [error for item, result, error in results if error]
+
+            # a directory that changed during the scan, with files that are still being written,
+            # or with failed updates, is scanned again in the next cycle
+            recent = scan_start - MTIME_RESOLUTION
+            mtime = obs_stat.st_mtime_ns
+            if errors or obs_stat.st_mtime >= recent or any(dp_stat.st_mtime >= recent for dp_stat in dp_stats.values()):
+                mtime = None
+
+            index.dirs[obs_dir_name] = {'inode': obs_stat.st_ino, 'mtime': mtime,
+                                        'id': known_taskIDs.get(taskID, known['id']), 'files': files}
+
+        index.save()
+        self.verbose_print(str(index) + ', ' + str(len(observations)) + ' scanned')
 
     # --------------------------------------------------------------------------------------------------------
     def service_ingest_monitor(self, dir_to_monitor, old_status, new_status):
@@ -215,21 +382,25 @@ class ATDBService:
         # if they do, then put the status on 'ingested'.
 
         # get the list taskID of 'ingesting' observations
-        taskIDs = self.atdb_interface.do_GET_LIST(key='observations:taskID', query='my_status=' + old_status)
+        taskIDs = list(self.atdb_interface.do_GET_LIST(key='observations:taskID', query='my_status=' + old_status))
         self.verbose_print('Observations with status = ' + old_status + ' in ATDB: ' + str(taskIDs))
 
         # connect to ALTA
+        arrived = []
         for taskID in taskIDs:
             alta_id = self.alta_interface.do_GET_ID(key='activities:runId', value=taskID)
             self.verbose_print('Observation found in ALTA = ' + str(alta_id))
             if (int(alta_id) > 0):
                 # dataproduct was found in ALTA, put it on 'archived' in ATDB
-                self.atdb_interface.do_PUT(key='observations:new_status', id=None, taskid=taskID, value=new_status)
+                arrived.append((taskID, new_status))
+        self.report_errors(self.atdb_interface.do_PUT_MANY(key='observations:new_status', values=arrived,
+                                                           lookup='taskid'))
 
         # get the list of names of 'ingesting' dataproducts
         names = self.atdb_interface.do_GET_LIST(key='dataproducts:name', query='my_status=' + old_status)
 
         # connect to ALTA.
+        arrived = []
         for name in names:
             # get the alta_id of the dataproduct
             alta_id = self.atdb_interface.do_GET_ID(key='dataproducts:name', value=name)
@@ -241,7 +412,10 @@ class ATDBService:
                 # get the atdb_id of this dataproduct
                 atdb_id = self.atdb_interface.do_GET_ID(key='dataproducts:name', value=name)
                 self.verbose_print('set status of ' + str(id) + ' to ' + new_status)
-                self.atdb_interface.do_PUT(key='dataproducts:new_status', id=atdb_id, taskid=None, value=new_status)
+                arrived.append((atdb_id, new_status))
+
+        # set the new status of all arrived dataproducts at the same time
+        self.report_errors(self.atdb_interface.do_PUT_MANY(key='dataproducts:new_status', values=arrived))
 
 # --------------------------------------------------------------------------------------------------------
     # example: change status of observation with taskid=180223003 to valid.
@@ -265,22 +439,34 @@ class ATDBService:
 
 # --------------------------------------------------------------------------------------------------------
     #TODO: finish
-    def service_start_ingest(self,old_status, new_status):
+    def service_start_ingest(self,old_status, new_status, count=10, lease=INGEST_LEASE, worker=None):
+
+        # the worker name stays the same when the service is restarted, so that it renews its own old claims.
+        # Several instances on one host need their own names.
+        worker = worker or socket.gethostname()
+
+        # renew the claims of the earlier cycles that are still ingesting, an ingest can take longer than the lease.
+        for resource in ('observations', 'dataproducts'):
+            self.atdb_interface.do_RENEW(resource, worker, lease, query='my_status=' + new_status)
 
-        # get the list taskID of 'valid' observations
-        taskIDs = self.atdb_interface.do_GET_LIST(key='observations:taskID', query='my_status=' + old_status)
-        self.verbose_print(str(taskIDs))
+        # claim the 'valid' observations for this worker, other workers that run at the same time get other ones.
+        observations = self.atdb_interface.do_CLAIM('observations', old_status, new_status, count, worker, lease=lease)
+        self.verbose_print(str([observation['taskID'] for observation in observations]))
 
-        # loop through the list of 'valid' observations and gather its valid dataproducts,
+        # claim the valid dataproducts of the claimed observations,
         # by name, because that is the key that is used for the ingest.
-        for taskID in taskIDs:
-            self.atdb_interface.do_PUT(key='observations:new_status', id=None, taskid=taskID, value=new_status)
+        for observation in observations:
+            taskID = observation['taskID']
+            if taskID is None:
+                print('WARNING: observation ' + str(observation['id']) + ' has no taskID, its dataproducts are not claimed')
+                continue
 
-            ids = self.atdb_interface.do_GET_LIST(key='dataproducts:id',
-                                            query='taskID=' + taskID + '&my_status=' + old_status)
-            self.verbose_print(str(ids))
-            for id in ids:
-                self.atdb_interface.do_PUT(key='dataproducts:new_status', id=id, taskid=None, value=new_status)
+            while True:
+                dataproducts = self.atdb_interface.do_CLAIM('dataproducts', old_status, new_status, 1000, worker,
+                                                            query='taskID=' + taskID, lease=lease)
+                self.verbose_print(str([dataproduct['name'] for dataproduct in dataproducts]))
+                if len(dataproducts) < 1000:
+                    break
 
 
         # create the ingest parameter file
@@ -289,20 +475,9 @@ class ATDBService:
 # --------------------------------------------------------------------------------------------------------
     def service_delete_taskid(self, taskid):
 
-        # find the observation
-        id = self.atdb_interface.do_GET_ID(key='observations:taskID', value=taskid)
-        while (int(id) > 0):
-            print('delete observation : ' + str(taskid) + ' (id = ' + str(id) + ')')
-            self.atdb_interface.do_DELETE(resource='observations', id=id)
-            # check for more
-            id = self.atdb_interface.do_GET_ID(key='observations:taskID', value=taskid)
-
-        id = self.atdb_interface.do_GET_ID(key='dataproducts:taskID', value=taskid)
-        while (int(id) > 0):
-            print('delete dataproduct for taskID ' + str(taskid) + ' (id = ' + str(id) + ')')
-            self.atdb_interface.do_DELETE(resource='dataproducts', id=id)
-            # check for more
-            id = self.atdb_interface.do_GET_ID(key='dataproducts:taskID', value=taskid)
+        # delete the observation and all its dataproducts
+        print('delete observation : ' + str(taskid) + ' and its dataproducts')
+        self.atdb_interface.do_DELETE_TASKID(taskid)
 
 # ------------------------------------------------------------------------------#
 #                                Module level functions                         #
@@ -343,10 +518,17 @@ def main():
 
     parser.add_argument("--interval", default=None, help="Polling interval in seconds. When enabled this instance of the program will run in monitoring mode.")
     parser.add_argument("--dir", default=None, help="Data Directory to monitor")
+    parser.add_argument("--cache", nargs="?", default=None, const="", help="Cache the ids of taskIDs and filenames. Optionally give a file to keep the cache between runs.")
+    parser.add_argument("--lease", default=str(INGEST_LEASE), help="Seconds that start_ingest claims the objects for, the claims are renewed every --interval.")
+    parser.add_argument("--worker", default=None, help="Name with which the ingest claims the objects, default is the hostname. Give every instance on a host its own name, and keep it when the instance is restarted.")
+    parser.add_argument("--state", default=None, help="File in which the data_monitor keeps its index of the scanned directories between runs.")
 
     args = parser.parse_args()
     try:
-        atdb_service = ATDBService(args.atdb_host, args.alta_host, args.user, args.password, args.verbose)
+        cache = None
+        if args.cache is not None:
+            cache = atdb_interface.NaturalKeyCache(filename=args.cache or None)
+        atdb_service = ATDBService(args.atdb_host, args.alta_host, args.user, args.password, args.verbose, cache, args.state)
 
         print('starting '+args.operation+'...')
 
@@ -360,6 +542,12 @@ def main():
             print("Start the DataMonitor for directory '~/my_datawriter' and let it check for new data every minute")
             print(">python atdb_service.py -o data_monitor --dir ~/my_datawriter --interval 60")
             print()
+            print("The same, but keep the ids of the known observations and dataproducts in a cache file between runs")
+            print(">python atdb_service.py -o data_monitor --dir ~/my_datawriter --interval 60 --cache ~/atdb_cache.json")
+            print()
+            print("The same, but keep the index of the scanned directories between runs, so that only new files are scanned")
+            print(">python atdb_service.py -o data_monitor --dir ~/my_datawriter --interval 60 --state ~/data_monitor_state.json")
+            print()
             print("Start the IngestMonitor and let it check for finished ingests every minute")
             print(">python atdb_service.py -o ingest_monitor --interval 60")
             print()
@@ -405,6 +593,7 @@ def main():
                 print('starting polling ' + atdb_service.host + ' every ' + args.interval + ' secs')
                 while True:
                     atdb_service.service_data_monitor(dir_to_monitor=args.dir)
+                    atdb_service.atdb_interface.save_cache()
                     time.sleep(int(args.interval))
 
         # --------------------------------------------------------------------------------------------------------
@@ -414,15 +603,19 @@ def main():
                 print('starting polling ' + atdb_service.host + ' every ' + args.interval + ' secs')
                 while True:
                     atdb_service.service_ingest_monitor(dir_to_monitor=args.dir,old_status='ingesting',new_status='archived')
+                    atdb_service.atdb_interface.save_cache()
                     time.sleep(int(args.interval))
 
         # --------------------------------------------------------------------------------------------------------
         if (args.operation == 'start_ingest'):
-            atdb_service.service_start_ingest(old_status='valid', new_status='ingesting')
+            atdb_service.service_start_ingest(old_status='valid', new_status='ingesting', lease=int(args.lease),
+                                              worker=args.worker)
             if args.interval:
                 print('starting polling ' + atdb_service.host + ' every ' + args.interval + ' secs')
                 while True:
-                    atdb_service.service_start_ingest(old_status='valid', new_status='ingesting')
+                    atdb_service.service_start_ingest(old_status='valid', new_status='ingesting', lease=int(args.lease),
+                                                      worker=args.worker)
+                    atdb_service.atdb_interface.save_cache()
                     time.sleep(int(args.interval))
 
         # --------------------------------------------------------------------------------------------------------
@@ -434,6 +627,8 @@ def main():
             atdb_service.service_delete_taskid(taskid=args.taskid)
 
 
+        atdb_service.atdb_interface.save_cache()
+
     except ATDBException as exp:
         exit_with_error(exp.message)
 
@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import requests
+import atdb_interface
+
+"""
+benchmark_session.py : compare a new connection per request with the pooled keep-alive session of the ATDB class.
+By default it runs against a local stand-in for the ATDB backend, which answers every GET with [{"id": 1}].
+Example: python benchmark_session.py --requests 2000
+"""
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # keep-alive needs HTTP/1.1 and a Content-Length
+    protocol_version = 'HTTP/1.1'
+
+    # the headers and the body are written separately, without this every response on a
+    # kept-alive connection waits for a delayed ACK of the client
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = json.dumps([{'id': 1}]).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def start_stand_in():
+    """
+    Start the stand-in backend on a free port, in a background thread.
+    :return: the url of the stand-in
+    """
+    server = StandInServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return "http://127.0.0.1:" + str(server.server_address[1]) + "/atdb/"
+
+
+def benchmark(name, count, get):
+    start = time.time()
+    for i in range(count):
+        get()
+    duration = time.time() - start
+    print(name + ": " + str(count) + " requests in %.2f s = %.0f requests/s" % (duration, count / duration))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default=None, help="ATDB backend to use instead of the local stand-in.")
+    parser.add_argument("--requests", type=int, default=1000, help="Number of requests per benchmark.")
+    args = parser.parse_args()
+
+    host = args.host or start_stand_in()
+    url = host + "observations?taskID=180223003&fields=id"
+
+    # before: every request opens a new connection
+    benchmark("new connection per request", args.requests,
+              lambda: requests.request("GET", url, headers=atdb_interface.ATDB_HEADER))
+
+    # after: the ATDB object reuses the connections of its session
+    atdb = atdb_interface.ATDB(host)
+    benchmark("pooled session", args.requests,
+              lambda: atdb.do_GET_ID(key='observations:taskID', value='180223003'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,670 @@
+#!/usr/bin/python3
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from unittest import mock
+
+import atdb_async
+import atdb_interface
+import atdb_service
+
+"""
+tests.py : unit tests of the ATDB client modules, against a local stand-in for the ATDB backend.
+Run them from this directory: python -m unittest tests
+"""
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # keep-alive needs HTTP/1.1 and a Content-Length
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def respond(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(length).decode('utf-8') if length else ''
+        self.server.requests.append((method, self.path, data))
+
+        status, result = self.server.respond(method, self.path, data)
+        body = json.dumps(result).encode('utf-8') if status != 204 else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.respond('GET')
+
+    def do_PUT(self):
+        self.respond('PUT')
+
+    def do_POST(self):
+        self.respond('POST')
+
+    def do_DELETE(self):
+        self.respond('DELETE')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    """
+    A stand-in for the ATDB backend on a free local port.
+    :param respond: function(method, path, body) that returns (http status, json result) per request.
+    """
+    daemon_threads = True
+
+    def __init__(self, respond):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.respond = respond
+
+        # (method, path, body) of the requests, in the order that they arrived
+        self.requests = []
+
+
+class StandInTestCase(unittest.TestCase):
+
+    def start_server(self, respond):
+        """
+        Start a stand-in backend for the duration of the test.
+        :return: the server, and the url of its 'atdb' api
+        """
+        server = StandInServer(respond)
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, 'http://127.0.0.1:' + str(server.server_port) + '/atdb/'
+
+
+class SessionTest(StandInTestCase):
+    """
+    The session keeps its connections open, and retries the idempotent requests with an exponential backoff
+    when the backend is unavailable.
+    """
+
+    def unavailable(self, count):
+        """
+        A backend that answers '503 Service Unavailable' to the first 'count' requests.
+        """
+        def respond(method, path, body):
+            if len(server.requests) <= count:
+                return 503, {}
+            return 200, [{'id': 1}]
+
+        server, url = self.start_server(respond)
+        return server, url
+
+    def test_config(self):
+        session = atdb_interface.create_session(pool_size=4, retries=2, backoff=0.1)
+        for url in ('http://localhost/atdb/', 'https://atdb.astron.nl/atdb/'):
+            adapter = session.get_adapter(url)
+            self.assertEqual(adapter.poolmanager.connection_pool_kw['maxsize'], 4)
+
+            retry = adapter.max_retries
+            self.assertEqual((retry.total, retry.backoff_factor), (2, 0.1))
+            self.assertEqual(set(retry.status_forcelist), {502, 503, 504})
+            self.assertFalse(retry.raise_on_status)
+
+            # a POST is not idempotent, it would create the object twice
+            self.assertEqual(set(method for method in ('GET', 'PUT', 'DELETE', 'POST') if retry.is_retry(method, 503)),
+                             {'GET', 'PUT', 'DELETE'})
+
+        atdb = atdb_interface.ATDB('http://localhost/atdb', retries=5)
+        self.assertEqual(atdb.session.get_adapter(atdb.host).max_retries.total, 5)
+
+    def test_retry(self):
+        server, url = self.unavailable(3)
+        session = atdb_interface.create_session(retries=3, backoff=0.5)
+        with mock.patch('time.sleep') as sleep:
+            response = session.get(url + 'observations/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(server.requests), 4)
+
+        # the first retry is immediate, after that the waits double
+        self.assertEqual([call[0][0] for call in sleep.call_args_list if call[0][0] > 0], [1.0, 2.0])
+
+    def test_retries_exhausted(self):
+        server, url = self.unavailable(10)
+        session = atdb_interface.create_session(retries=2, backoff=0)
+
+        # the last answer is returned, the caller reports the error
+        response = session.put(url + 'observations/1/', data='{}')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(server.requests), 3)
+
+    def test_post_not_retried(self):
+        server, url = self.unavailable(1)
+        session = atdb_interface.create_session(retries=3, backoff=0)
+
+        response = session.post(url + 'observations/', data='{}')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(server.requests), 1)
+
+
+class RunManyTest(StandInTestCase):
+    """
+    run_many and the PUT/POST_MANY requests run in parallel, and return the result or the error per item
+    in the order of the items.
+    """
+
+    def setUp(self):
+        self.atdb = atdb_interface.ATDB('http://localhost/atdb/')
+
+    def test_order(self):
+        # the first items take the longest, so they finish last
+        def function(item):
+            time.sleep((10 - item) * 0.01)
+            return item * 2
+
+        results = self.atdb.run_many(function, list(range(10)), max_workers=10)
+        self.assertEqual(results, [(item, item * 2, None) for item in range(10)])
+
+    def test_errors(self):
+        def function(item):
+            if item % 3 == 0:
+                raise atdb_interface.ATDBException('ERROR: ' + str(item))
+            return item
+
+        results = self.atdb.run_many(function, list(range(7)), max_workers=3)
+        self.assertEqual([result for item, result, error in results], [None, 1, 2, None, 4, 5, None])
+        self.assertEqual([error for item, result, error in results], ['ERROR: 0', None, None, 'ERROR: 3', None, None,
+                                                                      'ERROR: 6'])
+
+    def test_max_workers(self):
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def function(item):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+
+        self.atdb.run_many(function, list(range(20)), max_workers=4)
+        self.assertEqual(running[1], 4)
+
+    def test_group_by(self):
+        # the items of a group are done one after another in the order of the list, the groups in parallel
+        done = []
+
+        def function(item):
+            key, index = item
+            time.sleep((5 - index) * 0.01)
+            done.append(item)
+
+        items = [(key, index) for index in range(5) for key in 'abc']
+        results = self.atdb.run_many(function, items, max_workers=3, group_by=lambda item: item[0])
+        self.assertEqual([item for item, result, error in results], items)
+        for key in 'abc':
+            self.assertEqual([item for item in done if item[0] == key], [(key, index) for index in range(5)])
+
+    def test_put_many(self):
+        def respond(method, path, body):
+            return (404, {}) if path.endswith('/3/') else (200, {})
+
+        server, url = self.start_server(respond)
+        atdb = atdb_interface.ATDB(url)
+        values = [(id, status) for status in ('processing', 'valid') for id in range(1, 5)]
+        results = atdb.do_PUT_MANY(key='dataproducts:new_status', values=values, max_workers=4)
+
+        self.assertEqual([item for item, result, error in results], values)
+        self.assertEqual([id for (id, status), result, error in results if error], [3, 3])
+
+        # the PUTs to the same object are done in the order of the values
+        for id in range(1, 5):
+            self.assertEqual([json.loads(body) for method, path, body in server.requests
+                              if path == '/atdb/dataproducts/' + str(id) + '/'],
+                             [{'new_status': 'processing'}, {'new_status': 'valid'}])
+
+    def test_post_many(self):
+        lock = threading.Lock()
+        created = []
+
+        def respond(method, path, body):
+            filename = json.loads(body)['filename']
+            if filename == 'invalid':
+                return 400, {'size': ['A valid integer is required.']}
+            with lock:
+                created.append(filename)
+                return 201, {'id': 100 + len(created)}
+
+        server, url = self.start_server(respond)
+        atdb = atdb_interface.ATDB(url)
+        filenames = ['B000.MS', 'invalid', 'B001.MS', 'B002.MS']
+        results = atdb.do_POST_MANY('dataproducts', ['{filename:' + filename + '}' for filename in filenames])
+
+        # the ids in the order of the payloads, whatever the order in which the objects were created
+        ids = [id for payload, id, error in results]
+        self.assertEqual(ids[1], None)
+        self.assertIn('400', results[1][2])
+        self.assertEqual([created[id - 101] for id in ids if id], [filenames[0]] + filenames[2:])
+
+
+@unittest.skipIf(atdb_async.aiohttp is None, 'the asyncio client needs aiohttp')
+class AsyncTest(StandInTestCase):
+    """
+    The asyncio client does the same requests as the ATDB class, with many of them in flight at the same time.
+    """
+
+    def run_client(self, url, function, **kwargs):
+        """
+        Run function(client) in a new event loop, with a client of the stand-in backend.
+        """
+        async def main():
+            async with atdb_async.AsyncATDB(url, **kwargs) as atdb:
+                return await function(atdb)
+
+        return asyncio.run(main())
+
+    def test_get_list(self):
+        def respond(method, path, body):
+            # 5 dataproducts, in pages of 2
+            page = int(path.split('page=')[1]) if 'page=' in path else 1
+            results = [{'id': id} for id in range(1, 6)][(page - 1) * 2:page * 2]
+            next = url + 'dataproducts/?my_status=valid&page_size=2&fields=id&page=' + str(page + 1) if page < 3 else None
+            return 200, {'next': next, 'results': results}
+
+        server, url = self.start_server(respond)
+
+        async def get_list(atdb):
+            return [id async for id in atdb.do_GET_LIST(key='dataproducts:id', query='my_status=valid', page_size=2)]
+
+        self.assertEqual(self.run_client(url, get_list), [1, 2, 3, 4, 5])
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(server.requests[0][1], '/atdb/dataproducts/?my_status=valid&page_size=2&fields=id')
+
+    def test_taskid(self):
+        def respond(method, path, body):
+            if path.startswith('/atdb/dataproducts/?'):
+                return 200, {'next': None, 'results': [{'id': 7}, {'id': 8}]}
+            return 200, {'id': 7, 'my_status': 'valid'}
+
+        server, url = self.start_server(respond)
+
+        async def requests(atdb):
+            return (await atdb.do_GET(key='dataproducts:my_status', taskid='1'),
+                    await atdb.do_PUT(key='dataproducts:new_status', taskid='1', value='valid'),
+                    await atdb.do_PUT(key='dataproducts:new_status', taskid='1', value='valid', all_of_taskid=True),
+                    await atdb.do_PUT(key='observations:new_status', taskid='1', value='valid'))
+
+        self.assertEqual(self.run_client(url, requests), ('valid', 200, 200, 200))
+
+        # a taskid addresses the first dataproduct, unless all the dataproducts of the taskid are asked for
+        self.assertEqual([(method, path.split('?')[0]) for method, path, body in server.requests],
+                         [('GET', '/atdb/dataproducts/'), ('GET', '/atdb/dataproducts/7/'),
+                          ('GET', '/atdb/dataproducts/'), ('PUT', '/atdb/dataproducts/7/'),
+                          ('PUT', '/atdb/dataproducts/taskid/1/'), ('PUT', '/atdb/observations/taskid/1/')])
+        self.assertEqual(json.loads(server.requests[3][2]), {'new_status': 'valid'})
+
+    def test_post_and_delete(self):
+        def respond(method, path, body):
+            if method == 'POST':
+                return 201, {'id': 12, 'filename': json.loads(body)['filename']}
+            return 204 if path.endswith('/12/') or '/range/' in path else 404, {}
+
+        server, url = self.start_server(respond)
+
+        async def requests(atdb):
+            id = await atdb.do_POST('dataproducts', '{filename:B000.MS,new_status:defined}')
+            return id, await atdb.do_DELETE('dataproducts', id), await atdb.do_DELETE('dataproducts', '10..11')
+
+        self.assertEqual(self.run_client(url, requests), (12, 204, 204))
+        self.assertEqual([path for method, path, body in server.requests],
+                         ['/atdb/dataproducts/', '/atdb/dataproducts/12/', '/atdb/dataproducts/range/10/11/'])
+
+        async def delete(atdb):
+            await atdb.do_DELETE('dataproducts', 13)
+
+        with self.assertRaises(atdb_interface.ATDBException):
+            self.run_client(url, delete)
+
+    def test_retry(self):
+        def respond(method, path, body):
+            return (503, {}) if len(server.requests) <= 2 else (200, {'id': 1, 'my_status': 'valid'})
+
+        server, url = self.start_server(respond)
+        delays = []
+
+        async def sleep(delay):
+            delays.append(delay)
+
+        async def get(atdb):
+            return await atdb.do_GET(key='observations:my_status', id=1)
+
+        with mock.patch('asyncio.sleep', sleep):
+            self.assertEqual(self.run_client(url, get), 'valid')
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(delays, [atdb_interface.DEFAULT_BACKOFF, atdb_interface.DEFAULT_BACKOFF * 2])
+
+        # a POST is not retried, and the retries of a GET are limited
+        async def post(atdb):
+            return await atdb.do_POST('observations', '{taskID:1}')
+
+        del server.requests[:]
+        with mock.patch('asyncio.sleep', sleep), self.assertRaises(atdb_interface.ATDBException):
+            self.run_client(url, post)
+        self.assertEqual(len(server.requests), 1)
+
+        del server.requests[:]
+        with mock.patch('asyncio.sleep', sleep), self.assertRaises(atdb_interface.ATDBException):
+            self.run_client(url, get, retries=1)
+        self.assertEqual(len(server.requests), 2)
+
+    def test_concurrency(self):
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def respond(method, path, body):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return 200, {'id': int(path.split('/')[-2]), 'my_status': 'valid'}
+
+        server, url = self.start_server(respond)
+
+        async def get_many(atdb):
+            return await asyncio.gather(*[atdb.do_GET(key='dataproducts:id', id=id) for id in range(12)])
+
+        # the results are in the order of the requests
+        self.assertEqual(self.run_client(url, get_many, concurrency=4), list(range(12)))
+        self.assertEqual(running[1], 4)
+
+
+class NaturalKeyCacheTest(StandInTestCase):
+    """
+    The cache keeps the ids of the most recently used keys for 'ttl' seconds, also between runs.
+    """
+
+    def at(self, timestamp):
+        """
+        Set the clock of the cache.
+        """
+        return mock.patch('atdb_interface.datetime', **{'now.return_value.timestamp.return_value': timestamp})
+
+    def test_lru(self):
+        cache = atdb_interface.NaturalKeyCache(max_size=3)
+        for id in range(1, 4):
+            cache.put('dataproducts', 'filename', 'B00' + str(id) + '.MS', id)
+
+        # using a key makes it the most recently used, the least recently used key is evicted
+        self.assertEqual(cache.get('dataproducts', 'filename', 'B001.MS'), 1)
+        cache.put('dataproducts', 'filename', 'B004.MS', 4)
+        self.assertEqual([cache.get('dataproducts', 'filename', 'B00' + str(id) + '.MS') for id in range(1, 5)],
+                         [1, None, 3, 4])
+        self.assertEqual((cache.hits, cache.misses), (4, 1))
+
+        # the values are compared as strings, a taskID can be given as a number
+        cache.put('observations', 'taskID', 180223003, 5)
+        self.assertEqual(cache.get('observations', 'taskID', '180223003'), 5)
+        self.assertEqual(len(cache.entries), 3)
+
+    def test_ttl(self):
+        cache = atdb_interface.NaturalKeyCache(ttl=60)
+        with self.at(1000):
+            cache.put('observations', 'taskID', '1', 5)
+        with self.at(1060):
+            self.assertEqual(cache.get('observations', 'taskID', '1'), 5)
+        with self.at(1061):
+            self.assertEqual(cache.get('observations', 'taskID', '1'), None)
+
+        # an expired key is removed
+        self.assertEqual(len(cache.entries), 0)
+
+    def test_file(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        filename = os.path.join(directory.name, 'cache.json')
+
+        cache = atdb_interface.NaturalKeyCache(ttl=60, filename=filename)
+        with self.at(1000):
+            cache.put('observations', 'taskID', '1', 5)
+        with self.at(1030):
+            cache.put('dataproducts', 'filename', 'B000.MS', 6)
+        cache.save()
+        self.assertEqual(os.listdir(directory.name), ['cache.json'])
+
+        # the keys that have expired in between are not loaded
+        with self.at(1061):
+            cache = atdb_interface.NaturalKeyCache(ttl=60, filename=filename)
+            self.assertEqual(cache.get('observations', 'taskID', '1'), None)
+            self.assertEqual(cache.get('dataproducts', 'filename', 'B000.MS'), 6)
+
+        # a damaged file gives an empty cache, which is rebuilt while it is used
+        with open(filename, 'w') as file:
+            file.write('[["observations", "taskID"')
+        self.assertEqual(len(atdb_interface.NaturalKeyCache(filename=filename).entries), 0)
+
+        # a cache without a file is not saved
+        atdb_interface.NaturalKeyCache().save()
+        self.assertEqual(os.listdir(directory.name), ['cache.json'])
+
+    def test_invalidate(self):
+        cache = atdb_interface.NaturalKeyCache()
+
+        def fill():
+            cache.put('observations', 'taskID', '1', 1)
+            cache.put('dataproducts', 'filename', 'B000.MS', 2)
+            cache.put('dataproducts', 'name', 'B000.MS', 2)
+            cache.put('dataproducts', 'filename', 'B001.MS', 3)
+
+        def keys():
+            return sorted(key[0] + ':' + key[1] + '=' + key[2] for key in cache.entries)
+
+        fill()
+        cache.invalidate('dataproducts', ids=['2'])
+        self.assertEqual(keys(), ['dataproducts:filename=B001.MS', 'observations:taskID=1'])
+
+        fill()
+        cache.invalidate('dataproducts', field='filename', value='B000.MS')
+        self.assertEqual(keys(), ['dataproducts:filename=B001.MS', 'dataproducts:name=B000.MS',
+                                  'observations:taskID=1'])
+
+        fill()
+        cache.invalidate('dataproducts')
+        self.assertEqual(keys(), ['observations:taskID=1'])
+
+    def test_not_found(self):
+        # the backend has deleted the observation with id 5
+        def respond(method, path, body):
+            if method == 'GET':
+                return 200, {'next': None, 'results': [{'id': 5}]}
+            return 404, {}
+
+        server, url = self.start_server(respond)
+        atdb = atdb_interface.ATDB(url, cache=atdb_interface.NaturalKeyCache())
+
+        # the id is looked up once
+        self.assertEqual(atdb.GET_TaskObjectByTaskId('observations', '1'), {'id': 5})
+        self.assertEqual(atdb.GET_TaskObjectByTaskId('observations', '1'), {'id': 5})
+        self.assertEqual(len(server.requests), 1)
+
+        # a 404 removes it from the cache
+        with self.assertRaises(atdb_interface.ATDBException):
+            atdb.do_PUT(key='observations:new_status', id=5, value='valid', taskid=None)
+        self.assertEqual(atdb.cache.get('observations', 'taskID', '1'), None)
+
+
+class DataMonitorTest(StandInTestCase):
+    """
+    The data monitor keeps an index of the scanned directories, and only reports the new or changed files to ATDB.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.data_dir = os.path.join(directory.name, 'data')
+        os.mkdir(self.data_dir)
+        self.state = os.path.join(directory.name, 'state.json')
+
+        # the objects in the stand-in backend, (resource, field, value) => id
+        self.objects = {}
+        self.failing = set()
+        self.server, self.url = self.start_server(self.respond)
+
+    def respond(self, method, path, body):
+        resource = path.split('/')[2]
+        if path.endswith('/resolve'):
+            query = json.loads(body)
+            return 200, {'key': query['key'], 'ids': {value: self.objects[(resource, query['key'], value)]
+                                                      for value in query['values']
+                                                      if (resource, query['key'], value) in self.objects}}
+        if method == 'POST':
+            payloads = json.loads(body)
+            ids = []
+            for payload in payloads if isinstance(payloads, list) else [payloads]:
+                if payload.get('filename') in self.failing:
+                    return 500, {}
+                field = 'filename' if resource == 'dataproducts' else 'taskID'
+                ids.append(len(self.objects) + 1)
+                self.objects[(resource, field, payload[field])] = ids[-1]
+            return 201, {'ids': ids} if isinstance(payloads, list) else {'id': ids[0]}
+        return 200, {}
+
+    def write(self, name, data='data', age=3600):
+        """
+        Write a file, with an mtime 'age' seconds ago. The directory gets the same mtime.
+        """
+        path = os.path.join(self.data_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            file.write(data)
+        self.age(name, age)
+        self.age(os.path.dirname(name), age)
+
+    def age(self, name, age=3600):
+        mtime = int((time.time() - age) * 1e9)
+        os.utime(os.path.join(self.data_dir, name), ns=(mtime, mtime))
+
+    def scan(self):
+        """
+        Run the data monitor, with the index of the previous run.
+        :return: the requests to the backend, and the index
+        """
+        del self.server.requests[:]
+
+        # the data monitor does not use ALTA
+        with mock.patch('alta_interface.ALTA'):
+            service = atdb_service.ATDBService(self.url, 'dev', 'user', 'password', scan_state=self.state)
+        service.service_data_monitor(self.data_dir)
+        return [(method, path) for method, path, body in self.server.requests], atdb_service.ScanIndex(self.state)
+
+    def test_index(self):
+        index = atdb_service.ScanIndex(self.state)
+        self.assertEqual(index.dirs, {})
+        index.dirs['WSRTA1'] = {'inode': 10, 'mtime': 20, 'id': 1, 'files': {'B000.FITS': {}}}
+        index.save()
+
+        index = atdb_service.ScanIndex(self.state)
+        self.assertEqual(str(index), 'scan index: 1 directories, 1 files')
+        self.assertTrue(index.is_unchanged('WSRTA1', mock.Mock(st_ino=10, st_mtime_ns=20)))
+        self.assertFalse(index.is_unchanged('WSRTA1', mock.Mock(st_ino=10, st_mtime_ns=21)))
+        self.assertFalse(index.is_unchanged('WSRTA1', mock.Mock(st_ino=11, st_mtime_ns=20)))
+        self.assertFalse(index.is_unchanged('WSRTA2', mock.Mock(st_ino=10, st_mtime_ns=20)))
+
+        # a damaged index gives a full scan
+        with open(self.state, 'w') as file:
+            file.write('{"WSRTA1": {"inode"')
+        self.assertEqual(atdb_service.ScanIndex(self.state).dirs, {})
+
+    def test_rescan(self):
+        self.write('WSRTA1/B000.FITS')
+        self.write('WSRTA1/B001.FITS')
+        self.write('WSRTA1/notes.txt')
+        requests, index = self.scan()
+        self.assertEqual(sorted(requests), [('POST', '/atdb/dataproducts/'), ('POST', '/atdb/dataproducts/'),
+                                            ('POST', '/atdb/dataproducts/resolve'), ('POST', '/atdb/observations/'),
+                                            ('POST', '/atdb/observations/resolve')])
+        self.assertEqual(index.dirs['WSRTA1']['id'], self.objects[('observations', 'taskID', '1')])
+        self.assertEqual({name: known['id'] for name, known in index.dirs['WSRTA1']['files'].items()},
+                         {'B000.FITS': self.objects[('dataproducts', 'filename', 'B000.FITS')],
+                          'B001.FITS': self.objects[('dataproducts', 'filename', 'B001.FITS')]})
+
+        # nothing has changed, nothing is asked or reported
+        self.assertEqual(self.scan()[0], [])
+
+        # a new file, and a changed file, are reported
+        self.write('WSRTA1/B001.FITS', 'more data')
+        self.write('WSRTA1/B002.FITS')
+        requests, index = self.scan()
+        changed = '/atdb/dataproducts/' + str(index.dirs['WSRTA1']['files']['B001.FITS']['id']) + '/'
+        self.assertEqual(sorted(requests), [('POST', '/atdb/dataproducts/'), ('POST', '/atdb/dataproducts/resolve'),
+                                            ('PUT', changed)])
+        self.assertEqual(index.dirs['WSRTA1']['files']['B001.FITS']['size'], 9)
+        self.assertEqual(len(self.objects), 4)
+
+        # a file that is registered by another monitor is only looked up
+        self.objects[('dataproducts', 'filename', 'B003.FITS')] = 10
+        self.write('WSRTA1/B003.FITS')
+        requests, index = self.scan()
+        self.assertEqual(requests, [('POST', '/atdb/dataproducts/resolve')])
+        self.assertEqual(index.dirs['WSRTA1']['files']['B003.FITS']['id'], 10)
+
+        # a removed directory is forgotten
+        shutil.rmtree(os.path.join(self.data_dir, 'WSRTA1'))
+        self.assertEqual(self.scan()[1].dirs, {})
+
+    def test_recent(self):
+        # a directory with a file that is still being written is scanned again, until its files are stable
+        self.write('WSRTA1/B000.FITS', age=0)
+        requests, index = self.scan()
+        self.assertEqual(index.dirs['WSRTA1']['mtime'], None)
+        self.assertEqual(len(self.objects), 2)
+
+        self.write('WSRTA1/B000.FITS', 'more data')
+        requests, index = self.scan()
+        self.assertEqual(len(requests), 1)
+        self.assertIsNotNone(index.dirs['WSRTA1']['mtime'])
+        self.assertEqual(self.scan()[0], [])
+
+    def test_failed_post(self):
+        # a dataproduct that could not be registered is registered in the next scan
+        self.failing.add('B001.FITS')
+        self.write('WSRTA1/B000.FITS')
+        self.write('WSRTA1/B001.FITS')
+        with mock.patch('sys.stdout'):
+            index = self.scan()[1]
+        self.assertEqual(list(index.dirs['WSRTA1']['files']), ['B000.FITS'])
+        self.assertEqual(index.dirs['WSRTA1']['mtime'], None)
+
+        self.failing.clear()
+        requests, index = self.scan()
+        self.assertEqual(requests, [('POST', '/atdb/dataproducts/resolve'), ('POST', '/atdb/dataproducts/')])
+        self.assertEqual(sorted(index.dirs['WSRTA1']['files']), ['B000.FITS', 'B001.FITS'])
+        self.assertEqual(len(self.objects), 3)
+
+    def test_removed_during_scan(self):
+        self.write('WSRTA1/B000.FITS')
+        self.write('WSRTA1/B001.FITS')
+        self.write('WSRTA2/B000.FITS')
+
+        # the files and directories are removed after they are listed, but before their stat
+        def scandir(path):
+            entries = list(os.scandir(path))
+            if path == self.data_dir:
+                shutil.rmtree(os.path.join(self.data_dir, 'WSRTA2'))
+            else:
+                os.remove(os.path.join(path, 'B001.FITS'))
+            return entries
+
+        with mock.patch('atdb_service.scandir', scandir):
+            index = self.scan()[1]
+        self.assertEqual(list(index.dirs), ['WSRTA1'])
+        self.assertEqual(list(index.dirs['WSRTA1']['files']), ['B000.FITS'])
+
+
+if __name__ == '__main__':
+    unittest.main()